@@ -0,0 +1,135 @@
+"""
+Summary statistics for a field, computed with numpy on dictionary encoded values (my_utils.categorical).
+
+These are the numbers behind the field_report figures:
+- histogram of the number of values per item
+- histogram of the values for numeric fields
+- top values and their counts for everything else
+
+compute_field_stats returns a plain dict, that can be written as json with write_json,
+or drawn with investigate_variants.plot_field_stats.
+"""
+
+import json
+
+import numpy as np
+
+from my_utils import categorical
+
+
+N_TOP_THRESHOLD = 20 # if there are more unique values than this, only keep the top N_TOP
+N_TOP = 14
+N_BINS_FLOAT = 50
+
+
+def length_histogram(pervar_len):
+    '''
+    pervar_len is the number of values per item.
+    one bin per length, from 0 to max length.
+    '''
+    counts = np.bincount(pervar_len, minlength=1)
+    edges = np.arange(len(counts) + 1) - 0.5
+    return {"counts": counts, "edges": edges}
+
+
+def int_histogram(values):
+    '''
+    bins of width 2^k, at most ~128 bins, centered on multiples of the bin size.
+    '''
+    val_min = values.min()
+    val_max = values.max()
+    binsize = np.power(2, np.max([0, np.ceil(np.log2(val_max - val_min+1))-7]))
+    bin_min = (round(np.round(val_min/binsize))-0.5)*binsize
+    bin_max = (round(np.round(val_max/binsize))+0.5)*binsize
+    nbins = round((bin_max-bin_min)/binsize)
+    ibin = np.floor((values - bin_min)/binsize).astype(int)
+    # the last bin includes its right edge
+    ibin = np.minimum(ibin, nbins - 1)
+    counts = np.bincount(ibin, minlength=nbins)
+    edges = bin_min + binsize*np.arange(nbins + 1)
+    return {"counts": counts, "edges": edges}
+
+
+def float_histogram(values, nbins=N_BINS_FLOAT):
+    '''
+    nbins equal bins between min and max value.
+    '''
+    counts, edges = np.histogram(values, nbins)
+    return {"counts": counts, "edges": edges}
+
+
+def top_values(values, codes=None, dictionary=None):
+    '''
+    values sorted by decreasing count, ties in the order of the dictionary.
+    if the values are already dictionary encoded (codes, dictionary), they are used as is,
+    see my_utils.categorical.
+    only the top N_TOP are kept when there are more than N_TOP_THRESHOLD unique values.
+    '''
+    if codes is None:
+        dictionary, codes = np.unique(values, return_inverse=True)
+    counts = np.bincount(codes.ravel(), minlength=len(dictionary))
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(-counts[present], kind="stable")]
+    if len(order) > N_TOP_THRESHOLD:
+        order = order[0:N_TOP]
+    return {"values": np.asarray(dictionary)[order], "counts": counts[order]}
+
+
+def compute_field_stats(pervar_values, values, field, item_type):
+    '''
+    pervar_values: values per item, as from investigate_variants.get_values_pervar
+    values: all values collapsed, as from investigate_variants.get_values_all
+    '''
+    pervar_len = np.array([len(val) for val in pervar_values], dtype=int)
+    if values.dtype.name == "bool":
+        values = values.astype("str")
+    codes, dictionary = categorical.encode(values)
+
+    stats = {
+        "field": field,
+        "item_type": item_type,
+        "n_items": len(pervar_len),
+        "n_with_value": int(np.count_nonzero(pervar_len)),
+        "n_values": len(values),
+        "n_unique": categorical.n_unique(codes, dictionary),
+        "length_hist": length_histogram(pervar_len),
+        "value_kind": None,
+        "value_hist": None,
+        "top": None
+    }
+    if len(values) == 0:
+        return stats
+
+    if values.dtype.name == "float64":
+        stats["value_kind"] = "float"
+        stats["value_hist"] = float_histogram(values)
+    elif values.dtype.name == "int64":
+        stats["value_kind"] = "int"
+        stats["value_hist"] = int_histogram(values)
+    else:
+        stats["value_kind"] = "string"
+        stats["top"] = top_values(values, *categorical.sort_dictionary(codes, dictionary))
+    return stats
+
+
+def to_jsonable(stats):
+    '''
+    numpy arrays and scalars in stats turned into lists and python scalars.
+    '''
+    if isinstance(stats, dict):
+        return {key: to_jsonable(val) for key, val in stats.items()}
+    if isinstance(stats, (list, tuple)):
+        return [to_jsonable(val) for val in stats]
+    if isinstance(stats, np.ndarray):
+        return stats.tolist()
+    if isinstance(stats, np.generic):
+        return stats.item()
+    return stats
+
+
+def write_json(stats, fname):
+    '''
+    write stats (a dict, or a list of them) to fname as json.
+    '''
+    with open(fname, "w") as outf:
+        json.dump(to_jsonable(stats), outf, indent=1)
@@ -0,0 +1,199 @@
+"""
+Index from gene to variant records for a cached variants json file,
+e.g. "<DATA_DIR>/variants_NA12879.json", from the genes embedded in each variant.
+
+The index is a set of numpy arrays, one entry per (gene, variant record), grouped by gene:
+    genes:            gene identifiers (genes_ensg.display_title), sorted
+    gene_offsets:     entries of genes[i] are at [gene_offsets[i], gene_offsets[i+1])
+    record:           offset of the entry's record in the cached json list
+    consequence_code: index in consequences of the gene's most severe consequence for the record
+    impact_code:      index in impacts of its impact
+It is saved next to the cache as "<cache>.genes.npz", and rebuilt whenever the size or mtime
+of the cache changes. On load, a dict from gene to its position in genes is added as "lookup".
+
+Per-gene aggregates are bincounts over the entries, grouped by gene code.
+"""
+
+from os import path, makedirs
+import sys
+
+import numpy as np
+import pandas as pd
+
+from my_utils import categorical, ndjson_shards, tracing
+import base
+
+sys.path.append(path.join(base.ROOT_DIR, "code", "inh_mode"))
+import trio_qc # pylint: disable=wrong-import-position
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+GENE_KEY = "genes_ensg"
+CONSEQUENCE_KEY = "genes_most_severe_consequence"
+
+
+def index_filename(filename_variant):
+    return filename_variant + ".genes.npz"
+
+
+def _display_title(value):
+    if isinstance(value, dict):
+        return value.get("display_title")
+    return value
+
+
+@tracing.traced()
+def build_index(filename_variant):
+    '''
+    read the cache once and build the index arrays.
+    '''
+    variants = ndjson_shards.read(filename_variant)
+
+    records = []
+    gene_ids = []
+    consequences = []
+    impacts = []
+    for irecord, variant in enumerate(variants):
+        seen = set()
+        for gene in variant.get("variant", {}).get("genes", []):
+            gene_id = _display_title(gene.get(GENE_KEY))
+            if gene_id is None or gene_id in seen:
+                continue
+            seen.add(gene_id)
+            consequence = gene.get(CONSEQUENCE_KEY) or {}
+            records.append(irecord)
+            gene_ids.append(gene_id)
+            consequences.append(consequence.get("display_title"))
+            impacts.append(consequence.get("impact"))
+
+    gene_codes, genes = categorical.sort_dictionary(*categorical.encode(gene_ids))
+    consequence_codes, consequence_dictionary = categorical.sort_dictionary(
+        *categorical.encode(consequences))
+    impact_codes, impact_dictionary = categorical.sort_dictionary(*categorical.encode(impacts))
+
+    order = np.argsort(gene_codes, kind="stable")
+    gene_offsets = np.searchsorted(gene_codes[order], np.arange(len(genes) + 1))
+
+    stat = ndjson_shards.source_stat(filename_variant)
+    return {
+        "genes": np.array(genes, dtype=str),
+        "gene_offsets": gene_offsets,
+        "record": np.array(records, dtype=np.int64)[order],
+        "consequence_code": consequence_codes[order],
+        "consequences": np.array(consequence_dictionary, dtype=str),
+        "impact_code": impact_codes[order],
+        "impacts": np.array(impact_dictionary, dtype=str),
+        "n_records": np.array(len(variants)),
+        "source": np.array(stat, dtype=float)
+    }
+
+
+def load_index(filename_variant, rebuild=False):
+    '''
+    load the index for filename_variant, building (and saving) it if it is missing or stale.
+    '''
+    filename_index = index_filename(filename_variant)
+    stat = np.array(ndjson_shards.source_stat(filename_variant), dtype=float)
+    index = None
+    if not rebuild and path.exists(filename_index):
+        with np.load(filename_index, allow_pickle=False) as stored:
+            index = dict(stored)
+        if not np.array_equal(index["source"], stat):
+            index = None
+    if index is None:
+        print("building gene index %s" % filename_index)
+        index = build_index(filename_variant)
+        np.savez(filename_index, **index)
+    index["lookup"] = {gene: igene for igene, gene in enumerate(index["genes"])}
+    return index
+
+
+def records_for_gene(index, gene):
+    '''
+    offsets in the cached json list of the records with gene, in record order.
+    '''
+    igene = index["lookup"].get(gene)
+    if igene is None:
+        return np.array([], dtype=np.int64)
+    return index["record"][index["gene_offsets"][igene]:index["gene_offsets"][igene + 1]]
+
+
+def entry_gene_codes(index):
+    '''
+    gene code of every entry, from gene_offsets.
+    '''
+    return np.repeat(np.arange(len(index["genes"])), np.diff(index["gene_offsets"]))
+
+
+def genes_with(index, consequences=None, impacts=None, records=None):
+    '''
+    genes with at least one variant record matching all given filters:
+    most severe consequence in consequences, impact in impacts, record offset in records.
+    '''
+    keep = np.ones(len(index["record"]), dtype=bool)
+    if consequences is not None:
+        keep &= np.isin(index["consequences"], list(consequences))[index["consequence_code"]]
+    if impacts is not None:
+        keep &= np.isin(index["impacts"], list(impacts))[index["impact_code"]]
+    if records is not None:
+        keep &= np.isin(index["record"], np.asarray(records))
+    return index["genes"][np.unique(entry_gene_codes(index)[keep])]
+
+
+def _counts(gene_codes, n_genes, codes, dictionary, prefix):
+    valid = codes >= 0
+    counts = np.bincount(gene_codes[valid]*len(dictionary) + codes[valid],
+                         minlength=n_genes*len(dictionary)).reshape(n_genes, len(dictionary))
+    return pd.DataFrame(counts, columns=["%s%s" % (prefix, value) for value in dictionary])
+
+
+@tracing.traced(count=len)
+def gene_report(index, mode_offsets=None, mode_codes=None, mode_dictionary=None):
+    '''
+    one row per gene: number of variants, and number of variants per most severe consequence,
+    impact and (if modes are given, see trio_qc.encode_trio) inheritance mode.
+    '''
+    n_genes = len(index["genes"])
+    gene_codes = entry_gene_codes(index)
+    tables = [
+        pd.DataFrame({"n_variants": np.diff(index["gene_offsets"])}),
+        _counts(gene_codes, n_genes, index["consequence_code"], index["consequences"],
+                "consequence: "),
+        _counts(gene_codes, n_genes, index["impact_code"], index["impacts"], "impact: ")
+    ]
+    if mode_offsets is not None:
+        # every entry gets the modes of its record
+        n_modes = np.diff(mode_offsets)[index["record"]]
+        first = np.repeat(mode_offsets[index["record"]] - np.cumsum(n_modes) + n_modes, n_modes)
+        entry_modes = mode_codes[first + np.arange(n_modes.sum())]
+        tables.append(_counts(np.repeat(gene_codes, n_modes), n_genes, entry_modes,
+                              mode_dictionary, "inheritance mode: "))
+    report = pd.concat(tables, axis=1)
+    report.index = pd.Index(index["genes"], name="gene")
+    return report.sort_values("n_variants", ascending=False, kind="stable")
+
+
+def gene_report_for_sample(sample="NA12879", report_dir=None, thresholds=None):
+    '''
+    gene report for the cached variants of sample, with inheritance modes of the trio,
+    written to "<report_dir>/genes_<sample>.tsv" (report_dir defaults to "<DATA_DIR>/report")
+    thresholds (e.g. quality_gate.THRESHOLDS) gate the calls as in
+    inheritance_mode_table.NA12879_table, by default there is no gate.
+    '''
+    filename_variant = path.join(DATA_DIR, "variants_%s.json" % sample)
+    index = load_index(filename_variant)
+    trio = trio_qc.encode_trio(ndjson_shards.read(filename_variant),
+                               thresholds=thresholds)
+    report = gene_report(index, trio["mode_offsets"], trio["mode_codes"], trio["mode_dictionary"])
+
+    if report_dir is None:
+        report_dir = path.join(DATA_DIR, "report")
+    makedirs(report_dir, exist_ok=True)
+    fname = path.join(report_dir, "genes_%s.tsv" % sample)
+    print("writing %s" % fname)
+    report.to_csv(fname, sep="\t")
+    return report
+
+
+if __name__ == '__main__':
+    gene_report_for_sample()
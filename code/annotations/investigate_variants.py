@@ -7,20 +7,24 @@ from os import path, makedirs, remove
 from urllib.parse import urlencode
 import re
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 from dcicutils import ff_utils, diff_utils 
-from my_utils import nested_keys
+from my_utils import categorical, ndjson_shards, nested_keys, tracing
 from my_utils.Rutils import unique
 from my_utils.pd_utils import print_full
 import base
+import field_stats
+import mapping_table_registry
+import report_html
+import snapshots
+import variant_index
 
 
 DATA_DIR = path.join(base.ROOT_DIR, "data")
-FNAME_MAPPING_TABLE_VARIANT = "VCF Mapping Table - v0.4.8 variant table.tsv"
-FNAME_MAPPING_TABLE_GENE = "VCF Mapping Table - GeneTable v0.4.6.tsv"
+FNAME_MAPPING_TABLE_VARIANT = mapping_table_registry.FNAME_MAPPING_TABLE_VARIANT
+FNAME_MAPPING_TABLE_GENE = mapping_table_registry.FNAME_MAPPING_TABLE_GENE
 
 KEYNAME = "cgaptest"
 VCF_FILE = "GAPFI2VBKGM7"
@@ -41,45 +45,62 @@ def search_result(params):
     return result
 
 
-def load_variants(sample="NA12879"):
+@tracing.traced(count=len)
+def load_variants(sample="NA12879", refresh=False):
     '''
     Search response for variants from VCF_FILE for <sample>
-    should be in "DATA_DIR/variants_<sample>.json"
+    should be in "DATA_DIR/variants_<sample>.json" (sharded, see my_utils.ndjson_shards)
 
-    If not, make it be.
+    If not, or if refresh is True, make it be,
+    and record it as a new version in snapshots "variants_<sample>".
+    A cache from before sharding is read as is, see ndjson_shards.migrate to shard it.
 
     and return response
     '''
     filename_variant = path.join(DATA_DIR, "variants_%s.json" % sample) #variants file name
-    if path.exists(filename_variant):
-        with open(filename_variant) as file_variant:
-            variants = json.load(file_variant)
+    if ndjson_shards.exists(filename_variant) and not refresh:
+        with tracing.span("json_load", fname=filename_variant):
+            variants = ndjson_shards.read(filename_variant)
     else:
         params = {"type": "VariantSample",
                   "file" : VCF_FILE}
         if sample != "all":
             params.update({"CALL_INFO" : '%s_sample' % sample})
         variants = search_result(params)
-        with open(filename_variant, "w") as file_variant:
-            json.dump(variants, file_variant)
+        ndjson_shards.write(variants, filename_variant)
+        snapshots.commit_snapshot("variants_%s" % sample, variants)
 
     return variants
 
 
-def load_genes():
+def load_variants_region(sample, region):
     '''
-    Search response for genes on cgapwolf should be in"DATA_DIR/genes.json"
-    If not, make it be.
+    Same as load_variants(sample), but only decode variants within region,
+    e.g. "chrX:1-2,700,000" or "chrY", ordered by position.
+    uses (and builds if needed) the index next to the cache, see variant_index.
+    '''
+    filename_variant = path.join(DATA_DIR, "variants_%s.json" % sample) #variants file name
+    if not ndjson_shards.exists(filename_variant):
+        load_variants(sample)
+    return variant_index.load_region(filename_variant, region)
+
+
+@tracing.traced(count=len)
+def load_genes(refresh=False):
+    '''
+    Search response for genes on cgapwolf should be in"DATA_DIR/genes.json" (sharded)
+    If not, or if refresh is True, make it be,
+    and record it as a new version in snapshots "genes".
     and return response
     '''
     filename_gene = path.join(DATA_DIR, "genes.json") #genes file name
-    if path.exists(filename_gene):
-        with open(filename_gene) as file_gene:
-            genes = json.load(file_gene)
+    if ndjson_shards.exists(filename_gene) and not refresh:
+        with tracing.span("json_load", fname=filename_gene):
+            genes = ndjson_shards.read(filename_gene)
     else:
         genes = search_result(params={"type": "Gene"})
-        with open(filename_gene, "w") as file_gene:
-            json.dump(genes, file_gene,indent=4)
+        ndjson_shards.write(genes, filename_gene)
+        snapshots.commit_snapshot("genes", genes)
 
     return genes
 
@@ -90,8 +111,8 @@ def get_values_pervar(search_results, field):
     and field = a1
     this function will return [[1,2],[3]]
     '''
-    return [nested_keys.get_field_by_nested_key(search_result, field)
-            for search_result in search_results]
+    accessor = nested_keys.compile_nested_key(field)
+    return [accessor(search_result) for search_result in search_results]
 
 
 def get_values_all(search_results, field):
@@ -100,120 +121,76 @@ def get_values_all(search_results, field):
     and field = a1
     this function will return [1,2,3]
     '''
-    return np.array(nested_keys.get_field_by_nested_key(search_results, field))
+    return np.array(nested_keys.compile_nested_key(field)(search_results))
+
+
+def get_values_categorical(search_results, field, dictionary=None):
+    '''
+    same values as get_values_all, dictionary encoded.
+    returns codes, dictionary; see my_utils.categorical.encode
+    '''
+    values = nested_keys.compile_nested_key(field)(search_results)
+    return categorical.encode(values, dictionary)
+
+
+def collect_examples(search_results, accessors, n_examples):
+    '''
+    accessors is {field: accessor}, e.g. from mapping_table_registry.get_accessors
+    walk search_results once, collecting the first n_examples non-empty values of every field,
+    and stop as soon as all fields have n_examples.
+    returns {field: [values of 1st example, values of 2nd example, ...]}
+    '''
+    examples = {field: [] for field in accessors}
+    pending = dict(accessors)
+    for search_result in search_results:
+        if len(pending) == 0:
+            break
+        for field, accessor in list(pending.items()):
+            val = accessor(search_result)
+            if len(val) == 0:
+                continue
+            examples[field].append(val)
+            if len(examples[field]) >= n_examples:
+                del pending[field]
+    return examples
 
 
-def field_report(search_results, field, image_path=None):
+@tracing.traced()
+def field_report(search_results, field, image_path=None, converter=None):
     '''
     search_results is a search response for variantsamples or genes
     field is field name in snovault format, e.g. variant.ID
     if image_path is provided, a graph will be generated.
-    returns a dict summary report.
+    if converter is provided (see mapping_table_registry.get_converters), the values are
+    cast to the field_type of the field, unless some of them cannot be.
+    returns a dict summary report, the underlying field_stats are under "stats".
     '''
     item_type = "variant" if "variant" in search_results[0].keys() else "gene"
 
-    # How many search_results have how many entries for field.
-    pervar_values = get_values_pervar(search_results, field)
-    nvars = len(pervar_values)
-    pervar_len = np.array([len(val) for val in pervar_values])
-    pervar_lenmax = np.max(pervar_len)
-    n_withvalue = np.count_nonzero(pervar_len)
-
-    # If we collapse all search_results, how many entries are there? how many unique values.
-    values = get_values_all(search_results, field)
-    if values.dtype.name == "bool":
-        values = values.astype("str")
-    n_values = len(values)
-    n_values_unique = len(set(values))
-    subtext2 = "%d values for %d %ss" % (n_values, n_withvalue, item_type)
+    with tracing.span("get_values", field=field) as span:
+        pervar_values = get_values_pervar(search_results, field)
+        values = get_values_all(search_results, field)
+        if converter is not None:
+            values = mapping_table_registry.convert_values(values, converter)
+        span.set(n_items=len(pervar_values), n_values=len(values))
+    with tracing.span("compute_field_stats", field=field):
+        stats = field_stats.compute_field_stats(pervar_values, values, field, item_type)
 
     stat_res_with_value_field = "%ss with Value" % item_type
 
-    if n_values == 0:
+    if stats["n_values"] == 0:
         return {
             stat_res_with_value_field: 0,
             "Number of Values": 0,
             "Number of Unique Values": 0,
             "Example1": [],
-            "Example2": []
+            "Example2": [],
+            "stats": stats
         }
 
-    #create summary statistics plot
     if image_path is not None:
         print("creating image for field: %s" % field)
-
-        fig = plt.figure(figsize=(8, 10))
-        fig.suptitle(field, fontsize=14, fontweight='bold')
-
-        marleft = 0.1
-        marright = 0.05
-        marglobaltop = 0.05
-        martop = 0.05
-        marbottom = 0.05
-        marleftstring = 0.3
-
-        xsize = 1-marleft-marright
-        ysize = (1 - 2*marbottom - 2*martop - marglobaltop)/2
-        xsizestring = 1-marleftstring-marright
-
-        #plot distribution of n_withvalue
-        axes = plt.axes([marleft, 1-marglobaltop-martop-ysize, xsize, ysize])
-        axes.hist(pervar_len, pervar_lenmax+1, (-0.5, pervar_lenmax+0.5), log=True)
-        axes.set_title("Number of values per %s" % item_type)
-        subtext1 = "%d / %d %ss have the field filled." % (n_withvalue, nvars, item_type)
-        axes.text(0.01, 0.95, subtext1, transform=axes.transAxes)
-        axes.set_ylim([1, axes.get_ylim()[1]*1.2])
-        axes.set_xlabel('array length per %s' % item_type)
-        axes.set_ylabel('number of %ss' % item_type)
-
-        #plot distribution of value itself
-        numeric = values.dtype.name == "float64" or values.dtype.name == "int64"
-
-        if numeric:
-            axes = plt.axes([marleft, marbottom, xsize, ysize])
-            if values.dtype.name == "float64":
-                axes.hist(values, 50, log=True)
-            elif values.dtype.name == "int64":
-                val_min = values.min()
-                val_max = values.max()
-                binsize = np.power(2, np.max([0, np.ceil(np.log2(val_max - val_min+1))-7]))
-                bin_min = (round(np.round(val_min/binsize))-0.5)*binsize
-                bin_max = (round(np.round(val_max/binsize))+0.5)*binsize
-                nbins = round((bin_max-bin_min)/binsize)
-                axes.hist(values, nbins, [bin_min, bin_max], log=True)
-
-            axes.set_title("Distribution of values")
-            axes.set_xlabel('field value')
-            axes.set_ylabel('number of %ss' % item_type)
-            axes.text(0.01, 0.95, subtext2, transform=axes.transAxes)
-            axes.set_ylim([axes.get_ylim()[0], axes.get_ylim()[1]*1.2])
-
-        else:
-            marleft = 0.3
-            axes = plt.axes([marleftstring, marbottom, xsizestring, ysize])
-
-            uvalues, counts = np.unique(values, return_counts=True)
-            counts_series = pd.Series(counts, uvalues)
-            counts_series = counts_series.sort_values(ascending=False)
-
-            axes.set_title('Distribution of values')
-            axes.set_xlabel('counts_series')
-            axes.text(0.01, 0.95, subtext2, transform=axes.transAxes)
-
-            if len(counts_series) > 20:
-                axes.set_title('Top 15 Value Examples')
-                axes.text(0.01, 0.90,
-                          "examples from %d unique values" % len(counts_series),
-                          transform=axes.transAxes)
-                counts_series = counts_series[0:14]
-
-            y_pos = np.arange(len(counts_series), 0, -1)
-            axes.barh(y_pos, counts_series, align='center', alpha=0.4)
-            plt.yticks(y_pos, counts_series.index)
-            axes.set_ylim(0, len(counts_series)+3)
-
-        fig.savefig(image_path)
-        plt.close()
+        plot_field_stats(stats, image_path)
 
     #gather some example values
     example1 = []
@@ -228,42 +205,94 @@ def field_report(search_results, field, image_path=None):
         break
 
     return {
-        stat_res_with_value_field: n_withvalue,
-        "Number of Values" : n_values,
-        "Number of Unique Values" : n_values_unique,
+        stat_res_with_value_field: stats["n_with_value"],
+        "Number of Values" : stats["n_values"],
+        "Number of Unique Values" : stats["n_unique"],
         "Example1" : example1,
-        "Example2" : example2
+        "Example2" : example2,
+        "stats": stats
     }
 
 
+@tracing.traced()
+def plot_field_stats(stats, image_path):
+    '''
+    create summary statistics plot from field_stats.compute_field_stats
+    matplotlib is only imported here, so that stats can be computed without it.
+    '''
+    import matplotlib.pyplot as plt
+
+    item_type = stats["item_type"]
+    subtext2 = "%d values for %d %ss" % (stats["n_values"], stats["n_with_value"], item_type)
+
+    fig = plt.figure(figsize=(8, 10))
+    fig.suptitle(stats["field"], fontsize=14, fontweight='bold')
+
+    marleft = 0.1
+    marright = 0.05
+    marglobaltop = 0.05
+    martop = 0.05
+    marbottom = 0.05
+    marleftstring = 0.3
+
+    xsize = 1-marleft-marright
+    ysize = (1 - 2*marbottom - 2*martop - marglobaltop)/2
+    xsizestring = 1-marleftstring-marright
+
+    #plot distribution of n_withvalue
+    axes = plt.axes([marleft, 1-marglobaltop-martop-ysize, xsize, ysize])
+    hist = stats["length_hist"]
+    axes.hist(hist["edges"][:-1], hist["edges"], weights=hist["counts"], log=True)
+    axes.set_title("Number of values per %s" % item_type)
+    subtext1 = "%d / %d %ss have the field filled." % (stats["n_with_value"], stats["n_items"],
+                                                       item_type)
+    axes.text(0.01, 0.95, subtext1, transform=axes.transAxes)
+    axes.set_ylim([1, axes.get_ylim()[1]*1.2])
+    axes.set_xlabel('array length per %s' % item_type)
+    axes.set_ylabel('number of %ss' % item_type)
+
+    #plot distribution of value itself
+    if stats["value_hist"] is not None:
+        axes = plt.axes([marleft, marbottom, xsize, ysize])
+        hist = stats["value_hist"]
+        axes.hist(hist["edges"][:-1], hist["edges"], weights=hist["counts"], log=True)
+
+        axes.set_title("Distribution of values")
+        axes.set_xlabel('field value')
+        axes.set_ylabel('number of %ss' % item_type)
+        axes.text(0.01, 0.95, subtext2, transform=axes.transAxes)
+        axes.set_ylim([axes.get_ylim()[0], axes.get_ylim()[1]*1.2])
+
+    else:
+        axes = plt.axes([marleftstring, marbottom, xsizestring, ysize])
+        top = stats["top"]
+
+        axes.set_title('Distribution of values')
+        axes.set_xlabel('counts_series')
+        axes.text(0.01, 0.95, subtext2, transform=axes.transAxes)
+
+        if stats["n_unique"] > field_stats.N_TOP_THRESHOLD:
+            axes.set_title('Top 15 Value Examples')
+            axes.text(0.01, 0.90,
+                      "examples from %d unique values" % stats["n_unique"],
+                      transform=axes.transAxes)
+
+        y_pos = np.arange(len(top["counts"]), 0, -1)
+        axes.barh(y_pos, top["counts"], align='center', alpha=0.4)
+        plt.yticks(y_pos, top["values"])
+        axes.set_ylim(0, len(top["counts"])+3)
+
+    fig.savefig(image_path)
+    plt.close()
+
+
 def load_clean_mapping_table(fname_mapping_table, do_import_Y_only = True):
     """
     Load mapping table, sort by no, filter down to do_import=Y,
     Add field_name, and set it as index.
+    The table is parsed once, and cached in mapping_table_registry.
     """
-    map_table = pd.read_csv(path.join(DATA_DIR, fname_mapping_table), "\t", header=5)
-    if do_import_Y_only:
-        map_table = map_table[map_table["do_import"] == "Y"]
-    map_table.sort_values(by="no", inplace=True)
-
-    ## display_titles can appear twice, once because of link_to, once because they are already there.
-    ## mark them for removal.
-    map_table = map_table[~map_table["field_name"].str.endswith(".display_title")]
-    
-    addon3 = [".display_title"
-              if pd.notna(x) else ""
-              for x in map_table['links_to']]
-    addon2 = [json.loads(x)["key"] + "."
-              if pd.notna(x) else ""
-              for x in map_table['sub_embedding_group']]
-    addon1 = ["variant."
-              if x == "variant" else ""
-              for x in map_table["scope"]]
-    map_table["field_name"] = ["".join(x) for x in zip(addon1, addon2,
-                                                       list(map_table["field_name"]), addon3)]
-
-    map_table.set_index("field_name", inplace=True)
-    return map_table
+    return mapping_table_registry.load_mapping_table(fname_mapping_table, do_import_Y_only)
 
 
 def field_list_mapping_table(fname_mapping_table, fields=set()):
@@ -279,12 +308,22 @@ def field_list_mapping_table(fname_mapping_table, fields=set()):
     return fields_mapping_table
 
 
-def create_all_reports(search_results, fields):
+@tracing.traced()
+def create_all_reports(search_results, fields, render_images=True, report_dir=None,
+                       page_size=report_html.PAGE_SIZE, converters=None):
     """
     Gather stats about every field on variant or genes provided in search_result.
-    Create an html.
+    Create a paged html with a thumbnail per field (see report_html),
+    and a json with the stats behind the images.
+    If render_images is False, no images are created and matplotlib is never imported,
+    the thumbnails are still there.
+    report_dir defaults to "<DATA_DIR>/report"
+    converters is {field: converter}, see mapping_table_registry.get_converters and field_report.
     """
-    report_dir = path.join(DATA_DIR, "report")
+    if report_dir is None:
+        report_dir = path.join(DATA_DIR, "report")
+    if converters is None:
+        converters = {}
     image_dir = "images"
 
     image_dir_absolute = path.join(report_dir, image_dir)
@@ -298,36 +337,39 @@ def create_all_reports(search_results, fields):
         print(field)
         image_path_relative = path.join(image_dir, "summary.%s.%s.png" % (item_type, field))
         image_path_absolute = path.join(report_dir, image_path_relative)
-        if path.exists(image_path_absolute):
+        if path.exists(image_path_absolute) or not render_images:
             image_path_absolute = None
-        row = field_report(search_results, field, image_path=image_path_absolute)
-        row["Stats"] = ""
-        if row[stat_res_with_value_field] > 0:
-            row["Stats"] = '<a href = "%s">link</a>' % image_path_relative
+        row = field_report(search_results, field, image_path=image_path_absolute,
+                           converter=converters.get(field))
+        row["Stats"] = report_html.thumbnail(row["stats"])
+        if row[stat_res_with_value_field] > 0 and render_images:
+            row["Stats"] = '<a href="%s">%s link</a>' % (image_path_relative, row["Stats"])
         row["field"] = field
         stats.append(row)
 
+    with tracing.span("write_json"):
+        field_stats.write_json([row["stats"] for row in stats],
+                               path.join(report_dir, 'stats_%s.json' % item_type))
+
     column_order = ["field", stat_res_with_value_field,
                     "Number of Values",
                     "Number of Unique Values",
                     "Stats",
                     "Example1",
                     "Example2"]
-    stats_table = pd.DataFrame(stats, columns=column_order)
-
-    html = stats_table.to_html(render_links=True, escape=False, index=False)
-    with open(path.join(report_dir, 'table_%s.html' % item_type), 'w') as outf:
-        outf.write(html)
+    with tracing.span("write_html", n_items=len(stats)):
+        rows = [{column: row[column] if column == "Stats" else report_html.cell(row[column])
+                 for column in column_order} for row in stats]
+        report_html.write_pages(rows, column_order,
+                                path.join(report_dir, 'table_%s.html' % item_type),
+                                page_size=page_size, title="%s fields" % item_type)
 
 
 def delete_images_for_changed_fields(filename_old, filename_new, do_delete = False):
     differ = diff_utils.DiffManager()
 
-    with open(filename_old) as file_variant:
-        old = json.load(file_variant)
-
-    with open(filename_new) as file_variant:
-        new = json.load(file_variant)
+    old = ndjson_shards.read(filename_old)
+    new = ndjson_shards.read(filename_new)
 
     item_type = "variant" if "variant" in filename_new else "gene"
     print("comparing %s, %d from %s to %d from %s" % (item_type, len(old), filename_old, len(new), filename_new))
@@ -335,7 +377,30 @@ def delete_images_for_changed_fields(filename_old, filename_new, do_delete = Fal
     intermediate = unique([re.sub("\[(.*?)\]","",each_diff) for each_diff in comparison])
     intermediate = unique([re.sub(" :.*$","",each_diff) for each_diff in intermediate])
     fields = [re.sub("^.","",each_diff) for each_diff in intermediate]
+    delete_images_for_fields(fields, item_type, do_delete)
+
 
+def delete_images_for_snapshot_changes(name, item_type, do_delete=False,
+                                       version_old=None, version_new=None):
+    '''
+    delete images for fields that changed between two versions in snapshots <name>,
+    by default the last two.
+    '''
+    snapshot_versions = snapshots.versions(name)
+    if version_old is None or version_new is None:
+        if len(snapshot_versions) < 2:
+            print("less than 2 versions of %s in snapshots, nothing to compare" % name)
+            return
+        version_old, version_new = snapshot_versions[-2:]
+    print("comparing %s, version %d to version %d" % (name, version_old, version_new))
+    fields = snapshots.changed_fields(name, version_old, version_new)
+    delete_images_for_fields(fields, item_type, do_delete)
+
+
+def delete_images_for_fields(fields, item_type, do_delete=False):
+    '''
+    delete the summary images of fields, so that they are recreated by create_all_reports
+    '''
     report_dir = path.join(DATA_DIR, "report")
     image_dir = "images"
 
@@ -356,14 +421,15 @@ def delete_images_for_changed_fields(filename_old, filename_new, do_delete = Fal
             print("the image file is already absent: %s" % image_path_absolute)
 
 
-def create_links_report(search_results):
+@tracing.traced()
+def create_links_report(search_results, report_dir=None):
     """
     Gather links for fields with links.
     Create an html.
+    report_dir defaults to "<DATA_DIR>/report"
     """
-    def html_link_for_value(link_base, value):
-        link = link_base.replace("<ID>", value)
-        return '<a href="%s">%s</a>' % (link, value)
+    def html_link_for_value(link_template, value):
+        return '<a href="%s">%s</a>' % (link_template(value), value)
 
     item_type = "variant" if "variant" in search_results[0].keys() else "gene"
 
@@ -372,27 +438,22 @@ def create_links_report(search_results):
     else:
         fname_mapping_table = FNAME_MAPPING_TABLE_GENE
 
-    map_table = load_clean_mapping_table(fname_mapping_table)
-    map_table = map_table[pd.notnull(map_table["link"])]
-    fields = map_table.index
+    link_templates = mapping_table_registry.get_links(fname_mapping_table)
+    accessors = mapping_table_registry.get_accessors(fname_mapping_table)
 
     table_list = []
 
     n_examples = 5
     
-    for field in fields:
-        link_base = map_table.loc[field]["link"]
-        pervar_values = get_values_pervar(search_results, field)
-        examples = []
-        for val in pervar_values:
-            if len(val) == 0:
-                continue
-            examples.append(val)
-            if len(examples) >= n_examples:
-                break
+    examples_per_field = collect_examples(search_results, {field: accessors[field]
+                                                           for field in link_templates},
+                                          n_examples)
+
+    for field, link_template in link_templates.items():
+        examples = examples_per_field[field]
         links = []
         for example in examples:
-            links.append([html_link_for_value(link_base, value) for value in example])
+            links.append([html_link_for_value(link_template, value) for value in example])
         for i in range(len(links), n_examples):
             links.append([])
             
@@ -404,46 +465,66 @@ def create_links_report(search_results):
     table = pd.DataFrame(table_list)
     html = table.to_html(render_links=True, escape=False, index=False)
 
-    report_dir = path.join(DATA_DIR, "report")
+    if report_dir is None:
+        report_dir = path.join(DATA_DIR, "report")
     with open(path.join(report_dir, 'table_%s_link.html' % item_type), 'w') as outf:
         outf.write(html)
 
 
-def identify_fields_with_no_values():
+@tracing.traced()
+def identify_fields_with_no_values(search_results_per_type=None, output_dir=None):
     """
     For every field in mapping table, check which ones have no values at the moment.
     output an updated do_import column with Not_yet values for missing fields.
+    search_results_per_type, e.g. {"variant": variants, "gene": genes}, defaults to the cached
+    NA12879 variants and genes; output_dir defaults to DATA_DIR.
     """
+    if search_results_per_type is None:
+        search_results_per_type = {"variant": None, "gene": None}
+    if output_dir is None:
+        output_dir = DATA_DIR
 
-    for item_type in ["variant","gene"]:
+    for item_type, search_results in search_results_per_type.items():
         if item_type == "variant":
             sample = "NA12879"
-            search_results = load_variants(sample)
+            if search_results is None:
+                search_results = load_variants(sample)
             fname_mapping_table = FNAME_MAPPING_TABLE_VARIANT
         else:
-            search_results = load_genes()
+            if search_results is None:
+                search_results = load_genes()
             fname_mapping_table = FNAME_MAPPING_TABLE_GENE
 
         map_table = load_clean_mapping_table(fname_mapping_table, do_import_Y_only=False)
         map_table = map_table["do_import"]
+        accessors = mapping_table_registry.get_accessors(fname_mapping_table)
         for field in map_table.index:
             print(map_table.loc[field])
             if (map_table.loc[field]) != "Y":
                 continue
-            values = get_values_all(search_results, field)
+            values = accessors[field](search_results)
             if(len(values)==0):
                 map_table.loc[field] = "Not_yet"
 
-        fname_csv = path.join(DATA_DIR, "do_import_%s.csv" % item_type)
+        fname_csv = path.join(output_dir, "do_import_%s.csv" % item_type)
         print("writing %s" % fname_csv)
         map_table.to_csv(fname_csv)
 
 
-def sex_check():
+SEX_CHECK_REGIONS = ["chr20", "chrX", "chrY"] # chr20 is the autosomal baseline
+
+
+@tracing.traced()
+def sex_check(variants=None):
     '''
     check that the father has lower coverage on chrX and too many hets on chrX
+    prints, and returns, mean coverage per chrom and GT per chrom counts.
+    variants default to the NA12877 variants in SEX_CHECK_REGIONS, read through the index
+    (see load_variants_region), instead of the whole cache.
     '''
-    variants = load_variants("NA12877")
+    if variants is None:
+        variants = [variant for region in SEX_CHECK_REGIONS
+                    for variant in load_variants_region("NA12877", region)]
     chrom = get_values_all(variants, 'variant.CHROM')
     allele_depth = get_values_all(variants, 'samplegeno.samplegeno_ad')
     sample = get_values_all(variants, 'samplegeno.samplegeno_sampleid')
@@ -457,12 +538,15 @@ def sex_check():
     coverage.columns = samples
     coverage["chrom"] = chrom
 
-    print(coverage.groupby('chrom').mean())
+    coverage_mean = coverage.groupby('chrom').mean()
+    print(coverage_mean)
 
-    fields_chosen = ['AD_ALT', 'AD_REF', 'variant.CHROM', 'GT']
-    values = {field:get_values_all(variants, field) for field in fields_chosen}
-    dataframe = pd.DataFrame(values)
-    print_full(pd.crosstab(dataframe["GT"], dataframe["variant.CHROM"]))
+    codes_gt, dictionary_gt = get_values_categorical(variants, 'GT')
+    codes_chrom, dictionary_chrom = get_values_categorical(variants, 'variant.CHROM')
+    gt_per_chrom = categorical.crosstab(codes_gt, dictionary_gt, codes_chrom, dictionary_chrom,
+                                        "GT", "variant.CHROM")
+    print_full(gt_per_chrom)
+    return {"coverage_mean": coverage_mean, "gt_per_chrom": gt_per_chrom}
 
 
 def report_wrapper_variant():
@@ -474,7 +558,8 @@ def report_wrapper_variant():
     fields = nested_keys.nested_keys(variants)
 
     fields = field_list_mapping_table(FNAME_MAPPING_TABLE_VARIANT, fields)
-    create_all_reports(variants, fields)
+    create_all_reports(variants, fields,
+                       converters=mapping_table_registry.get_converters(FNAME_MAPPING_TABLE_VARIANT))
     create_links_report(variants)
 
 
@@ -486,19 +571,19 @@ def report_wrapper_gene():
     fields = nested_keys.nested_keys(genes)
 
     fields = field_list_mapping_table(FNAME_MAPPING_TABLE_GENE, fields)
-    create_all_reports(genes, fields)
+    create_all_reports(genes, fields,
+                       converters=mapping_table_registry.get_converters(FNAME_MAPPING_TABLE_GENE))
     create_links_report(genes)
 
 
 def delete_images_wrapper(do_delete=False):
+    '''
+    delete images for fields that changed between the last two snapshots.
+    (run load_variants/load_genes with refresh=True to record a new snapshot)
+    '''
     sample="NA12879"
-    filename_old = path.join(DATA_DIR, "variants_%s.json.bak" % sample)
-    filename_new = path.join(DATA_DIR, "variants_%s.json" % sample)
-    delete_images_for_changed_fields(filename_old, filename_new, do_delete)
-        
-    filename_old = path.join(DATA_DIR, "genes.json.bak")
-    filename_new = path.join(DATA_DIR, "genes.json")
-    delete_images_for_changed_fields(filename_old, filename_new, do_delete)
+    delete_images_for_snapshot_changes("variants_%s" % sample, "variant", do_delete)
+    delete_images_for_snapshot_changes("genes", "gene", do_delete)
 
 
 if __name__ == '__main__':
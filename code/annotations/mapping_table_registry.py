@@ -0,0 +1,228 @@
+"""
+Parse each mapping table once, and keep it around.
+
+The cache entry for a mapping table is invalidated when its mtime changes,
+unless its content hash is still the same.
+Next to the cleaned mapping table, each entry holds precompiled per-field
+- accessors: function(search_result) -> list of values, see nested_keys.compile_nested_key
+- converters: function(value) -> value cast to the field_type of the field
+- links: function(value) -> url, for fields with a link template
+"""
+
+from os import path
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from my_utils import nested_keys
+import base
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+FNAME_MAPPING_TABLE_VARIANT = "VCF Mapping Table - v0.4.8 variant table.tsv"
+FNAME_MAPPING_TABLE_GENE = "VCF Mapping Table - GeneTable v0.4.6.tsv"
+
+_REGISTRY = {}
+
+
+def to_bool(value):
+    '''
+    booleans may come as True/False, or as strings like "True", "Y", "1"
+    '''
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ["true", "y", "yes", "1"]
+
+
+def _is_number(value):
+    '''
+    True for ints and floats, python or numpy. booleans raise a ValueError,
+    they are not numbers for a mapping table field.
+    '''
+    if isinstance(value, (bool, np.bool_)):
+        raise ValueError("boolean %s is not a number" % value)
+    return isinstance(value, (int, float, np.integer, np.floating))
+
+
+def to_int(value):
+    '''
+    "12", "12.0" -> 12; "2.7" raises a ValueError instead of being truncated to 2.
+    numbers are kept as they are, so that 2.7 in an integer field still shows as 2.7.
+    '''
+    if _is_number(value):
+        return value
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError("%s is not an integer" % value)
+    return int(number)
+
+
+def to_number(value):
+    '''
+    "0.5" -> 0.5; numbers are kept as they are, integers stay integers.
+    '''
+    if _is_number(value):
+        return value
+    return float(value)
+
+
+CONVERTERS = {
+    "string": str,
+    "integer": to_int,
+    "number": to_number,
+    "boolean": to_bool
+}
+
+
+def convert_values(values, converter):
+    '''
+    numpy array of converter(value) for all values,
+    or values as they are if any of them cannot be converted (e.g. "." or 2.7 in an integer field),
+    so that a wrongly typed field shows up as such in the reports.
+    '''
+    try:
+        return np.array([converter(value) for value in values])
+    except (TypeError, ValueError, OverflowError):
+        return values
+
+
+def compile_link(link_base):
+    '''
+    link_base is a url with an <ID> placeholder, e.g. https://www.uniprot.org/uniprot/<ID>
+    returns a function(value) -> url
+    '''
+    parts = link_base.split("<ID>")
+    return lambda value: str(value).join(parts)
+
+
+def file_hash(fname):
+    '''
+    sha1 of the content of file fname
+    '''
+    sha1 = hashlib.sha1()
+    with open(fname, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def parse_mapping_table(fname_mapping_table):
+    """
+    Load mapping table, sort by no,
+    Add field_name, and set it as index.
+    """
+    map_table = pd.read_csv(path.join(DATA_DIR, fname_mapping_table), sep="\t", header=5)
+    map_table.sort_values(by="no", inplace=True)
+
+    ## display_titles can appear twice, once because of link_to, once because they are already there.
+    ## mark them for removal.
+    map_table = map_table[~map_table["field_name"].str.endswith(".display_title")]
+
+    addon3 = [".display_title"
+              if pd.notna(x) else ""
+              for x in map_table['links_to']]
+    addon2 = [json.loads(x)["key"] + "."
+              if pd.notna(x) else ""
+              for x in map_table['sub_embedding_group']]
+    addon1 = ["variant."
+              if x == "variant" else ""
+              for x in map_table["scope"]]
+    map_table["field_name"] = ["".join(x) for x in zip(addon1, addon2,
+                                                       list(map_table["field_name"]), addon3)]
+
+    map_table.set_index("field_name", inplace=True)
+    return map_table
+
+
+def compile_mapping_table(map_table):
+    '''
+    precompile accessors, converters and links for every field in map_table.
+    '''
+    accessors = {field: nested_keys.compile_nested_key(field) for field in map_table.index}
+    converters = {field: CONVERTERS.get(field_type, str)
+                  for field, field_type in map_table["field_type"].items()}
+    links = {field: compile_link(link)
+             for field, link in map_table["link"].items() if pd.notna(link)}
+    return {
+        "accessors": accessors,
+        "converters": converters,
+        "links": links
+    }
+
+
+def get_entry(fname_mapping_table):
+    '''
+    cached, compiled mapping table.
+    {"map_table":..., "accessors":..., "converters":..., "links":..., "mtime":..., "hash":...}
+    do not modify the returned entry, use load_mapping_table for a copy of the table.
+    '''
+    fname = path.join(DATA_DIR, fname_mapping_table)
+    mtime = path.getmtime(fname)
+    entry = _REGISTRY.get(fname)
+    if entry is not None and entry["mtime"] == mtime:
+        return entry
+
+    content_hash = file_hash(fname)
+    if entry is not None and entry["hash"] == content_hash:
+        entry["mtime"] = mtime
+        return entry
+
+    print("parsing mapping table %s" % fname_mapping_table)
+    map_table = parse_mapping_table(fname_mapping_table)
+    entry = compile_mapping_table(map_table)
+    entry.update({"map_table": map_table, "mtime": mtime, "hash": content_hash})
+    _REGISTRY[fname] = entry
+    return entry
+
+
+def load_mapping_table(fname_mapping_table, do_import_Y_only=True):
+    '''
+    copy of the cached mapping table, filtered down to do_import=Y if requested.
+    '''
+    map_table = get_entry(fname_mapping_table)["map_table"]
+    if do_import_Y_only:
+        map_table = map_table[map_table["do_import"] == "Y"]
+    return map_table.copy()
+
+
+def get_accessors(fname_mapping_table, do_import_Y_only=True):
+    '''
+    {field: function(search_result) -> list of values}
+    '''
+    entry = get_entry(fname_mapping_table)
+    fields = _fields(entry, do_import_Y_only)
+    return {field: entry["accessors"][field] for field in fields}
+
+
+def get_converters(fname_mapping_table, do_import_Y_only=True):
+    '''
+    {field: function(value) -> value cast to field_type}
+    '''
+    entry = get_entry(fname_mapping_table)
+    fields = _fields(entry, do_import_Y_only)
+    return {field: entry["converters"][field] for field in fields}
+
+
+def get_links(fname_mapping_table, do_import_Y_only=True):
+    '''
+    {field: function(value) -> url}, only for fields with a link.
+    '''
+    entry = get_entry(fname_mapping_table)
+    fields = _fields(entry, do_import_Y_only)
+    return {field: entry["links"][field] for field in fields if field in entry["links"]}
+
+
+def _fields(entry, do_import_Y_only):
+    map_table = entry["map_table"]
+    if do_import_Y_only:
+        return map_table.index[map_table["do_import"] == "Y"]
+    return map_table.index
+
+
+def clear():
+    '''
+    drop all cached mapping tables.
+    '''
+    _REGISTRY.clear()
@@ -0,0 +1,132 @@
+"""
+Paged html for the field reports of investigate_variants.create_all_reports.
+
+Instead of one table with a row per field, the rows are split in pages of PAGE_SIZE:
+"table_variant.html" is the first page (so existing links keep working),
+then "table_variant.2.html", "table_variant.3.html", ..., each with links to the others.
+
+Every row gets a small inline svg thumbnail drawn from its field_stats
+(value histogram for numbers on a log scale, top value counts for strings, like the full figures),
+so no image is requested to open a page. The full size png is only fetched when its link is
+followed, and rows below the fold are not rendered until scrolled to (content-visibility).
+"""
+
+from os import path, remove
+import glob
+import html
+import re
+
+import numpy as np
+
+
+PAGE_SIZE = 200
+THUMBNAIL_WIDTH = 120
+THUMBNAIL_HEIGHT = 32
+
+STYLE = """
+body {font-family: sans-serif; font-size: 13px;}
+table {border-collapse: collapse;}
+th, td {border: 1px solid #ccc; padding: 2px 6px; text-align: left; vertical-align: top;}
+tbody tr {content-visibility: auto; contain-intrinsic-size: auto %dpx;}
+svg path {fill: #4878a8;}
+.pages a, .pages b {margin-right: 6px;}
+""" % (THUMBNAIL_HEIGHT + 6)
+
+
+def svg_bars(counts, log=False, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT, title=""):
+    '''
+    inline svg with one bar per count, drawn as a single path.
+    '''
+    counts = np.asarray(counts, dtype=float)
+    if len(counts) == 0 or counts.max() <= 0:
+        return ""
+    if log:
+        counts = np.log1p(counts)
+    heights = height*counts/counts.max()
+    bar_width = width/len(counts)
+    commands = ["M%.1f %.1fh%.1fv%.1fh%.1fz" % (ibar*bar_width, height - bar_height, bar_width,
+                                                 bar_height, -bar_width)
+                for ibar, bar_height in enumerate(heights) if bar_height > 0]
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">'
+            '<title>%s</title><path d="%s"/></svg>' % (width, height, html.escape(title),
+                                                        "".join(commands)))
+
+
+def thumbnail(stats):
+    '''
+    svg thumbnail for field_stats.compute_field_stats, "" for fields without values.
+    '''
+    if stats["value_hist"] is not None:
+        edges = stats["value_hist"]["edges"]
+        title = "%s: %d values in [%g, %g]" % (stats["field"], stats["n_values"],
+                                               edges[0], edges[-1])
+        return svg_bars(stats["value_hist"]["counts"], log=True, title=title)
+    if stats["top"] is not None:
+        top = stats["top"]
+        title = "%s: %d unique values, top: %s" % (
+            stats["field"], stats["n_unique"],
+            ", ".join("%s (%d)" % (value, count) for value, count in
+                      zip(top["values"][:5], top["counts"][:5])))
+        return svg_bars(top["counts"], title=title)
+    return ""
+
+
+def page_filename(fname, ipage):
+    '''
+    "table_variant.html", 0 -> "table_variant.html"
+    "table_variant.html", 1 -> "table_variant.2.html"
+    '''
+    if ipage == 0:
+        return fname
+    return re.sub(r"\.html$", "", fname) + ".%d.html" % (ipage + 1)
+
+
+def _pages_nav(fname, ipage, n_pages):
+    if n_pages == 1:
+        return ""
+    links = []
+    for other in range(n_pages):
+        if other == ipage:
+            links.append("<b>%d</b>" % (other + 1))
+        else:
+            links.append('<a href="%s">%d</a>' % (path.basename(page_filename(fname, other)),
+                                                  other + 1))
+    return '<div class="pages">pages: %s</div>\n' % "".join(links)
+
+
+def write_pages(rows, columns, fname, page_size=PAGE_SIZE, title=""):
+    '''
+    write rows (dicts of html cell contents, see cell) as pages of page_size rows,
+    the first one to fname. pages left over from a longer previous report are removed.
+    returns the list of files written.
+    '''
+    n_pages = max(1, -(-len(rows) // page_size))
+    fnames = [page_filename(fname, ipage) for ipage in range(n_pages)]
+    for old_page in glob.glob(re.sub(r"\.html$", "", glob.escape(fname)) + ".*.html"):
+        if old_page not in fnames:
+            remove(old_page)
+
+    header = "".join("<th>%s</th>" % html.escape(column) for column in columns)
+    for ipage, page_fname in enumerate(fnames):
+        page_rows = rows[ipage*page_size:(ipage + 1)*page_size]
+        nav = _pages_nav(fname, ipage, n_pages)
+        with open(page_fname, "w") as outf:
+            outf.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                       '<title>%s</title><style>%s</style></head><body>\n'
+                       % (html.escape(title), STYLE))
+            outf.write(nav)
+            outf.write("<table>\n<thead><tr>%s</tr></thead>\n<tbody>\n" % header)
+            for row in page_rows:
+                outf.write("<tr>%s</tr>\n" % "".join("<td>%s</td>" % row.get(column, "")
+                                                     for column in columns))
+            outf.write("</tbody>\n</table>\n")
+            outf.write(nav)
+            outf.write("</body></html>\n")
+    return fnames
+
+
+def cell(value):
+    '''
+    escaped html for a plain value.
+    '''
+    return html.escape(str(value))
@@ -0,0 +1,175 @@
+"""
+Per sample completeness of every mapping table field, from one load of the variants of all samples
+(investigate_variants.load_variants("all")), instead of one report per sample.
+
+Variants are grouped by their CALL_INFO (e.g. "NA12879_sample"), and for every field and sample:
+    fill rate:   fraction of the sample's variants with at least one value for the field
+    n distinct:  number of distinct values of the field on the sample's variants
+Both are computed on codes: the sample of each variant is dictionary encoded once,
+the variants are walked once, evaluating every field on each (collect_values),
+and per field the values are encoded (my_utils.categorical) and counted with np.bincount / np.unique.
+
+A sample with broken annotation shows up as a column of low fill rates in the heatmap,
+and in outliers(): fields where a sample is far below the other samples.
+"""
+
+from os import path, makedirs
+
+import numpy as np
+import pandas as pd
+
+from my_utils import categorical, tracing
+import base
+import investigate_variants
+import mapping_table_registry
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+SAMPLE_KEY = "CALL_INFO"
+MISSING_SAMPLE = "unknown"
+MAX_DROP = 0.5 # outliers: fill rate at least this much below the median of the samples
+
+
+def sample_codes(variants):
+    '''
+    codes, samples: CALL_INFO of every variant, dictionary encoded and sorted.
+    '''
+    samples = [variant.get(SAMPLE_KEY, MISSING_SAMPLE) for variant in variants]
+    return categorical.sort_dictionary(*categorical.encode(samples))
+
+
+@tracing.traced()
+def collect_values(variants, accessors):
+    '''
+    walk variants once, evaluating every accessor on each variant.
+    returns {field: (values, pervar_len)}: the values of all variants in order,
+    and the number of values of each variant.
+    '''
+    values = {field: [] for field in accessors}
+    lengths = {field: [] for field in accessors}
+    for variant in variants:
+        for field, accessor in accessors.items():
+            val = accessor(variant)
+            values[field].extend(val)
+            lengths[field].append(len(val))
+    return {field: (values[field], np.array(lengths[field], dtype=int)) for field in accessors}
+
+
+@tracing.traced()
+def field_sample_counts(values, pervar_len, codes, n_samples):
+    '''
+    for one field, from its values and pervar_len (see collect_values), arrays over samples:
+    number of variants with a value, and number of distinct values.
+    '''
+    n_filled = np.bincount(codes[pervar_len > 0], minlength=n_samples)
+
+    value_codes, dictionary = categorical.encode(values)
+    value_samples = np.repeat(codes, pervar_len).astype(np.int64)
+    present = value_codes >= 0
+    # distinct (sample, value) pairs
+    pairs = np.unique(value_samples[present]*len(dictionary) + value_codes[present])
+    n_distinct = np.bincount(pairs // max(len(dictionary), 1), minlength=n_samples)
+    return n_filled, n_distinct
+
+
+@tracing.traced()
+def fill_rate_matrix(variants, accessors):
+    '''
+    accessors is {field: accessor}, e.g. from mapping_table_registry.get_accessors
+    returns fill_rate and n_distinct, DataFrames with one row per field and one column per sample,
+    and the number of variants per sample.
+    '''
+    codes, samples = sample_codes(variants)
+    n_variants = np.bincount(codes, minlength=len(samples))
+
+    collected = collect_values(variants, accessors)
+    fill_rate = np.zeros((len(accessors), len(samples)))
+    n_distinct = np.zeros((len(accessors), len(samples)), dtype=int)
+    for ifield, field in enumerate(accessors):
+        values, pervar_len = collected.pop(field)
+        n_filled, n_distinct[ifield] = field_sample_counts(values, pervar_len, codes,
+                                                           len(samples))
+        fill_rate[ifield] = n_filled / np.maximum(n_variants, 1)
+
+    index = pd.Index(list(accessors), name="field")
+    columns = pd.Index(samples, name="sample")
+    return (pd.DataFrame(fill_rate, index=index, columns=columns),
+            pd.DataFrame(n_distinct, index=index, columns=columns),
+            pd.Series(n_variants, index=columns, name="n_variants"))
+
+
+def outliers(fill_rate, max_drop=MAX_DROP):
+    '''
+    (field, sample) where the fill rate of the sample is at least max_drop below
+    the median fill rate of the field over all samples.
+    '''
+    drop = fill_rate.median(axis=1).values[:, None] - fill_rate.values
+    ifield, isample = np.nonzero(drop >= max_drop)
+    return pd.DataFrame({
+        "field": fill_rate.index[ifield],
+        "sample": fill_rate.columns[isample],
+        "fill_rate": fill_rate.values[ifield, isample],
+        "median_fill_rate": fill_rate.median(axis=1).values[ifield]
+    })
+
+
+@tracing.traced()
+def plot_fill_rate(fill_rate, image_path):
+    '''
+    heatmap of fill_rate, fields as rows, samples as columns.
+    matplotlib is only imported here.
+    '''
+    import matplotlib.pyplot as plt
+
+    n_fields, n_samples = fill_rate.shape
+    fig = plt.figure(figsize=(3 + 0.4*n_samples, 1 + 0.15*n_fields))
+    axes = fig.add_axes([0.5, 0.5/(1 + 0.15*n_fields), 0.4, 1 - 1/(1 + 0.15*n_fields)])
+    image = axes.imshow(fill_rate.values, aspect="auto", vmin=0, vmax=1, cmap="viridis",
+                        interpolation="nearest")
+    axes.set_yticks(np.arange(n_fields))
+    axes.set_yticklabels(fill_rate.index, fontsize=6)
+    axes.set_xticks(np.arange(n_samples))
+    axes.set_xticklabels(fill_rate.columns, rotation=90, fontsize=7)
+    axes.xaxis.tick_top()
+    fig.colorbar(image, ax=axes, fraction=0.05, label="fill rate")
+    fig.savefig(image_path)
+    plt.close()
+
+
+def sample_fill_rate_report(variants=None, report_dir=None, render_image=True):
+    '''
+    fields x samples fill rates and distinct counts for the variant mapping table fields,
+    on variants (defaults to the cached variants of all samples), written to
+    "<report_dir>/fill_rate_samples.tsv", "<report_dir>/n_distinct_samples.tsv"
+    and the heatmap "<report_dir>/fill_rate_samples.png" (report_dir defaults to "<DATA_DIR>/report")
+    returns fill_rate, n_distinct, and outliers
+    '''
+    if variants is None:
+        variants = investigate_variants.load_variants("all")
+    if report_dir is None:
+        report_dir = path.join(DATA_DIR, "report")
+    makedirs(report_dir, exist_ok=True)
+
+    accessors = mapping_table_registry.get_accessors(
+        investigate_variants.FNAME_MAPPING_TABLE_VARIANT)
+    fill_rate, n_distinct, n_variants = fill_rate_matrix(variants, accessors)
+    print(n_variants.to_string())
+
+    for name, table in [("fill_rate", fill_rate), ("n_distinct", n_distinct)]:
+        fname = path.join(report_dir, "%s_samples.tsv" % name)
+        print("writing %s" % fname)
+        table.to_csv(fname, sep="\t")
+    if render_image:
+        fname = path.join(report_dir, "fill_rate_samples.png")
+        print("writing %s" % fname)
+        plot_fill_rate(fill_rate, fname)
+
+    low = outliers(fill_rate)
+    if len(low) > 0:
+        print("fields with a sample far below the others:")
+        print(low.to_string(index=False))
+    return fill_rate, n_distinct, low
+
+
+if __name__ == '__main__':
+    sample_fill_rate_report()
@@ -0,0 +1,267 @@
+"""
+Long lived local server for reports and queries.
+
+Variants, genes and mapping tables are loaded once and kept in memory,
+together with every field column extracted so far, so repeated queries
+do not pay for json loading, field extraction or imports again.
+
+Run with
+    python server.py --port 8765
+or on a unix socket
+    python server.py --socket /tmp/cgap_qc.sock
+and query, e.g.
+    curl "localhost:8765/field_report?item_type=variant&field=DP"
+    curl --unix-socket /tmp/cgap_qc.sock "http://localhost/qc/sex_check"
+Endpoints must leave the resident datasets unchanged, see benchmark/check_server.py.
+
+Endpoints (all GET, all return json):
+    /fields?item_type=variant
+    /field_report?item_type=variant&field=DP
+    /field_values?item_type=gene&field=gene_symbol&limit=20
+    /inheritance_mode_table?limit=100
+    /qc/sex_check
+    /qc/validation?item_type=variant
+    /reload
+"""
+
+from os import path, remove
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import socketserver
+import sys
+import threading
+
+from my_utils import nested_keys
+import base
+import field_stats
+import investigate_variants
+import mapping_table_registry
+import validate
+
+sys.path.append(path.join(base.ROOT_DIR, "code", "inh_mode"))
+import inheritance_mode_table # pylint: disable=wrong-import-position
+
+
+SAMPLE = "NA12879"
+SAMPLE_SEX_CHECK = "NA12877"
+
+FNAME_MAPPING_TABLE = {
+    "variant": investigate_variants.FNAME_MAPPING_TABLE_VARIANT,
+    "gene": investigate_variants.FNAME_MAPPING_TABLE_GENE
+}
+
+_STATE = {"datasets": {}, "columns": {}, "results": {}}
+_LOCK = threading.RLock()
+
+
+def get_dataset(name):
+    '''
+    name is "variant", "gene", or "variant_<sample>"; loaded once, then kept.
+    '''
+    with _LOCK:
+        if name not in _STATE["datasets"]:
+            print("loading %s" % name)
+            if name == "gene":
+                _STATE["datasets"][name] = investigate_variants.load_genes()
+            elif name == "variant":
+                _STATE["datasets"][name] = investigate_variants.load_variants(SAMPLE)
+            else:
+                _STATE["datasets"][name] = investigate_variants.load_variants(name.split("_", 1)[1])
+        return _STATE["datasets"][name]
+
+
+def get_column(item_type, field):
+    '''
+    (pervar_values, values) of field, extracted once per item_type and field.
+    '''
+    key = (item_type, field)
+    with _LOCK:
+        if key not in _STATE["columns"]:
+            search_results = get_dataset(item_type)
+            _STATE["columns"][key] = (
+                investigate_variants.get_values_pervar(search_results, field),
+                investigate_variants.get_values_all(search_results, field))
+        return _STATE["columns"][key]
+
+
+def cached_result(key, compute):
+    '''
+    results that only depend on the resident datasets are computed once.
+    '''
+    with _LOCK:
+        if key not in _STATE["results"]:
+            _STATE["results"][key] = compute()
+        return _STATE["results"][key]
+
+
+def _item_type(params):
+    item_type = params.get("item_type", "variant")
+    if item_type not in FNAME_MAPPING_TABLE:
+        raise ValueError("item_type should be variant or gene, not %s" % item_type)
+    return item_type
+
+
+def _field(params):
+    if "field" not in params:
+        raise ValueError("field is required")
+    return params["field"]
+
+
+def dataset_fields(item_type):
+    '''
+    mapping table fields present on the resident dataset, and all its nested keys.
+    '''
+    keys = sorted(nested_keys.nested_keys(get_dataset(item_type)))
+    return investigate_variants.field_list_mapping_table(FNAME_MAPPING_TABLE[item_type], keys), keys
+
+
+def fields_endpoint(params):
+    item_type = _item_type(params)
+    return cached_result(("fields", item_type), lambda: dataset_fields(item_type)[0])
+
+
+def field_report_endpoint(params):
+    '''
+    field_stats of field, with values cast as in the batch reports
+    (investigate_variants.report_wrapper_*).
+    '''
+    item_type = _item_type(params)
+    field = _field(params)
+    pervar_values, values = get_column(item_type, field)
+    converter = mapping_table_registry.get_converters(FNAME_MAPPING_TABLE[item_type]).get(field)
+    if converter is not None:
+        values = mapping_table_registry.convert_values(values, converter)
+    return cached_result(("field_report", item_type, field), lambda: field_stats.compute_field_stats(
+        pervar_values, values, field, item_type))
+
+
+def field_values_endpoint(params):
+    item_type = _item_type(params)
+    field = _field(params)
+    limit = int(params.get("limit", 20))
+    pervar_values, values = get_column(item_type, field)
+    return {
+        "field": field,
+        "n_items": len(pervar_values),
+        "n_values": len(values),
+        "values": pervar_values[:limit]
+    }
+
+
+def inheritance_mode_table_endpoint(params):
+    limit = int(params.get("limit", 100))
+    table = cached_result(("inheritance_mode_table",),
+                          lambda: inheritance_mode_table.genotype_table(get_dataset("variant")))
+    return {"n_rows": len(table), "rows": table.head(limit).to_dict(orient="records")}
+
+
+def sex_check_endpoint(params):
+    result = cached_result(("sex_check",), lambda: investigate_variants.sex_check(
+        get_dataset("variant_%s" % SAMPLE_SEX_CHECK)))
+    return {
+        "coverage_mean": result["coverage_mean"].to_dict(orient="index"),
+        "gt_per_chrom": result["gt_per_chrom"].to_dict(orient="index")
+    }
+
+
+def validation_endpoint(params):
+    item_type = _item_type(params)
+    summary, samples = cached_result(("validation", item_type), lambda: validate.validate(
+        get_dataset(item_type), FNAME_MAPPING_TABLE[item_type]))
+    return {
+        "summary": summary[summary.drop(columns="n_values").sum(axis=1) > 0].to_dict(orient="index"),
+        "samples": samples.to_dict(orient="records")
+    }
+
+
+def reload_endpoint(params):
+    with _LOCK:
+        names = list(_STATE["datasets"])
+        for key in _STATE:
+            _STATE[key].clear()
+        for name in names:
+            get_dataset(name)
+    return {"reloaded": names}
+
+
+ROUTES = {
+    "/fields": fields_endpoint,
+    "/field_report": field_report_endpoint,
+    "/field_values": field_values_endpoint,
+    "/inheritance_mode_table": inheritance_mode_table_endpoint,
+    "/qc/sex_check": sex_check_endpoint,
+    "/qc/validation": validation_endpoint,
+    "/reload": reload_endpoint
+}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    dispatch GET requests to ROUTES, and answer with json.
+    '''
+
+    def do_GET(self): # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        endpoint = ROUTES.get(url.path)
+        if endpoint is None:
+            self.respond(404, {"error": "unknown path %s" % url.path, "paths": sorted(ROUTES)})
+            return
+        try:
+            self.respond(200, endpoint(params))
+        except (ValueError, KeyError) as error:
+            self.respond(400, {"error": str(error)})
+        except Exception as error: # pylint: disable=broad-except
+            # keep serving, the datasets are still good.
+            self.respond(500, {"error": "%s: %s" % (type(error).__name__, error)})
+
+    def respond(self, status, content):
+        body = json.dumps(field_stats.to_jsonable(content), default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address is an empty string on unix sockets
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "unix"
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(port=8765, socket_path=None, preload=("variant", "gene")):
+    '''
+    load datasets in preload, then serve forever on localhost:port, or on socket_path if given.
+    '''
+    for name in preload:
+        get_dataset(name)
+    for item_type in FNAME_MAPPING_TABLE.values():
+        mapping_table_registry.get_entry(item_type)
+
+    if socket_path is not None:
+        if path.exists(socket_path):
+            remove(socket_path)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+        print("serving on %s" % socket_path)
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), RequestHandler)
+        print("serving on http://127.0.0.1:%d" % port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    PARSER.add_argument("--port", type=int, default=8765)
+    PARSER.add_argument("--socket", default=None, help="serve on this unix socket instead of a port")
+    ARGS = PARSER.parse_args()
+    serve(ARGS.port, ARGS.socket)
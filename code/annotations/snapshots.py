@@ -0,0 +1,225 @@
+"""
+Versioned snapshots of search results, e.g. of "variants_NA12879.json" or "genes.json".
+
+Each fetch is recorded as a version under "<DATA_DIR>/snapshots/<name>/":
+    manifest.json        list of versions, and which base each one uses
+    v0001.json.gz        a base: the full list of records
+    v0002.json.gz        a delta against its base, per record (by uuid):
+                         {"removed": [keys], "added": {key: record},
+                          "changed": {key: {"set": [[path, value]], "unset": [path]}},
+                          "order": [keys] or None if it is base order minus removed plus added}
+Paths are lists of keys into nested dicts, lists are replaced as a whole.
+If a delta would touch more than REBASE_FRACTION of the records, a new base is written instead.
+
+Checking out any version reads at most one base and one delta.
+"""
+
+from os import path, makedirs
+from datetime import datetime
+import gzip
+import json
+
+from my_utils import nested_keys
+import base
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+SNAPSHOT_DIR = path.join(DATA_DIR, "snapshots")
+REBASE_FRACTION = 0.5
+
+
+def record_key(record, position):
+    '''
+    records are matched on uuid (or @id), falling back to their position in the list.
+    '''
+    return record.get("uuid") or record.get("@id") or "#%d" % position
+
+
+def record_delta(old, new, prefix=()):
+    '''
+    returns sets, unsets to go from dict old to dict new, recursing into nested dicts.
+    '''
+    sets = []
+    unsets = []
+    for key, val in new.items():
+        if key not in old:
+            sets.append([list(prefix) + [key], val])
+        elif isinstance(val, dict) and isinstance(old[key], dict):
+            sub_sets, sub_unsets = record_delta(old[key], val, prefix + (key,))
+            sets.extend(sub_sets)
+            unsets.extend(sub_unsets)
+        elif old[key] != val:
+            sets.append([list(prefix) + [key], val])
+    for key in old:
+        if key not in new:
+            unsets.append(list(prefix) + [key])
+    return sets, unsets
+
+
+def apply_record_delta(record, sets, unsets):
+    '''
+    apply sets and unsets from record_delta to record, in place.
+    '''
+    for keys in unsets:
+        parent = record
+        for key in keys[:-1]:
+            parent = parent[key]
+        parent.pop(keys[-1])
+    for keys, val in sets:
+        parent = record
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        parent[keys[-1]] = val
+    return record
+
+
+def _snapshot_dir(name):
+    return path.join(SNAPSHOT_DIR, name)
+
+
+def _read(name, fname):
+    with gzip.open(path.join(_snapshot_dir(name), fname), "rt") as infile:
+        return json.load(infile)
+
+
+def _write(name, fname, content):
+    with gzip.open(path.join(_snapshot_dir(name), fname), "wt") as outf:
+        json.dump(content, outf)
+
+
+def load_manifest(name):
+    '''
+    {"versions": [{"version": 1, "file": ..., "base": 1, "created": ..., "n_records": ...}, ...]}
+    '''
+    fname = path.join(_snapshot_dir(name), "manifest.json")
+    if not path.exists(fname):
+        return {"versions": []}
+    with open(fname) as infile:
+        return json.load(infile)
+
+
+def versions(name):
+    '''
+    version numbers recorded for name, oldest first.
+    '''
+    return [entry["version"] for entry in load_manifest(name)["versions"]]
+
+
+def _entry(manifest, version):
+    if version is None:
+        return manifest["versions"][-1]
+    for entry in manifest["versions"]:
+        if entry["version"] == version:
+            return entry
+    raise ValueError("no version %s in snapshots" % version)
+
+
+def compute_delta(base_records, records):
+    '''
+    per-record delta from base_records to records, see module docstring.
+    '''
+    base_keyed = {record_key(record, i): record for i, record in enumerate(base_records)}
+    keys = [record_key(record, i) for i, record in enumerate(records)]
+    keyed = dict(zip(keys, records))
+
+    delta = {"removed": [key for key in base_keyed if key not in keyed],
+             "added": {},
+             "changed": {}}
+    for key, record in keyed.items():
+        if key not in base_keyed:
+            delta["added"][key] = record
+            continue
+        sets, unsets = record_delta(base_keyed[key], record)
+        if sets or unsets:
+            delta["changed"][key] = {"set": sets, "unset": unsets}
+
+    removed = set(delta["removed"])
+    expected_order = [key for key in base_keyed if key not in removed] + list(delta["added"])
+    delta["order"] = None if expected_order == keys else keys
+    return delta
+
+
+def commit_snapshot(name, records):
+    '''
+    record records as a new version of name.
+    nothing is written if records are identical to the latest version.
+    returns the version number.
+    '''
+    makedirs(_snapshot_dir(name), exist_ok=True)
+    manifest = load_manifest(name)
+    version = len(manifest["versions"]) + 1
+    fname = "v%04d.json.gz" % version
+    entry = {"version": version, "file": fname, "base": version,
+             "created": datetime.now().isoformat(), "n_records": len(records)}
+
+    if len(manifest["versions"]) > 0:
+        latest = manifest["versions"][-1]
+        base_entry = _entry(manifest, latest["base"])
+        delta = compute_delta(_read(name, base_entry["file"]), records)
+        n_touched = len(delta["removed"]) + len(delta["added"]) + len(delta["changed"])
+
+        if latest["base"] == latest["version"]:
+            latest_delta = {"removed": [], "added": {}, "changed": {}, "order": None}
+        else:
+            latest_delta = _read(name, latest["file"])
+        if json.dumps(delta, sort_keys=True) == json.dumps(latest_delta, sort_keys=True):
+            print("%s is unchanged since version %d" % (name, latest["version"]))
+            return latest["version"]
+
+        if n_touched <= REBASE_FRACTION * max(len(records), 1):
+            entry["base"] = base_entry["version"]
+            print("writing %s version %d as a delta (%d records touched)" % (name, version, n_touched))
+            _write(name, fname, delta)
+
+    if entry["base"] == version:
+        print("writing %s version %d as a base" % (name, version))
+        _write(name, fname, records)
+
+    manifest["versions"].append(entry)
+    with open(path.join(_snapshot_dir(name), "manifest.json"), "w") as outf:
+        json.dump(manifest, outf, indent=4)
+    return version
+
+
+def checkout(name, version=None):
+    '''
+    records of name at version (latest if None).
+    '''
+    manifest = load_manifest(name)
+    entry = _entry(manifest, version)
+    base_records = _read(name, _entry(manifest, entry["base"])["file"])
+    if entry["base"] == entry["version"]:
+        return base_records
+
+    delta = _read(name, entry["file"])
+    keyed = {record_key(record, i): record for i, record in enumerate(base_records)}
+    for key in delta["removed"]:
+        keyed.pop(key)
+    for key, change in delta["changed"].items():
+        apply_record_delta(keyed[key], change["set"], change["unset"])
+    keyed.update(delta["added"])
+    order = delta["order"] if delta["order"] is not None else list(keyed)
+    return [keyed[key] for key in order]
+
+
+def changed_fields(name, version_old, version_new):
+    '''
+    fields (in nested_keys format, e.g. variant.CHROM) with any difference between
+    the two versions of name, including all fields of added or removed records.
+    '''
+    old = checkout(name, version_old)
+    new = checkout(name, version_new)
+    old_keyed = {record_key(record, i): record for i, record in enumerate(old)}
+    new_keyed = {record_key(record, i): record for i, record in enumerate(new)}
+
+    fields = set()
+    for key in set(old_keyed).symmetric_difference(new_keyed):
+        fields.update(nested_keys.nested_keys(old_keyed.get(key, new_keyed.get(key))))
+    for key in set(old_keyed).intersection(new_keyed):
+        if old_keyed[key] == new_keyed[key]:
+            continue
+        for field in nested_keys.nested_keys([old_keyed[key], new_keyed[key]]):
+            accessor = nested_keys.compile_nested_key(field)
+            if accessor(old_keyed[key]) != accessor(new_keyed[key]):
+                fields.add(field)
+    return sorted(fields)
@@ -0,0 +1,199 @@
+"""
+Check the cached variants and genes against what the mapping table declares for each field:
+field_type, is_list, enum_list, min, max and pattern.
+
+The columns of the mapping table are compiled once into per-field checks,
+and every check is run as a mask over all values of a chunk of search results at once.
+The output is a violation count per field and check, and some sample offending records.
+"""
+
+from os import path, makedirs
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from my_utils import tracing
+import base
+import mapping_table_registry
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+
+ALLOWED_TYPES = {
+    "string": [str],
+    "integer": [int],
+    "number": [int, float],
+    "boolean": [bool]
+}
+
+CHECKS = ["type", "list", "enum", "min", "max", "pattern"]
+NUMERIC_TYPES = ["integer", "number"]
+
+
+def compile_checks(map_table, converters=None):
+    '''
+    map_table is a clean mapping table (see mapping_table_registry.load_mapping_table)
+    converters is {field: converter}, see mapping_table_registry.get_converters
+    returns {field: check}, where check is a dict with the parsed constraints for the field.
+    '''
+    converters = converters or {}
+    checks = {}
+    for field, row in map_table.iterrows():
+        check = {"allowed_types": ALLOWED_TYPES.get(row["field_type"], None)}
+        # min / max compare values cast to float, e.g. "12" in an integer field;
+        # the converter of the field is only tried on values that do not cast.
+        check["convert"] = None
+        if row["field_type"] in NUMERIC_TYPES:
+            check["convert"] = converters.get(field)
+        check["integral"] = row["field_type"] == "integer"
+        # a non list field within a sub embedding group can still have many values per item.
+        check["single"] = row["is_list"] == "N" and pd.isna(row["sub_embedding_group"])
+        check["enum"] = None
+        if pd.notna(row["enum_list"]):
+            check["enum"] = [value.strip() for value in re.split("[,;]", row["enum_list"])]
+        check["min"] = float(row["min"]) if pd.notna(row["min"]) else None
+        check["max"] = float(row["max"]) if pd.notna(row["max"]) else None
+        check["pattern"] = re.compile(row["pattern"]) if pd.notna(row["pattern"]) else None
+        checks[field] = check
+    return checks
+
+
+def numeric_values(series, convert=None):
+    '''
+    float array of the values in series, nan where a value cannot be cast.
+    values that pd.to_numeric cannot cast get a second chance with convert, if given.
+    '''
+    numeric = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    if convert is None:
+        return numeric
+    for i in np.flatnonzero(np.isnan(numeric) & series.notna().to_numpy()):
+        try:
+            numeric[i] = float(convert(series.iat[i]))
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return numeric
+
+
+def violation_masks(values, check):
+    '''
+    values is a numpy object array of all values of a field.
+    returns {check_name: boolean mask of violating values}
+    '''
+    masks = {}
+    series = pd.Series(values, dtype=object)
+
+    valid_type = np.ones(len(values), dtype=bool)
+    if check["allowed_types"] is not None:
+        valid_type = pd.Series([type(value) for value in values],
+                               dtype=object).isin(check["allowed_types"]).to_numpy()
+        masks["type"] = ~valid_type
+
+    if check["enum"] is not None:
+        masks["enum"] = ~series.astype(str).isin(check["enum"]).to_numpy()
+
+    numeric = None
+    if check["integral"] or check["min"] is not None or check["max"] is not None:
+        numeric = numeric_values(series, check["convert"])
+    if check["integral"] and "type" in masks:
+        # e.g. 2.7 or "2.7" in an integer field
+        masks["type"] |= ~np.isnan(numeric) & (numeric != np.floor(numeric))
+
+    if check["min"] is not None or check["max"] is not None:
+        with np.errstate(invalid="ignore"):
+            if check["min"] is not None:
+                masks["min"] = numeric < check["min"]
+            if check["max"] is not None:
+                masks["max"] = numeric > check["max"]
+
+    if check["pattern"] is not None:
+        # as in json schema, a pattern matches anywhere in the value, so prefixes like
+        # ^(A|N|W|X|Y)(C|G|M|P|R|T|W)_[0-9]+ accept versioned ids (NM_000123.4).
+        # only patterns ending in $ have to match the whole value.
+        strings = series.astype(str)
+        if check["pattern"].pattern.endswith("$"):
+            matches = strings.str.fullmatch(check["pattern"])
+        else:
+            with warnings.catch_warnings():
+                # patterns with groups are fine here.
+                warnings.simplefilter("ignore", UserWarning)
+                matches = strings.str.contains(check["pattern"], regex=True)
+        masks["pattern"] = ~matches.to_numpy(dtype=bool)
+
+    return masks
+
+
+@tracing.traced()
+def validate(search_results, fname_mapping_table, chunk_size=10000, n_samples=5):
+    '''
+    run the checks for every do_import=Y field of the mapping table
+    over search_results, chunk_size items at a time.
+    returns two data frames:
+     - summary: one row per field, with number of values and number of violations per check.
+     - samples: up to n_samples offending values per field and check,
+       with the offset of the search result they came from.
+    '''
+    map_table = mapping_table_registry.load_mapping_table(fname_mapping_table)
+    accessors = mapping_table_registry.get_accessors(fname_mapping_table)
+    checks = compile_checks(map_table, mapping_table_registry.get_converters(fname_mapping_table))
+
+    counts = {field: dict.fromkeys(["n_values"] + CHECKS, 0) for field in checks}
+    samples = []
+    n_sampled = {}
+
+    for chunk_start in range(0, len(search_results), chunk_size):
+        chunk = search_results[chunk_start:chunk_start + chunk_size]
+        for field, check in checks.items():
+            pervar_values = [accessors[field](search_result) for search_result in chunk]
+            pervar_len = np.fromiter((len(val) for val in pervar_values), dtype=int,
+                                     count=len(pervar_values))
+            values = np.empty(pervar_len.sum(), dtype=object)
+            values[:] = [value for val in pervar_values for value in val]
+            offsets = chunk_start + np.repeat(np.arange(len(chunk)), pervar_len)
+            counts[field]["n_values"] += len(values)
+
+            masks = violation_masks(values, check)
+            if check["single"]:
+                masks["list"] = np.repeat(pervar_len > 1, pervar_len)
+
+            for check_name, mask in masks.items():
+                n_violations = int(np.count_nonzero(mask))
+                if n_violations == 0:
+                    continue
+                counts[field][check_name] += n_violations
+                key = (field, check_name)
+                for i in np.flatnonzero(mask)[:n_samples - n_sampled.get(key, 0)]:
+                    samples.append({"field": field, "check": check_name,
+                                    "offset": offsets[i], "value": values[i]})
+                    n_sampled[key] = n_sampled.get(key, 0) + 1
+
+    summary = pd.DataFrame.from_dict(counts, orient="index", columns=["n_values"] + CHECKS)
+    summary.index.name = "field"
+    samples = pd.DataFrame(samples, columns=["field", "check", "offset", "value"])
+    return summary, samples
+
+
+def validation_report(search_results, fname_mapping_table, item_type):
+    '''
+    run validate and write
+    "<DATA_DIR>/report/validation_<item_type>.tsv" and
+    "<DATA_DIR>/report/validation_<item_type>_samples.tsv"
+    '''
+    summary, samples = validate(search_results, fname_mapping_table)
+    report_dir = path.join(DATA_DIR, "report")
+    makedirs(report_dir, exist_ok=True)
+    fname_summary = path.join(report_dir, "validation_%s.tsv" % item_type)
+    print("writing %s" % fname_summary)
+    summary.to_csv(fname_summary, sep="\t")
+    samples.to_csv(path.join(report_dir, "validation_%s_samples.tsv" % item_type),
+                   sep="\t", index=False)
+    return summary
+
+
+if __name__ == '__main__':
+    import investigate_variants
+    validation_report(investigate_variants.load_variants("NA12879"),
+                      investigate_variants.FNAME_MAPPING_TABLE_VARIANT, "variant")
+    validation_report(investigate_variants.load_genes(),
+                      investigate_variants.FNAME_MAPPING_TABLE_GENE, "gene")
@@ -0,0 +1,215 @@
+"""
+Index over (CHROM, POS) for a cached variants json file, e.g. "<DATA_DIR>/variants_NA12879.json",
+sharded (see my_utils.ndjson_shards) or not.
+
+The index is a set of numpy arrays, sorted by chromosome, then position:
+    chroms:         chromosome names, in CHROM_ORDER
+    chrom_offsets:  records of chroms[i] are at [chrom_offsets[i], chrom_offsets[i+1])
+    pos:            POS of each record
+    record:         offset of each record in the cached json list
+    files:          files the records are in, the shards or the cache itself
+    record_file:    index in files of the file of each record
+    span_start/end: byte span of each record in its file
+It is saved next to the cache as "<cache>.index.npz",
+and rebuilt whenever the size or mtime of the cache (or of its shard manifest) changes.
+
+A region query is a binary search within the chromosome,
+and only the byte spans of the matching records are read and decoded.
+"""
+
+from os import path
+import json
+import re
+
+import numpy as np
+
+from my_utils import categorical, ndjson_shards
+
+
+CHROM_ORDER = [str(i) for i in range(1, 23)] + ["X", "Y", "M"]
+
+
+def chrom_sort_key(chrom):
+    '''
+    1, 2, ..., 22, X, Y, M, then anything else alphabetically.
+    '''
+    chrom = str(chrom)
+    if chrom in CHROM_ORDER:
+        return (0, CHROM_ORDER.index(chrom), "")
+    return (1, 0, chrom)
+
+
+def index_filename(filename_variant):
+    return filename_variant + ".index.npz"
+
+
+def record_spans(text):
+    '''
+    text is a json list of records, e.g. the content of a variants cache file.
+    yields (record, start, end) for each record, where text[start:end] is the record.
+    '''
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[\s,]*")
+    position = whitespace.match(text, text.index("[") + 1).end()
+    while text[position] != "]":
+        record, end = decoder.raw_decode(text, position)
+        yield record, position, end
+        position = whitespace.match(text, end).end()
+
+
+def ndjson_spans(content):
+    '''
+    content is the bytes of an ndjson shard.
+    yields (record, start, end) for each record, where content[start:end] is the record.
+    '''
+    start = 0
+    for line in content.split(b"\n"):
+        end = start + len(line)
+        if line.strip():
+            yield json.loads(line), start, end
+        start = end + 1
+
+
+def file_spans(filename_variant):
+    '''
+    returns files (the shards, or the cache itself),
+    and a generator of (ifile, record, start, end) over the records of the cache, in order.
+    '''
+    if ndjson_shards.is_sharded(filename_variant):
+        files = ndjson_shards.shard_files(filename_variant)
+    else:
+        files = [filename_variant]
+
+    def spans():
+        for ifile, fname in enumerate(files):
+            with open(fname, "rb") as file_variant:
+                content = file_variant.read()
+            if fname == filename_variant:
+                # latin-1 maps every byte to one character, so offsets in text are byte offsets.
+                each_span = record_spans(content.decode("latin-1"))
+            else:
+                each_span = ndjson_spans(content)
+            for record, start, end in each_span:
+                yield ifile, record, start, end
+    return files, spans()
+
+
+def build_index(filename_variant):
+    '''
+    scan the cache once and build the index arrays.
+    '''
+    files, spans = file_spans(filename_variant)
+    chrom = []
+    pos = []
+    record_file = []
+    span_start = []
+    span_end = []
+    for ifile, record, start, end in spans:
+        chrom.append(str(record.get("variant", {}).get("CHROM", "")))
+        pos.append(record.get("variant", {}).get("POS", -1))
+        record_file.append(ifile)
+        span_start.append(start)
+        span_end.append(end)
+
+    codes, dictionary = categorical.encode(chrom)
+    chroms = sorted(dictionary, key=chrom_sort_key)
+    rank = np.array([chroms.index(each) for each in dictionary], dtype=int)
+    chrom_rank = rank[codes]
+    pos = np.array(pos, dtype=np.int64)
+
+    order = np.lexsort((pos, chrom_rank))
+    chrom_offsets = np.searchsorted(chrom_rank[order], np.arange(len(chroms) + 1))
+
+    dirname = path.dirname(filename_variant)
+    return {
+        "chroms": np.array(chroms, dtype=str),
+        "chrom_offsets": chrom_offsets,
+        "pos": pos[order],
+        "record": order,
+        "files": np.array([path.relpath(fname, dirname) for fname in files], dtype=str),
+        "record_file": np.array(record_file, dtype=np.int64)[order],
+        "span_start": np.array(span_start, dtype=np.int64)[order],
+        "span_end": np.array(span_end, dtype=np.int64)[order],
+        "source": np.array(ndjson_shards.source_stat(filename_variant), dtype=float)
+    }
+
+
+def load_index(filename_variant, rebuild=False):
+    '''
+    load the index for filename_variant, building (and saving) it if it is missing or stale.
+    '''
+    filename_index = index_filename(filename_variant)
+    stat = np.array(ndjson_shards.source_stat(filename_variant), dtype=float)
+    if not rebuild and path.exists(filename_index):
+        with np.load(filename_index, allow_pickle=False) as stored:
+            index = dict(stored)
+        if "files" in index and np.array_equal(index["source"], stat):
+            return index
+    print("building index %s" % filename_index)
+    index = build_index(filename_variant)
+    np.savez(filename_index, **index)
+    return index
+
+
+def parse_region(region):
+    '''
+    "chrX:1-2,700,000" -> ("X", 1, 2700000)
+    "chrY" or "Y" -> ("Y", None, None)
+    positions are 1-based and inclusive, like samtools regions.
+    '''
+    match = re.match(r"^(?:chr)?([^:]+)(?::([\d,]+)-([\d,]+))?$", region.strip())
+    if match is None:
+        raise ValueError("region should look like chrX:1-2,700,000 or chrY, not %s" % region)
+    chrom, start, end = match.groups()
+    if start is None:
+        return chrom, None, None
+    return chrom, int(start.replace(",", "")), int(end.replace(",", ""))
+
+
+def region_slice(index, region):
+    '''
+    [first, last) positions in the index arrays for the region.
+    '''
+    chrom, start, end = parse_region(region)
+    chroms = list(index["chroms"])
+    if chrom not in chroms:
+        return 0, 0
+    ichrom = chroms.index(chrom)
+    first = index["chrom_offsets"][ichrom]
+    last = index["chrom_offsets"][ichrom + 1]
+    if start is not None:
+        pos = index["pos"][first:last]
+        first, last = (first + np.searchsorted(pos, start, side="left"),
+                       first + np.searchsorted(pos, end, side="right"))
+    return first, last
+
+
+def query(index, region):
+    '''
+    offsets in the cached json list of records within region, ordered by position.
+    '''
+    first, last = region_slice(index, region)
+    return index["record"][first:last]
+
+
+def load_region(filename_variant, region, index=None):
+    '''
+    decode only the records of filename_variant within region, ordered by position.
+    '''
+    if index is None:
+        index = load_index(filename_variant)
+    first, last = region_slice(index, region)
+    dirname = path.dirname(filename_variant)
+    open_files = {}
+    records = []
+    try:
+        for ifile, start, end in zip(index["record_file"][first:last], index["span_start"][first:last],
+                                     index["span_end"][first:last]):
+            if ifile not in open_files:
+                open_files[ifile] = open(path.join(dirname, index["files"][ifile]), "rb")
+            open_files[ifile].seek(start)
+            records.append(json.loads(open_files[ifile].read(end - start)))
+    finally:
+        for file_variant in open_files.values():
+            file_variant.close()
+    return records
@@ -0,0 +1,150 @@
+"""
+Scaling benchmark for the report entry points of investigate_variants, on synthetic documents:
+    create_all_reports (with or without images)
+    create_links_report
+    identify_fields_with_no_values
+
+Every (entry point, item type, size) runs in its own spawned process,
+so that peak RSS is the one of that run only.
+Per run, records wall time of each stage (generate, fields, report) and peak RSS,
+and writes everything to "<DATA_DIR>/benchmark/bench_reports.tsv".
+Runs are traced (see my_utils.tracing): calls and total time of every span within the report
+go to "bench_reports_spans.tsv", and with --trace, each run is also written as a chrome trace
+"trace_<entry point>_<item type>_<size>.json".
+
+e.g.
+    python bench_reports.py --sizes 10000 100000 --entry-points all_reports links_report
+"""
+
+from os import path, makedirs
+import argparse
+import multiprocessing
+import re
+import resource
+import tempfile
+
+import pandas as pd
+
+from my_utils import nested_keys, tracing
+import base
+import synthetic
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+BENCHMARK_DIR = path.join(DATA_DIR, "benchmark")
+
+SIZES = [10000, 100000, 1000000]
+ITEM_TYPES = ["variant", "gene"]
+ENTRY_POINTS = ["all_reports", "all_reports_images", "links_report", "fields_with_no_values"]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run_entry_point(entry_point, item_type, n_items, generator_kwargs, fname_trace=None):
+    '''
+    generate n_items documents and run entry_point on them, in the current process.
+    returns a dict with the wall time of each stage in seconds and peak RSS in MB,
+    and the tracing summary of the run as a list of dicts.
+    '''
+    import investigate_variants # needs dcicutils, generating documents does not
+    result = {"rss_start_mb": peak_rss_mb()}
+    tracing.reset()
+    tracing.enable()
+
+    with tracing.span("generate", n_items=n_items):
+        search_results = synthetic.generate_documents(item_type, n_items, **generator_kwargs)
+    result["rss_generated_mb"] = peak_rss_mb()
+
+    with tracing.span("fields") as span:
+        fields = investigate_variants.field_list_mapping_table(
+            synthetic.FNAME_MAPPING_TABLE[item_type], nested_keys.nested_keys(search_results))
+        span.set(n_fields=len(fields))
+    result["n_fields"] = len(fields)
+
+    with tempfile.TemporaryDirectory() as output_dir, tracing.span("report"):
+        if entry_point == "all_reports":
+            investigate_variants.create_all_reports(search_results, fields, render_images=False,
+                                                    report_dir=output_dir)
+        elif entry_point == "all_reports_images":
+            investigate_variants.create_all_reports(search_results, fields, render_images=True,
+                                                    report_dir=output_dir)
+        elif entry_point == "links_report":
+            investigate_variants.create_links_report(search_results, report_dir=output_dir)
+        elif entry_point == "fields_with_no_values":
+            investigate_variants.identify_fields_with_no_values({item_type: search_results},
+                                                                output_dir=output_dir)
+        else:
+            raise ValueError("unknown entry point %s" % entry_point)
+
+    spans = tracing.summary()
+    for stage in ["generate", "fields", "report"]:
+        result["%s_s" % stage] = float(spans.loc[stage, "total_s"])
+    result["total_s"] = result["generate_s"] + result["fields_s"] + result["report_s"]
+    result["rss_peak_mb"] = peak_rss_mb()
+    if fname_trace is not None:
+        tracing.export_chrome_trace(fname_trace)
+    return result, spans.reset_index().to_dict(orient="records")
+
+
+def benchmark(entry_points=ENTRY_POINTS, item_types=ITEM_TYPES, sizes=SIZES, trace_dir=None,
+              **generator_kwargs):
+    '''
+    run every combination, each in a fresh process.
+    returns two data frames: one row per run, and one row per run and span.
+    if trace_dir is given, a chrome trace of each run is written there.
+    '''
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    span_rows = []
+    for entry_point in entry_points:
+        for item_type in item_types:
+            for n_items in sizes:
+                print("%s %s %d" % (entry_point, item_type, n_items))
+                fname_trace = None
+                if trace_dir is not None:
+                    fname_trace = path.join(trace_dir, "trace_%s_%s_%d.json" % (
+                        entry_point, item_type, n_items))
+                with context.Pool(1) as pool:
+                    result, spans = pool.apply(run_entry_point, (
+                        entry_point, item_type, n_items, generator_kwargs, fname_trace))
+                row = {"entry_point": entry_point, "item_type": item_type, "n_items": n_items}
+                span_rows.extend(dict(row, **span) for span in spans)
+                row.update(result)
+                print("  %.1fs, %.0f MB" % (row["total_s"], row["rss_peak_mb"]))
+                rows.append(row)
+    return pd.DataFrame(rows), pd.DataFrame(span_rows)
+
+
+def write_benchmark(table, spans, fname=None):
+    if fname is None:
+        makedirs(BENCHMARK_DIR, exist_ok=True)
+        fname = path.join(BENCHMARK_DIR, "bench_reports.tsv")
+    print("writing %s" % fname)
+    table.to_csv(fname, sep="\t", index=False, float_format="%.3f")
+    spans.to_csv(re.sub(r"(\.tsv)?$", "_spans.tsv", fname, count=1), sep="\t", index=False,
+                 float_format="%.4f")
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    PARSER.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    PARSER.add_argument("--item-types", nargs="+", default=ITEM_TYPES, choices=ITEM_TYPES)
+    PARSER.add_argument("--entry-points", nargs="+", default=ENTRY_POINTS, choices=ENTRY_POINTS)
+    PARSER.add_argument("--list-length", type=int, default=3)
+    PARSER.add_argument("--cardinality", type=int, default=100)
+    PARSER.add_argument("--fill-rate", type=float, default=0.9)
+    PARSER.add_argument("--output", default=None)
+    PARSER.add_argument("--trace", action="store_true",
+                        help="write a chrome trace of each run next to the output")
+    ARGS = PARSER.parse_args()
+    TRACE_DIR = None
+    if ARGS.trace:
+        TRACE_DIR = path.dirname(ARGS.output) if ARGS.output else BENCHMARK_DIR
+        makedirs(TRACE_DIR, exist_ok=True)
+    TABLE, SPANS = benchmark(ARGS.entry_points, ARGS.item_types, ARGS.sizes, TRACE_DIR,
+                             list_length=ARGS.list_length, cardinality=ARGS.cardinality,
+                             fill_rate=ARGS.fill_rate)
+    write_benchmark(TABLE, SPANS, ARGS.output)
@@ -0,0 +1,78 @@
+"""
+Benchmark of ndjson_shards.read on synthetic variants: the single json file, and its shards.
+
+Writes "<DATA_DIR>/benchmark/bench_shards.tsv", with the speedup of each run over
+the read of the shards.
+
+e.g.
+    python bench_shards.py --sizes 10000 100000 --shards 16
+"""
+
+from os import path, makedirs
+import argparse
+import json
+import tempfile
+import time
+
+import pandas as pd
+
+from my_utils import ndjson_shards
+import base
+import synthetic
+
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+BENCHMARK_DIR = path.join(DATA_DIR, "benchmark")
+
+SIZES = [10000, 100000]
+
+
+def timed_read(fname):
+    start = time.perf_counter()
+    records = ndjson_shards.read(fname)
+    return time.perf_counter() - start, len(records)
+
+
+def bench_size(n_items, n_shards, tmpdir):
+    '''
+    one row per way of reading n_items synthetic variants.
+    '''
+    documents = synthetic.generate_documents("variant", n_items)
+    fname_single = path.join(tmpdir, "single_%d.json" % n_items)
+    with open(fname_single, "w") as outf:
+        json.dump(documents, outf)
+    fname_sharded = path.join(tmpdir, "sharded_%d.json" % n_items)
+    ndjson_shards.write(documents, fname_sharded, n_shards)
+    del documents
+
+    rows = []
+    for method, fname in [("single json", fname_single), ("shards", fname_sharded)]:
+        seconds, n_records = timed_read(fname)
+        rows.append({"n_items": n_items, "method": method, "n_shards": n_shards,
+                     "n_records": n_records, "seconds": seconds})
+        print("%d items, %s: %.2fs" % (n_items, method, seconds))
+    shards = rows[1]["seconds"]
+    for row in rows:
+        row["speedup"] = shards / row["seconds"]
+    return rows
+
+
+def run(sizes=SIZES, n_shards=ndjson_shards.N_SHARDS):
+    makedirs(BENCHMARK_DIR, exist_ok=True)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_items in sizes:
+            rows += bench_size(n_items, n_shards, tmpdir)
+    results = pd.DataFrame(rows)
+    fname = path.join(BENCHMARK_DIR, "bench_shards.tsv")
+    print("writing %s" % fname)
+    results.to_csv(fname, sep="\t", index=False)
+    return results
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    PARSER.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    PARSER.add_argument("--shards", type=int, default=ndjson_shards.N_SHARDS)
+    ARGS = PARSER.parse_args()
+    print(run(ARGS.sizes, ARGS.shards).to_string(index=False))
@@ -0,0 +1,106 @@
+"""
+Check that the endpoints of annotations/server.py leave the resident datasets unchanged,
+otherwise results would depend on the order of requests.
+
+Synthetic variants and genes (see synthetic.py) are made resident, every endpoint is called,
+and the datasets are compared with deep copies taken before.
+The field reports are also compared with the batch reports (investigate_variants.field_report
+with the mapping table converters), which they should agree with.
+
+e.g.
+    python check_server.py --n_items 2000
+"""
+
+import argparse
+import copy
+
+import numpy as np
+
+import synthetic
+import investigate_variants # pylint: disable=wrong-import-order
+import mapping_table_registry # pylint: disable=wrong-import-order
+import server # pylint: disable=wrong-import-order
+
+
+N_ITEMS = 1000
+
+
+def make_resident(n_items):
+    '''
+    synthetic datasets in place of the cached ones, returns deep copies of them.
+    '''
+    datasets = {
+        "variant": synthetic.generate_documents("variant", n_items),
+        "gene": synthetic.generate_documents("gene", n_items)
+    }
+    datasets["variant_%s" % server.SAMPLE_SEX_CHECK] = datasets["variant"]
+    for key in server._STATE: # pylint: disable=protected-access
+        server._STATE[key].clear() # pylint: disable=protected-access
+    server._STATE["datasets"].update(datasets) # pylint: disable=protected-access
+    return {name: copy.deepcopy(documents) for name, documents in datasets.items()}
+
+
+def calls(fields):
+    '''
+    (route, params) of every endpoint but /reload, field endpoints for each of fields.
+    '''
+    routes = [("/inheritance_mode_table", {"limit": 1}), ("/qc/sex_check", {})]
+    for item_type, item_fields in fields.items():
+        routes.append(("/fields", {"item_type": item_type}))
+        routes.append(("/qc/validation", {"item_type": item_type}))
+        for field in item_fields:
+            routes.append(("/field_report", {"item_type": item_type, "field": field}))
+            routes.append(("/field_values", {"item_type": item_type, "field": field}))
+    return routes
+
+
+def same_stats(stats, other):
+    '''
+    field_stats equal, numpy arrays included.
+    '''
+    if isinstance(stats, dict):
+        return stats.keys() == other.keys() and all(same_stats(stats[key], other[key])
+                                                     for key in stats)
+    if isinstance(stats, np.ndarray):
+        return np.array_equal(stats, other)
+    return stats == other
+
+
+def check(n_items=N_ITEMS, n_fields=5):
+    '''
+    raises ValueError listing the endpoints that changed a dataset,
+    or whose field report differs from the batch report.
+    '''
+    before = make_resident(n_items)
+    fields = {item_type: server.fields_endpoint({"item_type": item_type})[:n_fields]
+              for item_type in synthetic.FNAME_MAPPING_TABLE}
+
+    problems = []
+    for route, params in calls(fields):
+        print("%s %s" % (route, params))
+        server.ROUTES[route](params)
+        for name, documents in before.items():
+            if server._STATE["datasets"][name] != documents: # pylint: disable=protected-access
+                problems.append("%s %s changed the %s dataset" % (route, params, name))
+                server._STATE["datasets"][name] = copy.deepcopy(documents) # pylint: disable=protected-access
+
+    for item_type, item_fields in fields.items():
+        converters = mapping_table_registry.get_converters(synthetic.FNAME_MAPPING_TABLE[item_type])
+        for field in item_fields:
+            batch = investigate_variants.field_report(before[item_type], field,
+                                                      converter=converters.get(field))["stats"]
+            served = server.field_report_endpoint({"item_type": item_type, "field": field})
+            if not same_stats(batch, served):
+                problems.append("/field_report of %s %s differs from the batch report" % (
+                    item_type, field))
+
+    if len(problems) > 0:
+        raise ValueError("\n".join(problems))
+    print("ok: %d endpoint calls left the datasets unchanged" % len(calls(fields)))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    PARSER.add_argument("--n_items", type=int, default=N_ITEMS)
+    ARGS = PARSER.parse_args()
+    check(ARGS.n_items)
@@ -0,0 +1,226 @@
+"""
+Synthetic VariantSample and Gene documents, shaped like snovault search results,
+following the fields of the mapping tables.
+
+- every do_import=Y field of the mapping table gets a value, with probability fill_rate
+- fields in a sub embedding group (e.g. transcript, genes) live in a list of list_length dicts
+- is_list fields get list_length values
+- strings take one of <cardinality> values (or a value from enum_list), numbers respect min/max
+- variant samples are made to look like a trio (samplegeno, CHROM, POS, GT, AD, DP, GQ, novoPP),
+  so that inheritance_mode can run on them. The child genotype is inherited from the parents
+  (see trio_genotypes), so relatedness.check_roles accepts the trio.
+
+e.g.
+    variants = generate_documents("variant", 10000)
+    write_documents("gene", 100000, "/tmp/genes.json")
+"""
+
+from os import path
+import json
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import base
+sys.path.append(path.join(base.ROOT_DIR, "code", "annotations"))
+import mapping_table_registry # pylint: disable=wrong-import-position
+
+
+FNAME_MAPPING_TABLE = {
+    "variant": mapping_table_registry.FNAME_MAPPING_TABLE_VARIANT,
+    "gene": mapping_table_registry.FNAME_MAPPING_TABLE_GENE
+}
+
+TRIO = [("NA12877_sample", "father", "male"),
+        ("NA12878_sample", "mother", "female"),
+        ("NA12879_sample", "self", "female")]
+GENOTYPES = ["0/0", "0/1", "1/1"]
+GENOTYPE_FREQUENCIES = [0.3, 0.45, 0.25]
+ALT_FREQUENCY = GENOTYPE_FREQUENCIES[1]/2 + GENOTYPE_FREQUENCIES[2]
+DE_NOVO_RATE = 0.001
+GENOTYPE_ERROR_RATE = 0.002
+CHROMS = [str(i) for i in range(1, 23)] + ["X", "Y", "M"]
+
+# fields where made up values would not mean anything downstream
+FIELD_CHOICES = {
+    "variant.genes.genes_most_severe_consequence.impact": ["HIGH", "MODERATE", "LOW", "MODIFIER"],
+    "variant.genes.genes_most_severe_consequence.display_title": [
+        "missense_variant", "synonymous_variant", "intron_variant", "stop_gained",
+        "frameshift_variant", "splice_region_variant", "3_prime_UTR_variant"],
+    "cmphet.comhet_phase": ["Phased", "Unphased"],
+    "cmphet.comhet_impact_gene": ["STRONG_PAIR", "MEDIUM_PAIR", "WEAK_PAIR"]
+}
+
+
+def value_drawer(field, row, cardinality, rng):
+    '''
+    returns a function(n) -> list of n values for field, based on its mapping table row.
+    '''
+    field_type = row["field_type"]
+    if field in FIELD_CHOICES:
+        return lambda n: rng.choice(FIELD_CHOICES[field], n).tolist()
+    if pd.notna(row["enum_list"]):
+        choices = [value.strip() for value in re.split("[,;]", row["enum_list"])]
+        return lambda n: rng.choice(choices, n).tolist()
+    if field_type == "integer":
+        low = int(row["min"]) if pd.notna(row["min"]) else 0
+        high = int(row["max"]) if pd.notna(row["max"]) else low + 10*cardinality
+        return lambda n: rng.integers(low, high + 1, n).tolist()
+    if field_type == "number":
+        low = float(row["min"]) if pd.notna(row["min"]) else 0.
+        high = float(row["max"]) if pd.notna(row["max"]) else 1.
+        return lambda n: rng.uniform(low, high, n).tolist()
+    if field_type == "boolean":
+        return lambda n: (rng.random(n) < 0.5).tolist()
+    name = field.split(".")[-2] if field.endswith(".display_title") else field.split(".")[-1]
+    dictionary = np.array(["%s_%d" % (name, i) for i in range(cardinality)], dtype=object)
+    return lambda n: dictionary[rng.integers(0, cardinality, n)].tolist()
+
+
+def compile_fields(item_type, list_length, cardinality, rng):
+    '''
+    [(parts, igroup, is_list, draw)] for each do_import=Y field, where
+    parts is the field split on ".", and parts[igroup] is its sub embedding group (if any).
+    '''
+    map_table = mapping_table_registry.load_mapping_table(FNAME_MAPPING_TABLE[item_type])
+    compiled = []
+    for field, row in map_table.iterrows():
+        igroup = None
+        if pd.notna(row["sub_embedding_group"]):
+            igroup = 1 if row["scope"] == "variant" else 0
+        compiled.append((field.split("."), igroup, row["is_list"] == "Y",
+                         value_drawer(field, row, cardinality, rng)))
+    return compiled
+
+
+def _set(parent, parts, value):
+    for key in parts[:-1]:
+        parent = parent.setdefault(key, {})
+    parent[parts[-1]] = value
+
+
+def transmitted_allele(dosage, rng):
+    '''
+    one allele (0 ref, 1 alt) of a genotype with dosage alt alleles, picked at random.
+    '''
+    return int(rng.random() < dosage/2)
+
+
+def trio_genotypes(chrom, rng):
+    '''
+    genotypes of father, mother and child (in the order of TRIO) at a site on chrom.
+    the child gets one allele from each parent, and the father is hemizygous on X and Y.
+    the child of TRIO is female: no Y, and chrM comes from the mother.
+    then the child gets an alt allele de novo with DE_NOVO_RATE,
+    and each genotype is redrawn with GENOTYPE_ERROR_RATE.
+    '''
+    father, mother = rng.choice(3, 2, p=GENOTYPE_FREQUENCIES)
+    if chrom in ("X", "Y", "M"):
+        father = 2*int(rng.random() < ALT_FREQUENCY)
+    if chrom == "M":
+        mother = 2*int(rng.random() < ALT_FREQUENCY)
+        child = mother
+    elif chrom == "Y":
+        mother = child = 0
+    else:
+        child = transmitted_allele(father, rng) + transmitted_allele(mother, rng)
+        if child < 2 and rng.random() < DE_NOVO_RATE:
+            child += 1
+    dosages = [father, mother, child]
+    for isample in range(3):
+        if rng.random() < GENOTYPE_ERROR_RATE:
+            dosages[isample] = rng.choice(3, p=GENOTYPE_FREQUENCIES)
+    return [GENOTYPES[dosage] for dosage in dosages]
+
+
+def trio_fields(doc, i, rng):
+    '''
+    overwrite the fields inheritance_mode and the trio tables rely on.
+    '''
+    variant = doc.setdefault("variant", {})
+    variant["CHROM"] = CHROMS[rng.integers(0, len(CHROMS))]
+    genotypes = trio_genotypes(variant["CHROM"], rng)
+    depths = rng.integers(0, 40, (3, 2))
+    doc["samplegeno"] = [{
+        "samplegeno_sampleid": sampleid,
+        "samplegeno_numgt": genotype,
+        "samplegeno_gt": genotype.replace("0", "A").replace("1", "T"),
+        "samplegeno_ad": "%d/%d" % tuple(depth)
+    } for (sampleid, _, _), genotype, depth in zip(TRIO, genotypes, depths)]
+    variant["POS"] = int(rng.integers(1, 250000000))
+    variant["display_title"] = "chr%s:%d%s>%s" % (variant["CHROM"], variant["POS"], "A", "T")
+    doc["CALL_INFO"] = TRIO[2][0]
+    doc["GT"] = genotypes[2]
+    doc["AD"] = doc["samplegeno"][2]["samplegeno_ad"]
+    doc["DP"] = int(depths[2].sum())
+    doc["GQ"] = int(rng.integers(0, 100))
+    # novoPP is only ever 0 or -1 on sex chromosomes
+    if variant["CHROM"] in ("X", "Y"):
+        doc["novoPP"] = float(rng.choice([0, -1]))
+    else:
+        doc["novoPP"] = float(rng.choice([0, 0, 0, 0.05, 0.5, 0.95]))
+    doc["uuid"] = "synthetic-variant-%d" % i
+    # compound het calls come as whole records, or not at all
+    doc["cmphet"] = [cmphet for cmphet in doc.get("cmphet", [])
+                     if "comhet_phase" in cmphet and "comhet_impact_gene" in cmphet]
+    if len(doc["cmphet"]) == 0:
+        doc.pop("cmphet")
+
+
+def generate_documents(item_type, n_items, list_length=3, cardinality=100, fill_rate=0.9,
+                       seed=0, start=0):
+    '''
+    list of n_items synthetic documents of item_type (variant or gene).
+    start offsets the uuids, so that chunks can be generated separately.
+    '''
+    rng = np.random.default_rng(seed + start)
+    compiled = compile_fields(item_type, list_length, cardinality, rng)
+    docs = [{} for _ in range(n_items)]
+
+    for parts, igroup, is_list, draw in compiled:
+        n_group = list_length if igroup is not None else 1
+        n_list = list_length if is_list else 1
+        values = draw(n_items*n_group*n_list)
+        filled = rng.random(n_items) < fill_rate
+        ivalue = 0
+        for doc, is_filled in zip(docs, filled):
+            ivalue += n_group*n_list
+            if not is_filled:
+                continue
+            for igroup_element in range(n_group):
+                first = ivalue - (n_group - igroup_element)*n_list
+                value = values[first:first + n_list] if is_list else values[first]
+                if igroup is None:
+                    _set(doc, parts, value)
+                    continue
+                group = doc
+                for key in parts[:igroup]:
+                    group = group.setdefault(key, {})
+                group = group.setdefault(parts[igroup], [{} for _ in range(n_group)])
+                _set(group[igroup_element], parts[igroup + 1:], value)
+
+    for i, doc in enumerate(docs):
+        if item_type == "variant":
+            trio_fields(doc, start + i, rng)
+        else:
+            doc["uuid"] = "synthetic-gene-%d" % (start + i)
+    return docs
+
+
+def write_documents(item_type, n_items, fname, chunk_size=10000, **kwargs):
+    '''
+    generate n_items documents chunk_size at a time, and write them to fname as a json list,
+    without holding all of them in memory.
+    '''
+    with open(fname, "w") as outf:
+        outf.write("[")
+        for start in range(0, n_items, chunk_size):
+            docs = generate_documents(item_type, min(chunk_size, n_items - start),
+                                      start=start, **kwargs)
+            for i, doc in enumerate(docs):
+                if start + i > 0:
+                    outf.write(", ")
+                json.dump(doc, outf)
+        outf.write("]")
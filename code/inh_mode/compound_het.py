@@ -0,0 +1,196 @@
+"""
+Compound heterozygote calls recomputed from the trio genotypes,
+in the same format as the upstream "cmphet" field, so that inheritance_mode can use either.
+
+A variant qualifies if the proband is a biallelic het on it.
+Its origin is
+    mother:  mother has the alt allele, father does not
+    father:  father has the alt allele, mother does not
+    unknown: anything else (both parents have it, de novo, missing calls)
+and per gene, its impact is strong if genes_most_severe_consequence.impact is in STRONG_IMPACTS.
+
+Two qualifying variants on the same gene are a compound het unless they come from the same parent:
+    phase is Phased if one comes from each parent, Unphased if either origin is unknown;
+    impact is STRONG_PAIR if both are strong, MEDIUM_PAIR if one is, WEAK_PAIR otherwise.
+
+Pairs are never listed: (gene, origin, impact) combinations are counted once per gene,
+so every variant gets its possible (phase, impact) calls from the counts of its partners,
+and the cost is linear in the number of (variant, gene) entries.
+"""
+
+from os import path
+
+import numpy as np
+
+from my_utils import categorical, ndjson_shards, tracing
+import inheritance_mode
+import inheritance_mode_table
+import trio_qc
+
+GENE_KEY = "genes_ensg"
+IMPACT_KEY = "genes_most_severe_consequence"
+STRONG_IMPACTS = ["HIGH", "MODERATE"]
+
+ORIGINS = ["mother", "father", "unknown"]
+ORIGIN_MOTHER, ORIGIN_FATHER, ORIGIN_UNKNOWN = range(3)
+PHASES = ["Phased", "Unphased"]
+IMPACT_PAIRS = ["STRONG_PAIR", "MEDIUM_PAIR", "WEAK_PAIR"]
+
+# PHASE_OF_ORIGINS[origin, origin of partner]: index in PHASES, -1 for cis (same parent)
+PHASE_OF_ORIGINS = np.array([[-1, 0, 1],
+                             [0, -1, 1],
+                             [1, 1, 1]])
+# IMPACT_OF_STRENGTHS[strong, strong partner]: index in IMPACT_PAIRS
+IMPACT_OF_STRENGTHS = np.array([[2, 1],
+                                [1, 0]])
+
+
+def _display_title(value):
+    if isinstance(value, dict):
+        return value.get("display_title")
+    return value
+
+
+@tracing.traced(count=lambda entries: len(entries["variant"]))
+def gene_entries(variants, role_of_id=inheritance_mode_table.ROLE_OF_ID):
+    '''
+    one entry per (qualifying variant, gene), a gene listed several times on a variant
+    (e.g. for several transcripts) is one entry, strong if any of its listings is:
+    {"variant": offset in variants, "gene_codes", "genes": gene dictionary,
+     "origin": ORIGIN_*, "strong": bool}
+    '''
+    variant_offsets = []
+    gene_ids = []
+    strong = []
+    genotypes = {role: [] for role in ["mother", "father", "self"]}
+    for ivariant, variant in enumerate(variants):
+        genes = variant.get("variant", {}).get("genes", [])
+        if len(genes) == 0:
+            continue
+        genotype = {role_of_id[sample_geno["samplegeno_sampleid"]]: sample_geno["samplegeno_numgt"]
+                    for sample_geno in variant.get("samplegeno", [])}
+        seen = {}
+        for gene in genes:
+            gene_id = _display_title(gene.get(GENE_KEY))
+            if gene_id is None:
+                continue
+            is_strong = gene.get(IMPACT_KEY, {}).get("impact") in STRONG_IMPACTS
+            if gene_id in seen:
+                strong[seen[gene_id]] |= is_strong
+                continue
+            seen[gene_id] = len(gene_ids)
+            variant_offsets.append(ivariant)
+            gene_ids.append(gene_id)
+            strong.append(is_strong)
+            for role, role_genotypes in genotypes.items():
+                role_genotypes.append(genotype.get(role, "./."))
+
+    dosage = {}
+    multiallelic = np.zeros(len(gene_ids), dtype=bool)
+    for role, role_genotypes in genotypes.items():
+        codes, dictionary = categorical.encode(role_genotypes)
+        dictionary_dosage, dictionary_multiallelic = trio_qc.parse_genotypes(dictionary)
+        dosage[role] = np.append(dictionary_dosage, trio_qc.MISSING)[codes]
+        multiallelic |= np.append(dictionary_multiallelic, False)[codes]
+
+    qualifying = (dosage["self"] == 1) & ~multiallelic
+    origin = np.full(len(gene_ids), ORIGIN_UNKNOWN, dtype=np.int8)
+    origin[(dosage["mother"] > 0) & (dosage["father"] == 0)] = ORIGIN_MOTHER
+    origin[(dosage["father"] > 0) & (dosage["mother"] == 0)] = ORIGIN_FATHER
+
+    gene_codes, genes = categorical.encode(np.array(gene_ids, dtype=object)[qualifying])
+    return {
+        "variant": np.array(variant_offsets, dtype=int)[qualifying],
+        "gene_codes": gene_codes,
+        "genes": genes,
+        "origin": origin[qualifying],
+        "strong": np.array(strong, dtype=bool)[qualifying]
+    }
+
+
+@tracing.traced()
+def compound_het_calls(entries):
+    '''
+    entries from gene_entries.
+    returns a boolean array calls[entry, phase, impact pair]:
+    entry has at least one partner on its gene giving that (phase, impact pair).
+    '''
+    n_classes = 2*len(ORIGINS)
+    entry_class = 2*entries["origin"] + entries["strong"]
+    # members of each (gene, origin, strength) class
+    counts = np.bincount(entries["gene_codes"]*n_classes + entry_class,
+                         minlength=len(entries["genes"])*n_classes)
+    counts = counts.reshape(len(entries["genes"]), n_classes)
+
+    partners = counts[entries["gene_codes"]]
+    partners[np.arange(len(entry_class)), entry_class] -= 1
+
+    calls = np.zeros((len(entry_class), len(PHASES), len(IMPACT_PAIRS)), dtype=bool)
+    for partner_class in range(n_classes):
+        partner_origin, partner_strong = divmod(partner_class, 2)
+        phase = PHASE_OF_ORIGINS[entries["origin"], partner_origin]
+        impact = IMPACT_OF_STRENGTHS[entries["strong"].astype(int), partner_strong]
+        has_call = (partners[:, partner_class] > 0) & (phase >= 0)
+        calls[np.flatnonzero(has_call), phase[has_call], impact[has_call]] = True
+    return calls
+
+
+def compute_cmphet(variants, role_of_id=inheritance_mode_table.ROLE_OF_ID):
+    '''
+    list (one per variant) of cmphet lists, like the upstream field:
+    [{"comhet_gene": ..., "comhet_phase": ..., "comhet_impact_gene": ...}], or None
+    '''
+    entries = gene_entries(variants, role_of_id)
+    calls = compound_het_calls(entries)
+    cmphet = [None] * len(variants)
+    for ientry, iphase, iimpact in zip(*np.nonzero(calls)):
+        ivariant = entries["variant"][ientry]
+        if cmphet[ivariant] is None:
+            cmphet[ivariant] = []
+        cmphet[ivariant].append({
+            "comhet_gene": entries["genes"][entries["gene_codes"][ientry]],
+            "comhet_phase": PHASES[iphase],
+            "comhet_impact_gene": IMPACT_PAIRS[iimpact]
+        })
+    return cmphet
+
+
+def annotate_cmphet(variants, role_of_id=inheritance_mode_table.ROLE_OF_ID):
+    '''
+    replace the upstream cmphet field of every variant by compute_cmphet, in place,
+    so that inheritance_mode, genotype_table and trio_qc use the recomputed calls.
+    returns the number of variants with a compound het call.
+    '''
+    n_cmphet = 0
+    for variant, cmphet in zip(variants, compute_cmphet(variants, role_of_id)):
+        if cmphet is None:
+            variant.pop("cmphet", None)
+            continue
+        variant["cmphet"] = cmphet
+        n_cmphet += 1
+    return n_cmphet
+
+
+def compare_with_upstream(variants, role_of_id=inheritance_mode_table.ROLE_OF_ID):
+    '''
+    count variants where the recomputed "Compound Het (phase/impact)" labels
+    agree or not with the ones from the upstream cmphet field.
+    returns {"same": n, "different": n, "examples": [(offset, upstream, recomputed)]}
+    '''
+    result = {"same": 0, "different": 0, "examples": []}
+    for ivariant, (variant, cmphet) in enumerate(zip(variants,
+                                                     compute_cmphet(variants, role_of_id))):
+        upstream = inheritance_mode.inheritance_modes_cmphet(variant.get("cmphet"))
+        recomputed = inheritance_mode.inheritance_modes_cmphet(cmphet)
+        if upstream == recomputed:
+            result["same"] += 1
+            continue
+        result["different"] += 1
+        if len(result["examples"]) < 10:
+            result["examples"].append((ivariant, upstream, recomputed))
+    return result
+
+
+if __name__ == '__main__':
+    print(compare_with_upstream(ndjson_shards.read(
+        path.join(inheritance_mode_table.DATA_DIR, "variants_NA12879.json"))))
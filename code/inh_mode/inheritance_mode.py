@@ -2,6 +2,8 @@
 given family genotypes and other info from variant, calculate inheritance mode.
 """
 
+from my_utils import tracing
+
 GENOTYPE_LABEL_DOT = "Missing"
 GENOTYPE_LABEL_00 = "Homozygus reference"
 GENOTYPE_LABEL_0M = "Heterozygous"
@@ -236,7 +238,8 @@ def inheritance_modes_cmphet(cmphet):
     return inheritance_modes
 
 
-def inheritance_mode(variant):
+@tracing.traced(memory=False)
+def inheritance_mode(variant, low_depth=False):
     """
     variant is a sampleVariant item, including the samplegeno_role and samplegeno_sex fields.
 
@@ -269,6 +272,9 @@ def inheritance_mode(variant):
         "genotype_label_proband" : het alt
 
     sex-mismatched genotypes get a "false" value, e.g. 0/1 on chrX for a male
+
+    if low_depth is True (see quality_gate), the rules are skipped,
+    and inheritance_modes is [INHMODE_LABEL_NONE_LOWDEPTH]
     """
 
     sample_geno = variant.get("samplegeno")
@@ -287,10 +293,13 @@ def inheritance_mode(variant):
         raise ValueError('variant["samplegeno"]["samplegeno_role"]="self" is missing')
 
     genotype_label = genotype_to_genotype_label_family(genotype, sex, chrom)
-    inheritance_modes = inheritance_modes_trio(genotype, genotype_label, sex, chrom, novoPP)
-    inheritance_modes += inheritance_modes_cmphet(cmphet)
-    if len(inheritance_modes) == 0:
-        inheritance_modes = inheritance_modes_other_labels(genotype, genotype_label)
+    if low_depth:
+        inheritance_modes = [INHMODE_LABEL_NONE_LOWDEPTH]
+    else:
+        inheritance_modes = inheritance_modes_trio(genotype, genotype_label, sex, chrom, novoPP)
+        inheritance_modes += inheritance_modes_cmphet(cmphet)
+        if len(inheritance_modes) == 0:
+            inheritance_modes = inheritance_modes_other_labels(genotype, genotype_label)
 
     result = {
         "genotype_label": genotype_label,
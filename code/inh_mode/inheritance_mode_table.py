@@ -11,17 +11,24 @@ This module provides some examples for incfheritance_mode.
 """
 
 from os import path
-import json
 from urllib.parse import urlencode
 
 import pandas as pd
 
+from my_utils import columnar, external_sort, ndjson_shards, tracing
 import inheritance_mode
+import quality_gate
+import relatedness
 import base
 
 DATA_DIR = path.join(base.ROOT_DIR, "data")
 
-def all_scenarios_table():
+SCENARIO_COLUMNS = ["genotype_mother", "genotype_father", "genotype_self", "condition",
+                    "genotype_label_mother", "genotype_label_father", "genotype_label_self",
+                    "inheritance_modes"]
+
+
+def all_scenarios_table(formats=("tsv",)):
     """
     loop through scenarios for
     - mother genotype, father genotype, child genotype [0/0, 0/1, 1/1]
@@ -31,6 +38,7 @@ def all_scenarios_table():
 
     and create a table for output of inheritance_mode, output as tsv:
     "<DATA_DIR>all_scenarios_table.tsv"
+    and as parquet / feather if in formats, see my_utils.columnar
     """
 
     variant = {
@@ -55,7 +63,7 @@ def all_scenarios_table():
     }
 
     genotypes = ["0/0", "0/1", "1/1"]
-    rows = []
+    table = columnar.ColumnBuffers(SCENARIO_COLUMNS, list_columns=["inheritance_modes"])
     for genotype_mother in genotypes:
         for genotype_father in genotypes:
             for genotype_self in genotypes:
@@ -86,69 +94,75 @@ def all_scenarios_table():
                     variant["samplegeno"][2]["samplegeno_numgt"] = genotype_father
 
                     result = inheritance_mode.inheritance_mode(variant)
-                    result["genotype_mother"] = genotype_mother
-                    result["genotype_father"] = genotype_father
-                    result["genotype_self"] = genotype_self
-                    result["condition"] = condition
-                    for role in ["mother", "father", "self"]:
-                        result["genotype_label_" + role] = result["genotype_label"][role]
-                    result.pop("genotype_label")
-                    rows.append(result)
-
-    dataframe = pd.DataFrame(rows, columns=["genotype_mother", "genotype_father",
-                                            "genotype_self", "condition",
-                                            "genotype_label_mother", "genotype_label_father",
-                                            "genotype_label_self", "inheritance_modes"])
-    dataframe.to_csv(path.join(DATA_DIR, "all_scenarios_table.tsv"), sep="\t", index=False)
-
-
-def NA12879_table():
-    """
-    call inheritance_mode for each variant in "<DATA_DIR>/variants_NA12879.json"
-    and create a table for output of inheritance_mode, output as tsv:
-    "<DATA_DIR>NA12879_genotype_table.tsv"
+                    genotype_label = result["genotype_label"]
+                    table.append((genotype_mother, genotype_father, genotype_self, condition,
+                                  genotype_label["mother"], genotype_label["father"],
+                                  genotype_label["self"], result["inheritance_modes"]))
 
-    1/1 becomes Jan 1 in excel.
-    Let's just add a "'" in front of gt columns if for_excel is true.
+    table.write(path.join(DATA_DIR, "all_scenarios_table"), formats)
+
+
+ROLE_OF_ID = {
+    'NA12878_sample': "mother",
+    'NA12877_sample': "father",
+    'NA12879_sample': "self"
+}
+
+
+def with_roles(variant, role_of_id=ROLE_OF_ID):
     """
-    sample = "NA12879"
-    filename_variant = path.join(DATA_DIR, "variants_%s.json" % sample)
-    file_variant = open(filename_variant) ## let it raise an error if file is missing.
-    variants = json.load(file_variant)
+    shallow copy of variant where every samplegeno has samplegeno_role and samplegeno_sex,
+    as inheritance_mode expects them. father is male, everyone else female.
+    variant itself is left untouched, it may be shared (e.g. by server.py).
+    """
+    sample_genos = []
+    for sample_geno in variant.get("samplegeno"):
+        role = role_of_id[sample_geno['samplegeno_sampleid']]
+        sample_genos.append(dict(sample_geno, samplegeno_role=role,
+                                 samplegeno_sex="male" if role == "father" else "female"))
+    return dict(variant, samplegeno=sample_genos)
+
+
+COLUMN_ORDER = ["GT_mother", "GT_father", "GT_self", "chrom", "novoPP",
+                "AD_mother", "AD_father", "AD_self", "title",
+                "DP", "GQ",
+                "GT_label_mother", "GT_label_father",
+                "GT_label_self", "inheritance_modes"]
+SORT_BY = ['chrom', 'GT_mother', 'GT_father', 'GT_self', 'novoPP']
+SORT_ASCENDING = [field != 'novoPP' for field in SORT_BY]
+EXCEL_QUOTED = ['GT_mother', 'GT_father', 'GT_self', 'AD_mother', 'AD_father', 'AD_self']
 
-    role_of_id = {
-        'NA12878_sample': "mother",
-        'NA12877_sample': "father",
-        'NA12879_sample': "self"
-    }
 
-    column_order = ["GT_mother", "GT_father", "GT_self", "chrom", "novoPP",
-                    "AD_mother", "AD_father", "AD_self", "title",
-                    "DP", "GQ",
-                    "GT_label_mother", "GT_label_father",
-                    "GT_label_self", "inheritance_modes"]
+def genotype_values(variants, role_of_id=ROLE_OF_ID, thresholds=None):
+    """
+    call inheritance_mode for each variant and yield one tuple per variant, in COLUMN_ORDER
+    (None for the columns of a role missing from the variant).
+    if thresholds are given (see quality_gate.THRESHOLDS), variants failing the quality gate
+    are labeled low depth without going through the inheritance mode rules.
+    """
+    passed = None
+    if thresholds is not None:
+        passed, report = quality_gate.quality_gate(variants, role_of_id, thresholds)
+        quality_gate.print_report(report)
 
-    rows = []
-    for variant in variants:
+    roles = ["mother", "father", "self"]
+    for ivariant, variant in enumerate(variants):
         sample_geno = variant.get("samplegeno")
 
-        for i in range(len(sample_geno)):
-            role = role_of_id[sample_geno[i]['samplegeno_sampleid']]
-            sample_geno[i]["samplegeno_role"] = role
-            sample_geno[i]["samplegeno_sex"] = "male" if role == "father" else "female"
-        inh_mod_result = inheritance_mode.inheritance_mode(variant)
+        low_depth = passed is not None and not passed[ivariant]
+        inh_mod_result = inheritance_mode.inheritance_mode(with_roles(variant, role_of_id),
+                                                           low_depth=low_depth)
 
-        output = {}
+        genotype = {}
+        allele_depth = {}
         for isample_geno in sample_geno:
             role = role_of_id[isample_geno['samplegeno_sampleid']]
-            output["GT_" + role] = isample_geno["samplegeno_numgt"]
-            output["AD_" + role] = isample_geno["samplegeno_ad"]
-            output["GT_label_" + role] = inh_mod_result["genotype_label"][role]
+            genotype[role] = isample_geno["samplegeno_numgt"]
+            allele_depth[role] = isample_geno["samplegeno_ad"]
+        genotype_label = inh_mod_result["genotype_label"]
         chrom = "chr" + variant.get("variant", {}).get("CHROM")
         if not chrom in ["chrX", "chrY"]:
             chrom = "autosome"
-        output["chrom"] = chrom
-        output["novoPP"] = variant.get("novoPP")
 
         title = variant["variant"]["display_title"]
         params = {
@@ -159,25 +173,104 @@ def NA12879_table():
         }
         base_url = "http://fourfront-cgaptest.9wzadzju3p.us-east-1.elasticbeanstalk.com/search/"
         link = "%s?%s" % (base_url, urlencode(params))
-        output["title"] = '=hyperlink("%s","%s")' % (link, title)
-        
-        output["DP"] = variant["DP"]
-        output["GQ"] = variant["GQ"]
-        output["inheritance_modes"] = inh_mod_result["inheritance_modes"]
-
-        rows.append(output)
-
-    dataframe = pd.DataFrame(rows, columns=column_order)
-    sort_by = ['chrom', 'GT_mother', 'GT_father', 'GT_self', 'novoPP']
-    sort_ascending = [field != 'novoPP' for field in sort_by]
-    dataframe.sort_values(by=sort_by, ascending=sort_ascending, inplace=True)
+
+        yield tuple([genotype.get(role) for role in roles]
+                    + [chrom, variant.get("novoPP")]
+                    + [allele_depth.get(role) for role in roles]
+                    + ['=hyperlink("%s","%s")' % (link, title), variant["DP"], variant["GQ"]]
+                    + [genotype_label.get(role) if role in genotype else None for role in roles]
+                    + [inh_mod_result["inheritance_modes"]])
+
+
+def genotype_rows(variants, role_of_id=ROLE_OF_ID, thresholds=None):
+    """
+    genotype_values as one row (dict) per variant.
+    """
+    for values in genotype_values(variants, role_of_id, thresholds):
+        yield dict(zip(COLUMN_ORDER, values))
+
+
+@tracing.traced(count=len)
+def genotype_table(variants, role_of_id=ROLE_OF_ID, thresholds=None):
+    """
+    rows of genotype_rows as a pandas data frame, sorted by chrom and genotypes.
+    """
+    dataframe = pd.DataFrame(list(genotype_rows(variants, role_of_id, thresholds)),
+                             columns=COLUMN_ORDER)
+    dataframe.sort_values(by=SORT_BY, ascending=SORT_ASCENDING, inplace=True)
     dataframe.index=range(len(dataframe.index))
-    
-    for field in ['GT_mother', 'GT_father', 'GT_self', 'AD_mother', 'AD_father', 'AD_self']:
-        dataframe[field] = "'" + dataframe[field]
+    return dataframe
+
+
+@tracing.traced()
+def write_genotype_table(variants, fname_base, role_of_id=ROLE_OF_ID, thresholds=None,
+                         run_size=external_sort.RUN_SIZE, formats=("tsv",),
+                         batch_size=columnar.BATCH_SIZE):
+    """
+    same file as genotype_table(...) with "'" in front of EXCEL_QUOTED columns,
+    written as "<fname_base>.tsv", and as "<fname_base>.parquet" / ".feather" if in formats
+    (there the genotypes are kept as they are, see my_utils.columnar).
+    rows are sorted in runs of run_size rows spilled to temporary files, then merged,
+    and the merged rows go to parquet / feather in batches of batch_size rows,
+    so only one run or one batch of rows is held in memory at a time.
+    returns the number of rows.
+    """
+    sorter = external_sort.ExternalSorter(COLUMN_ORDER, SORT_BY, SORT_ASCENDING, run_size)
+    for row in genotype_rows(variants, role_of_id, thresholds):
+        sorter.add(row)
+
+    columnar_formats = [file_format for file_format in formats if file_format != "tsv"]
+    batch = None
+    writers = None
+    if columnar_formats:
+        batch = columnar.ColumnBuffers(COLUMN_ORDER, sorter.column_kinds(),
+                                       list_columns=["inheritance_modes"])
+        writers = columnar.TableWriters(fname_base, columnar_formats, batch.schema())
+
+    def add_to_batch(row):
+        batch.append(tuple(row.get(column) for column in COLUMN_ORDER))
+        if batch.n_rows >= batch_size:
+            writers.write_batch(batch)
+            batch.clear()
+
+    if "tsv" in formats:
+        fname = fname_base + columnar.FORMATS["tsv"]
+        print("writing %s" % fname)
+        sorter.write_tsv(fname, {field: lambda value: "'" + value for field in EXCEL_QUOTED},
+                         on_row=add_to_batch if batch is not None else None)
+    elif batch is not None:
+        for row in sorter.sorted_rows():
+            add_to_batch(row)
+    if writers is not None:
+        writers.write_batch(batch)
+        writers.close()
+    return sorter.n_rows
+
+
+def NA12879_table(formats=None, thresholds=None):
+    """
+    call inheritance_mode for each variant in "<DATA_DIR>/variants_NA12879.json"
+    and create a table for output of inheritance_mode, output as tsv:
+    "<DATA_DIR>NA12879_genotype_table.tsv"
+    and as parquet / feather, if formats (default: all available, see my_utils.columnar) has them.
+    with thresholds (e.g. quality_gate.THRESHOLDS), calls failing the quality gate
+    are labeled low depth; by default there is no gate.
+
+    1/1 becomes Jan 1 in excel.
+    Let's just add a "'" in front of gt columns if for_excel is true.
+    """
+    sample = "NA12879"
+    filename_variant = path.join(DATA_DIR, "variants_%s.json" % sample)
+    ## let it raise an error if file is missing.
+    variants = ndjson_shards.read(filename_variant)
 
-    dataframe.to_csv(path.join(DATA_DIR, "NA12879_genotype_table.tsv"), sep="\t")
+    # swapped sample ids would silently give wrong inheritance modes
+    relatedness.check_roles(variants, ROLE_OF_ID)
+    if formats is None:
+        formats = columnar.available_formats()
+    write_genotype_table(variants, path.join(DATA_DIR, "NA12879_genotype_table"),
+                         thresholds=thresholds, formats=formats)
 
 if __name__ == '__main__':
-    all_scenarios_table()
+    all_scenarios_table(columnar.available_formats())
     NA12879_table()
@@ -0,0 +1,119 @@
+"""
+Quality gate in front of inheritance_mode: variants with too little evidence get
+INHMODE_LABEL_NONE_LOWDEPTH instead of going through the rules,
+which would otherwise turn low coverage parents into de novo (weak) calls.
+
+The checks are computed as masks over all variants at once:
+    DP          DP of the variant sample (proband) >= THRESHOLDS["DP"]
+    GQ          GQ of the variant sample (proband) >= THRESHOLDS["GQ"]
+    depth_<role> sum of samplegeno_ad of that role >= THRESHOLDS["role_depth"][role]
+A threshold of None turns its check off. Missing values are not checked:
+a no-call without AD keeps its usual label, and the report counts missing values per check.
+"""
+
+import numpy as np
+
+from my_utils import categorical, tracing
+
+THRESHOLDS = {
+    "DP": 10,
+    "GQ": 20,
+    "role_depth": {"self": 10, "mother": 10, "father": 10}
+}
+
+
+def allele_depth_sum(allele_depths):
+    '''
+    "12/3" or "12,3" -> 15, anything unparsable -> nan
+    '''
+    allele_depths = np.asarray(allele_depths, dtype=object)
+    total = np.full(len(allele_depths), np.nan)
+    for i, allele_depth in enumerate(allele_depths):
+        try:
+            total[i] = sum(int(depth) for depth in str(allele_depth).replace(",", "/").split("/"))
+        except ValueError:
+            continue
+    return total
+
+
+@tracing.traced(count=lambda quality: len(quality["DP"]))
+def quality_arrays(variants, role_of_id):
+    '''
+    {"DP": array, "GQ": array, "depth_<role>": array} over variants, nan where missing.
+    '''
+    roles = sorted(set(role_of_id.values()))
+    allele_depths = {role: [] for role in roles}
+    depth = []
+    quality = []
+    for variant in variants:
+        depth.append(variant.get("DP"))
+        quality.append(variant.get("GQ"))
+        role_allele_depth = {role_of_id.get(sample_geno.get("samplegeno_sampleid")):
+                             sample_geno.get("samplegeno_ad")
+                             for sample_geno in variant.get("samplegeno", [])}
+        for role in roles:
+            allele_depths[role].append(role_allele_depth.get(role))
+
+    quality_values = {
+        "DP": np.array([np.nan if value is None else value for value in depth], dtype=float),
+        "GQ": np.array([np.nan if value is None else value for value in quality], dtype=float)
+    }
+    for role in roles:
+        # few distinct AD strings: parse each once
+        codes, dictionary = categorical.encode(allele_depths[role])
+        quality_values["depth_" + role] = np.append(allele_depth_sum(dictionary), np.nan)[codes]
+    return quality_values
+
+
+def failed_masks(quality_values, thresholds=None):
+    '''
+    {check: boolean array, True where the variant fails check}, for every check that is on.
+    a missing (nan) value does not fail.
+    '''
+    if thresholds is None:
+        thresholds = THRESHOLDS
+    checks = {"DP": thresholds.get("DP"), "GQ": thresholds.get("GQ")}
+    for role, min_depth in thresholds.get("role_depth", {}).items():
+        checks["depth_" + role] = min_depth
+
+    masks = {}
+    for check, minimum in checks.items():
+        if minimum is None or check not in quality_values:
+            continue
+        with np.errstate(invalid="ignore"):
+            masks[check] = quality_values[check] < minimum
+    return masks
+
+
+def quality_gate(variants, role_of_id, thresholds=None):
+    '''
+    returns passed (boolean array over variants) and a report:
+    {"thresholds": ..., "n_variants": n, "n_failed": n, "n_failed_<check>": n,
+     "n_missing_<check>": n}
+    a variant failing several checks is counted once in n_failed, and once per check.
+    '''
+    if thresholds is None:
+        thresholds = THRESHOLDS
+    quality_values = quality_arrays(variants, role_of_id)
+    masks = failed_masks(quality_values, thresholds)
+    failed = np.zeros(len(variants), dtype=bool)
+    for mask in masks.values():
+        failed |= mask
+
+    report = {"thresholds": thresholds, "n_variants": len(variants),
+              "n_failed": int(np.count_nonzero(failed))}
+    for check, mask in masks.items():
+        report["n_failed_" + check] = int(np.count_nonzero(mask))
+    for check in masks:
+        report["n_missing_" + check] = int(np.count_nonzero(np.isnan(quality_values[check])))
+    return ~failed, report
+
+
+def print_report(report):
+    print("quality gate %s: %d / %d variants labeled low depth" % (
+        report["thresholds"], report["n_failed"], report["n_variants"]))
+    for key, value in report.items():
+        if key.startswith("n_failed_"):
+            check = key[len("n_failed_"):]
+            print("    %s: %d failed, %d missing (not checked)" % (
+                check, value, report["n_missing_" + check]))
@@ -0,0 +1,270 @@
+"""
+Pairwise relatedness from genotypes, to verify the declared roles of a family
+(e.g. inheritance_mode_table.ROLE_OF_ID) before calculating inheritance modes.
+
+- genotypes of all samplegeno entries become a samples x sites dosage matrix
+  (number of alt alleles: 0, 1, 2, or -1 if missing).
+- only autosomal sites count: on X, Y and M a father shares no (or one) allele with his child.
+- per pair of samples, counts over sites called in both are matrix products of indicator matrices:
+    n_sites (both called), ibs0 (0 vs 2), ibs1, ibs2, het_het, het_i, het_j
+- kinship is the KING-robust estimator: (het_het - 2*ibs0) / (het_i + het_j)
+  ~0.5 duplicates, ~0.25 first degree, ~0.125 second degree, ~0 unrelated.
+  parent-child and full siblings are both first degree, but parent-child share no ibs0 sites.
+
+Variant samples are ascertained on the proband, so kinship between unrelated samples is biased,
+but the ibs0 rate, and the order of kinships, still tell parents apart from unrelated samples.
+"""
+
+from os import path
+
+import numpy as np
+import pandas as pd
+
+from my_utils import categorical, ndjson_shards, tracing
+import base
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+
+MISSING = -1
+NON_AUTOSOMES = ["X", "Y", "M", "MT"]
+CHUNK_SIZE = 100000
+
+# KING kinship thresholds, between duplicate, 1st, 2nd, 3rd degree and unrelated.
+KINSHIP_DUPLICATE = 0.354
+KINSHIP_FIRST_DEGREE = 0.177
+KINSHIP_SECOND_DEGREE = 0.0884
+KINSHIP_THIRD_DEGREE = 0.0442
+IBS0_PARENT_CHILD_MAX = 0.01
+# a parent-child pair above this ibs0 rate is not explained by genotyping errors
+IBS0_PARENT_CHILD_CONTRADICTION = 0.05
+
+RELATIONSHIP_DUPLICATE = "duplicate"
+RELATIONSHIP_PARENT_CHILD = "parent-child"
+RELATIONSHIP_SIBLING = "full sibling"
+RELATIONSHIP_SECOND_DEGREE = "2nd degree"
+RELATIONSHIP_THIRD_DEGREE = "3rd degree"
+RELATIONSHIP_UNRELATED = "unrelated"
+
+# expected relationship -> inferred relationships that clearly contradict it,
+# e.g. a declared parent that is unrelated to the child (swapped sample ids).
+# with ascertainment on the proband, a swapped parent often looks 2nd degree instead,
+# which IBS0_PARENT_CHILD_CONTRADICTION catches.
+CONTRADICTIONS = {
+    RELATIONSHIP_PARENT_CHILD: {RELATIONSHIP_DUPLICATE, RELATIONSHIP_UNRELATED},
+    RELATIONSHIP_UNRELATED: {RELATIONSHIP_DUPLICATE}
+}
+MIN_SITES = 100
+
+
+def genotype_dosage(genotypes):
+    '''
+    "0/1" -> 1, "1|1" -> 2, "1/2" -> 2, "./." -> -1
+    '''
+    genotypes = np.asarray(genotypes, dtype=object)
+    dosage = np.full(len(genotypes), MISSING, dtype=np.int8)
+    for i, genotype in enumerate(genotypes):
+        alleles = str(genotype).replace("|", "/").split("/")
+        if "." not in alleles and len(alleles) == 2:
+            dosage[i] = sum(allele != "0" for allele in alleles)
+    return dosage
+
+
+@tracing.traced()
+def dosage_matrix(variants):
+    '''
+    variants are variantSamples with samplegeno, possibly from several samples or families.
+    sites are matched on variant.display_title.
+    returns {"dosage": samples x sites int8 matrix,
+             "samples": sample ids, "sites": site titles, "chrom": chrom of each site}
+    '''
+    sample_ids = []
+    genotypes = []
+    site_titles = []
+    chrom_of_title = {}
+    for variant in variants:
+        title = variant.get("variant", {}).get("display_title")
+        chrom_of_title.setdefault(title, str(variant.get("variant", {}).get("CHROM")))
+        for sample_geno in variant.get("samplegeno", []):
+            sample_ids.append(sample_geno.get("samplegeno_sampleid"))
+            genotypes.append(sample_geno.get("samplegeno_numgt"))
+            site_titles.append(title)
+
+    sample_codes, samples = categorical.encode(sample_ids)
+    site_codes, sites = categorical.encode(site_titles)
+    # few distinct genotype strings: parse each once
+    genotype_codes, genotype_dictionary = categorical.encode(genotypes)
+    dosages = np.append(genotype_dosage(genotype_dictionary), np.int8(MISSING))
+
+    # genotypes without a sample id or site title (code -1) would land in the last row / column
+    known = (sample_codes >= 0) & (site_codes >= 0)
+    dosage = np.full((len(samples), len(sites)), MISSING, dtype=np.int8)
+    dosage[sample_codes[known], site_codes[known]] = dosages[genotype_codes[known]]
+
+    chrom = np.array([chrom_of_title[site] for site in sites], dtype=object)
+    return {"dosage": dosage, "samples": samples, "sites": sites, "chrom": chrom}
+
+
+@tracing.traced()
+def pair_counts(dosage, chunk_size=CHUNK_SIZE):
+    '''
+    dosage is a samples x sites matrix from dosage_matrix.
+    returns {name: samples x samples matrix} for n_sites, ibs0, ibs1, ibs2, het_het,
+    and het (het[i, j]: hets of sample i on sites called in both i and j),
+    accumulated chunk_size sites at a time.
+    '''
+    n_samples = dosage.shape[0]
+    names = ["n_sites", "ibs0", "ibs1", "het_het", "het"]
+    counts = {name: np.zeros((n_samples, n_samples)) for name in names}
+    for start in range(0, dosage.shape[1], chunk_size):
+        chunk = dosage[:, start:start + chunk_size]
+        called = (chunk != MISSING).astype(np.float32)
+        hom_ref = (chunk == 0).astype(np.float32)
+        het = (chunk == 1).astype(np.float32)
+        hom_alt = (chunk == 2).astype(np.float32)
+
+        ibs0 = hom_ref @ hom_alt.T
+        ibs1 = (hom_ref + hom_alt) @ het.T
+        counts["n_sites"] += called @ called.T
+        counts["ibs0"] += ibs0 + ibs0.T
+        counts["ibs1"] += ibs1 + ibs1.T
+        counts["het_het"] += het @ het.T
+        counts["het"] += het @ called.T
+    counts["ibs2"] = counts["n_sites"] - counts["ibs0"] - counts["ibs1"]
+    return counts
+
+
+def kinship(counts):
+    '''
+    KING-robust kinship matrix from pair_counts, nan where no het is shared.
+    '''
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (counts["het_het"] - 2*counts["ibs0"]) / (counts["het"] + counts["het"].T)
+
+
+def relationship(kinships, ibs0_rates):
+    '''
+    arrays of kinship and ibs0 rate -> array of RELATIONSHIP_* labels
+    '''
+    kinships = np.nan_to_num(np.asarray(kinships, dtype=float), nan=0.)
+    ibs0_rates = np.asarray(ibs0_rates, dtype=float)
+    conditions = [
+        kinships > KINSHIP_DUPLICATE,
+        (kinships > KINSHIP_FIRST_DEGREE) & (ibs0_rates <= IBS0_PARENT_CHILD_MAX),
+        kinships > KINSHIP_FIRST_DEGREE,
+        kinships > KINSHIP_SECOND_DEGREE,
+        kinships > KINSHIP_THIRD_DEGREE
+    ]
+    choices = [RELATIONSHIP_DUPLICATE, RELATIONSHIP_PARENT_CHILD, RELATIONSHIP_SIBLING,
+               RELATIONSHIP_SECOND_DEGREE, RELATIONSHIP_THIRD_DEGREE]
+    return np.select(conditions, choices, default=RELATIONSHIP_UNRELATED)
+
+
+@tracing.traced(count=len)
+def pairwise_table(matrix):
+    '''
+    matrix is the output of dosage_matrix.
+    returns a data frame with one row per pair of samples, counted over autosomal sites:
+    sample_1, sample_2, n_sites, ibs0, ibs1, ibs2, ibs0_rate, ibs_mean, kinship, relationship
+    '''
+    autosomal = ~np.isin(matrix["chrom"], NON_AUTOSOMES)
+    counts = pair_counts(matrix["dosage"][:, autosomal])
+    kinships = kinship(counts)
+    first, second = np.triu_indices(len(matrix["samples"]), k=1)
+
+    table = pd.DataFrame({
+        "sample_1": matrix["samples"][first],
+        "sample_2": matrix["samples"][second]
+    })
+    for name in ["n_sites", "ibs0", "ibs1", "ibs2"]:
+        table[name] = counts[name][first, second].astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["ibs0_rate"] = table["ibs0"] / table["n_sites"]
+        table["ibs_mean"] = (table["ibs1"] + 2*table["ibs2"]) / (2*table["n_sites"])
+    table["kinship"] = kinships[first, second]
+    table["relationship"] = relationship(table["kinship"], table["ibs0_rate"])
+    return table
+
+
+def expected_relationship(role_1, role_2):
+    if "self" in (role_1, role_2) and {role_1, role_2} & {"mother", "father"}:
+        return RELATIONSHIP_PARENT_CHILD
+    if {role_1, role_2} == {"mother", "father"}:
+        return RELATIONSHIP_UNRELATED
+    return None
+
+
+def verify_roles(variants, role_of_id, min_sites=MIN_SITES):
+    '''
+    compare the relationship implied by the declared roles with the one from genotypes,
+    for every pair of samples in role_of_id.
+    returns the pairwise table with "expected", "ok" and "contradiction" columns,
+    and a list of problems.
+    contradiction: on at least min_sites sites, the genotypes say a relationship
+    that CONTRADICTIONS rules out for the expected one, or a parent-child pair has
+    an ibs0 rate above IBS0_PARENT_CHILD_CONTRADICTION.
+    '''
+    matrix = dosage_matrix(variants)
+    table = pairwise_table(matrix)
+    table = table[table["sample_1"].isin(list(role_of_id))
+                  & table["sample_2"].isin(list(role_of_id))].copy()
+    table["expected"] = [expected_relationship(role_of_id[sample_1], role_of_id[sample_2])
+                         for sample_1, sample_2 in zip(table["sample_1"], table["sample_2"])]
+    table["ok"] = table["expected"].isna() | (table["expected"] == table["relationship"])
+    table["contradiction"] = [
+        n_sites >= min_sites and (
+            relationship in CONTRADICTIONS.get(expected, ())
+            or (expected == RELATIONSHIP_PARENT_CHILD
+                and ibs0_rate > IBS0_PARENT_CHILD_CONTRADICTION))
+        for n_sites, expected, relationship, ibs0_rate in zip(
+            table["n_sites"], table["expected"], table["relationship"], table["ibs0_rate"])]
+
+    problems = []
+    for sample_id in set(role_of_id) - set(matrix["samples"]):
+        problems.append("%s (%s) has no genotypes" % (sample_id, role_of_id[sample_id]))
+    for _, row in table[table["n_sites"] < min_sites].iterrows():
+        problems.append("%s and %s share only %d called sites" % (
+            row["sample_1"], row["sample_2"], row["n_sites"]))
+    for _, row in table[~table["ok"]].iterrows():
+        problems.append("%s (%s) and %s (%s) should be %s, genotypes say %s "
+                        "(kinship %.3f, ibs0 rate %.4f)" % (
+                            row["sample_1"], role_of_id[row["sample_1"]],
+                            row["sample_2"], role_of_id[row["sample_2"]],
+                            row["expected"], row["relationship"],
+                            row["kinship"], row["ibs0_rate"]))
+    return table, problems
+
+
+def check_roles(variants, role_of_id, strict=False):
+    '''
+    print the problems of verify_roles as warnings, with the pairwise table.
+    raise a ValueError if the genotypes clearly contradict the declared roles
+    (see CONTRADICTIONS), or, if strict, on any problem
+    (e.g. too few shared sites, or a parent-child pair above IBS0_PARENT_CHILD_MAX).
+    '''
+    table, problems = verify_roles(variants, role_of_id)
+    if len(problems) == 0:
+        return table
+    message = "declared roles do not match genotypes:\n  %s\n%s" % (
+        "\n  ".join(problems), table.to_string(index=False))
+    if strict or table["contradiction"].any():
+        raise ValueError(message)
+    print("warning: " + message)
+    return table
+
+
+def relatedness_report(variants, fname=None):
+    '''
+    pairwise table for all samples in variants, written as tsv,
+    by default "<DATA_DIR>/relatedness.tsv".
+    '''
+    table = pairwise_table(dosage_matrix(variants))
+    if fname is None:
+        fname = path.join(DATA_DIR, "relatedness.tsv")
+    print("writing %s" % fname)
+    table.to_csv(fname, sep="\t", index=False)
+    return table
+
+
+if __name__ == '__main__':
+    print(relatedness_report(ndjson_shards.read(path.join(DATA_DIR, "variants_NA12879.json")))
+          .to_string(index=False))
@@ -0,0 +1,284 @@
+"""
+Trio QC: aggregate view of genotypes and inheritance_mode output over all variants of a trio.
+
+Per variant, genotypes of mother, father and self are encoded as allele dosages (0, 1, 2),
+and Mendelian consistency is a lookup in a mother x father x self table.
+Variants are then grouped by chromosome, DP bin and GQ bin, and for each group we count:
+    variants, Mendelian errors (out of evaluable variants), de novo candidates,
+    and every inheritance mode label.
+The summary has one row for the trio, with flags for rates above the thresholds below.
+
+    python trio_qc.py
+writes "<DATA_DIR>/report/trio_qc_NA12879_<summary|chrom|dp|gq|inheritance_modes>.tsv"
+"""
+
+from os import path, makedirs
+
+import numpy as np
+import pandas as pd
+
+from my_utils import categorical, ndjson_shards, tracing
+import base
+import inheritance_mode
+import inheritance_mode_table
+import quality_gate
+
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+
+MISSING = -1
+DP_BINS = [0, 10, 20, 30, 50]
+GQ_BINS = [0, 20, 40, 60, 80]
+MAX_MENDELIAN_ERROR_RATE = 0.02
+MAX_DE_NOVO_RATE = 0.01
+
+DE_NOVO_LABELS = [inheritance_mode.INHMODE_LABEL_DE_NOVO_STRONG,
+                  inheritance_mode.INHMODE_LABEL_DE_NOVO_MEDIUM,
+                  inheritance_mode.INHMODE_LABEL_DE_NOVO_WEAK,
+                  inheritance_mode.INHMODE_LABEL_DE_NOVO_CHRXY]
+
+SEX_OF_ROLE = {"mother": "female", "father": "male", "self": "female"}
+
+
+def _mendelian_table(hemizygous):
+    '''
+    consistent[mother, father, self] for dosages 0, 1, 2.
+    hemizygous: self only gets the allele of the mother (chrX of a male).
+    '''
+    alleles = {0: [0], 1: [0, 1], 2: [1]}
+    consistent = np.zeros((3, 3, 3), dtype=bool)
+    for mother in range(3):
+        for father in range(3):
+            if hemizygous:
+                for allele in alleles[mother]:
+                    consistent[mother, father, 2*allele] = True
+                continue
+            for allele_mother in alleles[mother]:
+                for allele_father in alleles[father]:
+                    consistent[mother, father, allele_mother + allele_father] = True
+    return consistent
+
+
+MENDELIAN_DIPLOID = _mendelian_table(hemizygous=False)
+MENDELIAN_HEMIZYGOUS = _mendelian_table(hemizygous=True)
+
+
+def parse_genotypes(genotypes):
+    '''
+    dosage (number of non reference alleles, MISSING for ./.) and multiallelic flag per genotype.
+    '''
+    dosage = np.full(len(genotypes), MISSING, dtype=np.int8)
+    multiallelic = np.zeros(len(genotypes), dtype=bool)
+    for i, genotype in enumerate(genotypes):
+        alleles = str(genotype).replace("|", "/").split("/")
+        if "." in alleles or len(alleles) != 2:
+            continue
+        dosage[i] = sum(allele != "0" for allele in alleles)
+        multiallelic[i] = any(allele not in ("0", "1") for allele in alleles)
+    return dosage, multiallelic
+
+
+@tracing.traced(count=lambda trio: len(trio["chrom"]))
+def encode_trio(variants, role_of_id=inheritance_mode_table.ROLE_OF_ID, thresholds=None):
+    '''
+    one pass over variants, calling inheritance_mode on each
+    (with low_depth for variants failing the quality gate, if thresholds are given).
+    returns a dict of arrays, one entry per variant:
+        dosage_<role>, multiallelic, chrom, DP, GQ, novoPP, low_depth,
+    and the inheritance modes, flattened: mode_offsets, mode_codes, mode_dictionary
+    (modes of variant i are mode_dictionary[mode_codes[mode_offsets[i]:mode_offsets[i+1]]])
+    '''
+    roles = ["mother", "father", "self"]
+    genotypes = {role: [] for role in roles}
+    chrom = []
+    depth = []
+    quality = []
+    novo_pp = []
+    modes = []
+    n_modes = []
+    low_depth = np.zeros(len(variants), dtype=bool)
+    if thresholds is not None:
+        passed, report = quality_gate.quality_gate(variants, role_of_id, thresholds)
+        quality_gate.print_report(report)
+        low_depth = ~passed
+    for ivariant, variant in enumerate(variants):
+        variant = inheritance_mode_table.with_roles(variant, role_of_id)
+        genotype = {sample_geno["samplegeno_role"]: sample_geno["samplegeno_numgt"]
+                    for sample_geno in variant["samplegeno"]}
+        for role in roles:
+            genotypes[role].append(genotype.get(role, "./."))
+        chrom.append(str(variant.get("variant", {}).get("CHROM")))
+        depth.append(variant.get("DP", np.nan))
+        quality.append(variant.get("GQ", np.nan))
+        novo_pp.append(variant.get("novoPP", -1))
+        variant_modes = inheritance_mode.inheritance_mode(
+            variant, low_depth=low_depth[ivariant])["inheritance_modes"]
+        modes.extend(variant_modes)
+        n_modes.append(len(variant_modes))
+
+    trio = {}
+    multiallelic = np.zeros(len(chrom), dtype=bool)
+    for role in roles:
+        codes, dictionary = categorical.encode(genotypes[role])
+        dosage, dictionary_multiallelic = parse_genotypes(dictionary)
+        trio["dosage_" + role] = dosage[codes]
+        multiallelic |= dictionary_multiallelic[codes]
+    trio["multiallelic"] = multiallelic
+    trio["chrom"] = np.array(chrom, dtype=object)
+    trio["DP"] = np.array(depth, dtype=float)
+    trio["GQ"] = np.array(quality, dtype=float)
+    trio["novoPP"] = np.array(novo_pp, dtype=float)
+    trio["low_depth"] = low_depth
+    trio["mode_offsets"] = np.concatenate([[0], np.cumsum(n_modes, dtype=int)])
+    trio["mode_codes"], trio["mode_dictionary"] = categorical.encode(modes)
+    return trio
+
+
+def mendelian_errors(trio, sex_of_role=SEX_OF_ROLE):
+    '''
+    returns evaluable, error: boolean arrays over variants.
+    evaluable: all three called, biallelic, and on an autosome or chrX
+    (chrY and chrM are not evaluated).
+    '''
+    mother, father, child = trio["dosage_mother"], trio["dosage_father"], trio["dosage_self"]
+    evaluable = (mother != MISSING) & (father != MISSING) & (child != MISSING)
+    evaluable &= ~trio["multiallelic"] & ~np.isin(trio["chrom"], ["Y", "M", "MT"])
+
+    hemizygous = (trio["chrom"] == "X") & (sex_of_role["self"] == "male")
+    mother_clipped, father_clipped, child_clipped = (np.clip(dosage, 0, 2) for dosage in
+                                                     (mother, father, child))
+    consistent = np.where(hemizygous,
+                          MENDELIAN_HEMIZYGOUS[mother_clipped, father_clipped, child_clipped],
+                          MENDELIAN_DIPLOID[mother_clipped, father_clipped, child_clipped])
+    return evaluable, evaluable & ~consistent
+
+
+def bin_labels(bins):
+    '''
+    [0, 10, 20] -> ["0-9", "10-19", "20+"]
+    '''
+    labels = ["%d-%d" % (low, high - 1) for low, high in zip(bins[:-1], bins[1:])]
+    return labels + ["%d+" % bins[-1]]
+
+
+def bin_codes(values, bins):
+    '''
+    bin index of each value, -1 for missing values.
+    '''
+    codes = np.digitize(values, bins) - 1
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+def group_summary(codes, names, evaluable, error, de_novo, trio):
+    '''
+    one row per group (codes index names, -1 is dropped), with counts, rates,
+    and the count of each inheritance mode label.
+    '''
+    n_groups = len(names)
+    valid = codes >= 0
+
+    def count(mask):
+        return np.bincount(codes[valid & mask], minlength=n_groups)
+
+    table = pd.DataFrame({
+        "n_variants": count(np.ones(len(codes), dtype=bool)),
+        "n_mendelian_evaluable": count(evaluable),
+        "n_mendelian_errors": count(error),
+        "n_de_novo": count(de_novo)
+    }, index=pd.Index(names, name="group"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["mendelian_error_rate"] = table["n_mendelian_errors"] / table["n_mendelian_evaluable"]
+        table["de_novo_rate"] = table["n_de_novo"] / table["n_variants"]
+
+    n_modes = np.diff(trio["mode_offsets"])
+    mode_group = np.repeat(codes, n_modes)
+    keep = mode_group >= 0
+    modes = categorical.crosstab(mode_group[keep], np.asarray(names, dtype=object),
+                                 trio["mode_codes"][keep], trio["mode_dictionary"])
+    modes = modes.reindex(index=names, fill_value=0)
+    modes.index.name = "group"
+    return table.join(modes)
+
+
+@tracing.traced()
+def trio_qc(trio, sex_of_role=SEX_OF_ROLE):
+    '''
+    trio is the output of encode_trio.
+    returns {"summary": one row data frame,
+             "chrom", "dp", "gq": group_summary by chromosome, DP bin and GQ bin,
+             "inheritance_modes": count of each inheritance mode label}
+    '''
+    evaluable, error = mendelian_errors(trio, sex_of_role)
+    is_de_novo = np.isin(trio["mode_dictionary"], DE_NOVO_LABELS)
+    n_modes = np.diff(trio["mode_offsets"])
+    variant_of_mode = np.repeat(np.arange(len(n_modes)), n_modes)
+    de_novo = np.zeros(len(n_modes), dtype=bool)
+    de_novo[variant_of_mode[is_de_novo[trio["mode_codes"]]]] = True
+
+    chrom_codes, chrom_dictionary = categorical.encode(trio["chrom"])
+    chrom_names = sorted(chrom_dictionary, key=lambda chrom: (
+        not chrom.isdigit(), int(chrom) if chrom.isdigit() else 0, chrom))
+    chrom_rank = np.array([chrom_names.index(chrom) for chrom in chrom_dictionary], dtype=int)
+
+    result = {
+        "chrom": group_summary(chrom_rank[chrom_codes], chrom_names,
+                               evaluable, error, de_novo, trio),
+        "dp": group_summary(bin_codes(trio["DP"], DP_BINS), bin_labels(DP_BINS),
+                            evaluable, error, de_novo, trio),
+        "gq": group_summary(bin_codes(trio["GQ"], GQ_BINS), bin_labels(GQ_BINS),
+                            evaluable, error, de_novo, trio)
+    }
+
+    result["inheritance_modes"] = pd.DataFrame({
+        "count": categorical.value_counts(trio["mode_codes"], trio["mode_dictionary"])
+    }, index=pd.Index(trio["mode_dictionary"], name="inheritance_mode")).sort_values(
+        "count", ascending=False)
+
+    n_variants = len(n_modes)
+    n_evaluable = int(np.count_nonzero(evaluable))
+    summary = {
+        "n_variants": n_variants,
+        "n_mendelian_evaluable": n_evaluable,
+        "n_mendelian_errors": int(np.count_nonzero(error)),
+        "mendelian_error_rate": np.count_nonzero(error) / n_evaluable if n_evaluable else np.nan,
+        "n_low_depth": int(np.count_nonzero(trio["low_depth"])),
+        "n_de_novo": int(np.count_nonzero(de_novo)),
+        "de_novo_rate": np.count_nonzero(de_novo) / n_variants if n_variants else np.nan,
+        "median_DP": np.nanmedian(trio["DP"]) if n_variants else np.nan,
+        "median_GQ": np.nanmedian(trio["GQ"]) if n_variants else np.nan
+    }
+    flags = []
+    if summary["mendelian_error_rate"] > MAX_MENDELIAN_ERROR_RATE:
+        flags.append("mendelian errors")
+    if summary["de_novo_rate"] > MAX_DE_NOVO_RATE:
+        flags.append("de novo")
+    summary["flags"] = ", ".join(flags)
+    result["summary"] = pd.DataFrame([summary])
+    return result
+
+
+def trio_qc_report(variants=None, name="NA12879", report_dir=None, thresholds=None):
+    '''
+    run trio_qc on variants (default: the cached variants of NA12879),
+    print the summary and write every table as tsv to report_dir
+    (default: "<DATA_DIR>/report"), as "trio_qc_<name>_<table>.tsv"
+    thresholds (e.g. quality_gate.THRESHOLDS) gate the calls as in
+    inheritance_mode_table.NA12879_table, by default there is no gate.
+    '''
+    if variants is None:
+        variants = ndjson_shards.read(path.join(DATA_DIR, "variants_%s.json" % name))
+    if report_dir is None:
+        report_dir = path.join(DATA_DIR, "report")
+    makedirs(report_dir, exist_ok=True)
+
+    result = trio_qc(encode_trio(variants, thresholds=thresholds))
+    print(result["summary"].to_string(index=False))
+    for table_name, table in result.items():
+        fname = path.join(report_dir, "trio_qc_%s_%s.tsv" % (name, table_name))
+        print("writing %s" % fname)
+        table.to_csv(fname, sep="\t", index=table_name != "summary")
+    return result
+
+
+if __name__ == '__main__':
+    trio_qc_report()
@@ -1,47 +1,214 @@
 '''
 so far just a one-time use script two compare two version of the vcf mapping table.
 pandas df comparison bit could be useful later, and could be developed further
+
+diff_df aligns rows and columns with hash joins (pandas Index set operations)
+and compares the shared block column by column, instead of row by row.
+diff_tsv_chunked does the same for tables too large to hold twice in memory:
+the old table is loaded once and the new one is streamed in chunks.
 '''
 
 from os import path
+import json
 
+import numpy as np
 import pandas as pd
 
 import base
 DATA_DIR = path.join(base.ROOT_DIR, "data")
 
-def compare_df(df1, df2):
+DIFF_COLUMNS = ["row", "column", "old", "new"]
+
+
+def _check_unique_index(df, name):
     '''
-    given two pandas dataframes, print out difference in row indexes, and values.
+    rows are matched on index, so duplicated index values would be ambiguous.
+    '''
+    if not df.index.is_unique:
+        duplicates = df.index[df.index.duplicated()].unique().tolist()
+        raise ValueError("index of %s has duplicate entries: %s" % (name, duplicates))
+
+
+def _changed_cells(df1, df2, rows, cols):
+    '''
+    compare df1 and df2 on the given (shared) rows and cols, one whole column at a time.
+    returns a data frame with DIFF_COLUMNS, one row per changed cell.
+    '''
+    changed = []
+    if len(rows) == 0:
+        return pd.DataFrame(changed, columns=DIFF_COLUMNS)
+    for col in cols:
+        old = df1[col].reindex(rows).to_numpy(dtype=object)
+        new = df2[col].reindex(rows).to_numpy(dtype=object)
+        old_na = pd.isna(old)
+        new_na = pd.isna(new)
+        mismatch = (old != new) & ~(old_na & new_na)
+        if not mismatch.any():
+            continue
+        where = np.flatnonzero(mismatch)
+        changed.append(pd.DataFrame({
+            "row": rows[where],
+            "column": col,
+            "old": old[where],
+            "new": new[where]
+        }, columns=DIFF_COLUMNS))
+    if len(changed) == 0:
+        return pd.DataFrame([], columns=DIFF_COLUMNS)
+    return pd.concat(changed, ignore_index=True)
+
+
+def diff_df(df1, df2):
+    '''
+    given two pandas dataframes, return their difference as a dict:
+    {
+      "rows_removed": [...],  # index values only in df1
+      "rows_added": [...],    # index values only in df2
+      "cols_removed": [...],  # columns only in df1
+      "cols_added": [...],    # columns only in df2
+      "changed": DataFrame    # one row per changed cell: row, column, old, new
+    }
+    rows of "changed" are ordered by column first, then by df1 row order.
+    '''
+    _check_unique_index(df1, "df1")
+    _check_unique_index(df2, "df2")
+
+    rows_common = df1.index.intersection(df2.index, sort=False)
+    cols_common = df1.columns.intersection(df2.columns, sort=False)
+
+    return {
+        "rows_removed": df1.index.difference(df2.index, sort=False).tolist(),
+        "rows_added": df2.index.difference(df1.index, sort=False).tolist(),
+        "cols_removed": df1.columns.difference(df2.columns, sort=False).tolist(),
+        "cols_added": df2.columns.difference(df1.columns, sort=False).tolist(),
+        "changed": _changed_cells(df1, df2, rows_common, cols_common)
+    }
+
+
+def diff_tsv_chunked(fname_old, fname_new, key_field, chunksize=10000,
+                     drop_columns=(), header=5):
+    '''
+    same as diff_df, for two tsv files too large to hold twice in memory.
+    fname_old is loaded once, fname_new is read <chunksize> rows at a time,
+    and each chunk is aligned against the old table on key_field.
+    all values are read as strings, so that chunk-wise dtype guessing can not
+    create spurious differences.
+    '''
+    read_options = {"sep": "\t", "header": header, "na_filter": False, "dtype": str}
+    df_old = pd.read_csv(fname_old, **read_options)
+    df_old.set_index(key_field, inplace=True)
+    df_old.drop(columns=list(drop_columns), inplace=True)
+    _check_unique_index(df_old, fname_old)
+
+    seen = np.zeros(len(df_old.index), dtype=bool)
+    keys_new = set()
+    rows_added = []
+    changed = []
+    cols_removed = cols_added = None
+
+    for chunk in pd.read_csv(fname_new, chunksize=chunksize, **read_options):
+        chunk.set_index(key_field, inplace=True)
+        chunk.drop(columns=list(drop_columns), inplace=True)
+        _check_unique_index(chunk, fname_new)
+        duplicates = keys_new.intersection(chunk.index)
+        if duplicates:
+            raise ValueError("index of %s has duplicate entries: %s" % (fname_new, sorted(duplicates)))
+        keys_new.update(chunk.index)
+
+        if cols_removed is None:
+            cols_removed = df_old.columns.difference(chunk.columns, sort=False).tolist()
+            cols_added = chunk.columns.difference(df_old.columns, sort=False).tolist()
+            cols_common = df_old.columns.intersection(chunk.columns, sort=False)
+
+        position = df_old.index.get_indexer(chunk.index)
+        found = position >= 0
+        seen[position[found]] = True
+        rows_added.extend(chunk.index[~found].tolist())
+        changed.append(_changed_cells(df_old, chunk, chunk.index[found], cols_common))
+
+    if cols_removed is None:
+        cols_removed, cols_added = [], []
+    changed = [each for each in changed if len(each) > 0]
+    if len(changed) > 0:
+        changed = pd.concat(changed, ignore_index=True)
+        # same ordering as diff_df: by column, then by old row order.
+        col_order = {col: i for i, col in enumerate(df_old.columns)}
+        changed["_col"] = changed["column"].map(col_order)
+        changed["_row"] = df_old.index.get_indexer(changed["row"])
+        changed.sort_values(by=["_col", "_row"], kind="stable", inplace=True)
+        changed = changed[DIFF_COLUMNS].reset_index(drop=True)
+    else:
+        changed = pd.DataFrame([], columns=DIFF_COLUMNS)
+
+    return {
+        "rows_removed": df_old.index[~seen].tolist(),
+        "rows_added": rows_added,
+        "cols_removed": cols_removed,
+        "cols_added": cols_added,
+        "changed": changed
+    }
+
+
+def diff_to_frame(diff):
+    '''
+    flatten a diff from diff_df into a single long table with columns
+    kind, row, column, old, new
+    kind is one of row_removed, row_added, col_removed, col_added, changed.
     '''
+    parts = [
+        pd.DataFrame({"kind": "row_removed", "row": diff["rows_removed"]}),
+        pd.DataFrame({"kind": "row_added", "row": diff["rows_added"]}),
+        pd.DataFrame({"kind": "col_removed", "column": diff["cols_removed"]}),
+        pd.DataFrame({"kind": "col_added", "column": diff["cols_added"]}),
+        diff["changed"].assign(kind="changed")
+    ]
+    parts = [part for part in parts if len(part) > 0]
+    columns = ["kind"] + DIFF_COLUMNS
+    if len(parts) == 0:
+        return pd.DataFrame([], columns=columns)
+    return pd.concat(parts, ignore_index=True).reindex(columns=columns)
 
-    intersection_rows = [field for field in df1.index if field in df2.index]
-    for field in df1.index:
-        if not field in intersection_rows:
-            print("Only in df1: ", field)
-    for field in df2.index:
-        if not field in intersection_rows:
-            print("Only in df2: ", field)
 
-    intersection_cols = [field for field in df1.columns if field in df2.columns]
-    for field in df1.columns:
-        if not field in intersection_cols:
-            print("Only in df1: ", field)
-    for field in df2.columns:
-        if not field in intersection_cols:
-            print("Only in df2: ", field)
+def write_diff_tsv(diff, fname):
+    '''
+    write a diff from diff_df as a long tsv, see diff_to_frame.
+    '''
+    diff_to_frame(diff).to_csv(fname, sep="\t", index=False)
 
-    df1 = df1[intersection_cols]
-    df2 = df2[intersection_cols]
 
-    for field in intersection_rows:
-        comp = (df1.loc[field] == df2.loc[field])
-        if not all(comp):
-            mismatch_cols = list(comp[comp == 0].index)
-            print("%s:\t%s" % (field, ", ".join(mismatch_cols)))
+def write_diff_json(diff, fname):
+    '''
+    write a diff from diff_df as json, with changed cells as a list of dicts.
+    '''
+    changed = diff["changed"].astype(object).where(pd.notna(diff["changed"]), None)
+    output = {key: value for key, value in diff.items() if key != "changed"}
+    output["changed"] = changed.to_dict(orient="records")
+    with open(fname, "w") as outf:
+        json.dump(output, outf, indent=4, default=str)
+
+
+def compare_df(df1, df2):
+    '''
+    given two pandas dataframes, print out difference in row indexes, and values.
+    '''
+    diff = diff_df(df1, df2)
+
+    for field in diff["rows_removed"]:
+        print("Only in df1: ", field)
+    for field in diff["rows_added"]:
+        print("Only in df2: ", field)
+    for field in diff["cols_removed"]:
+        print("Only in df1: ", field)
+    for field in diff["cols_added"]:
+        print("Only in df2: ", field)
+
+    changed = diff["changed"]
+    rows_order = {field: i for i, field in enumerate(df1.index)}
+    changed = changed.assign(_row=changed["row"].map(rows_order))
+    changed.sort_values(by="_row", kind="stable", inplace=True)
+    for field, mismatch in changed.groupby("row", sort=False):
+        print("%s:\t%s" % (field, ", ".join(mismatch["column"])))
 
 
-            
 if __name__ == '__main__':
     fname_old = path.join(DATA_DIR, 'VCF Mapping Table - v0.4.8 variant table.tsv.bak')
     fname_new = path.join(DATA_DIR, 'VCF Mapping Table - v0.4.8 variant table.tsv')
@@ -58,3 +225,7 @@ if __name__ == '__main__':
     df_new.pop("no")
 
     compare_df(df_old, df_new)
+
+    DIFF = diff_df(df_old, df_new)
+    write_diff_tsv(DIFF, path.join(DATA_DIR, "mapping_table_diff.tsv"))
+    write_diff_json(DIFF, path.join(DATA_DIR, "mapping_table_diff.json"))
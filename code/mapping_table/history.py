@@ -0,0 +1,162 @@
+'''
+history of the vcf mapping tables.
+
+every "VCF Mapping Table - *.tsv" in DATA_DIR is parsed once into a single data frame
+indexed by (field_name, version), with categorical columns to keep it compact,
+and pickled to "<DATA_DIR>/mapping_table_history.pkl".
+The pickle is rebuilt only when the set of mapping table files, or one of their mtimes, changes.
+
+version is the FILEFORMAT label from the header of the file, e.g. annV0.4.8 or gene_annV0.4.6.
+'''
+
+from os import path
+import glob
+import re
+
+import pandas as pd
+
+import base
+import compare
+DATA_DIR = path.join(base.ROOT_DIR, "data")
+
+FNAME_HISTORY = "mapping_table_history.pkl"
+PATTERN_MAPPING_TABLE = "VCF Mapping Table - *.tsv"
+KEY_FIELD = "field_name"
+
+
+def mapping_table_version(fname):
+    '''
+    read the FILEFORMAT line from the header of a mapping table.
+    e.g. "#FILEFORMAT= annV0.4.8" returns "annV0.4.8"
+    '''
+    with open(fname) as infile:
+        for _ in range(5):
+            line = infile.readline()
+            match = re.search(r"#FILEFORMAT=\s*(\S+)", line)
+            if match:
+                return match.group(1)
+    raise ValueError("no #FILEFORMAT line in the header of %s" % fname)
+
+
+def version_sort_key(version):
+    '''
+    gene_annV0.4.6 -> ("gene_ann", (0, 4, 6)), so that versions sort per table, then numerically.
+    '''
+    prefix, _, number = version.rpartition("V")
+    return (prefix, tuple(int(x) for x in number.split(".") if x.isdigit()))
+
+
+def mapping_table_files():
+    '''
+    all mapping tables in DATA_DIR, as {fname: mtime}
+    '''
+    fnames = sorted(glob.glob(path.join(DATA_DIR, PATTERN_MAPPING_TABLE)))
+    return {fname: path.getmtime(fname) for fname in fnames}
+
+
+def build_history(fnames=None):
+    '''
+    parse each mapping table once and stack them into a data frame indexed by
+    (field_name, version), with a "table" column (variant or gene).
+    all values are kept as strings (empty string for empty cells) in categorical columns.
+    '''
+    if fnames is None:
+        fnames = list(mapping_table_files().keys())
+
+    tables = []
+    for fname in fnames:
+        version = mapping_table_version(fname)
+        print("ingesting %s from %s" % (version, fname))
+        map_table = pd.read_csv(fname, sep="\t", header=5, na_filter=False, dtype=str)
+        map_table["version"] = version
+        map_table["table"] = "gene" if version.startswith("gene") else "variant"
+        tables.append(map_table)
+
+    history = pd.concat(tables, ignore_index=True).fillna("")
+    for column in history.columns:
+        if column != KEY_FIELD:
+            history[column] = history[column].astype("category")
+    history.set_index([KEY_FIELD, "version"], inplace=True)
+    history.sort_index(inplace=True)
+    return history
+
+
+def load_history(rebuild=False):
+    '''
+    load history from "<DATA_DIR>/mapping_table_history.pkl"
+    If it is missing or stale, (re)build it from the mapping tables and save it.
+    '''
+    fname_history = path.join(DATA_DIR, FNAME_HISTORY)
+    sources = mapping_table_files()
+    if not rebuild and path.exists(fname_history):
+        stored = pd.read_pickle(fname_history)
+        if stored["sources"] == sources:
+            return stored["history"]
+        print("mapping tables changed since %s was built" % fname_history)
+
+    history = build_history(list(sources.keys()))
+    pd.to_pickle({"sources": sources, "history": history}, fname_history)
+    return history
+
+
+def versions(history):
+    '''
+    all versions in history, sorted per table and numerically.
+    '''
+    return sorted(history.index.get_level_values("version").unique(), key=version_sort_key)
+
+
+def table_version(history, version):
+    '''
+    the mapping table for a single version, indexed by field_name, with string columns.
+    '''
+    table = history.xs(version, level="version").drop(columns=["table"])
+    return table.astype(str)
+
+
+def field_timeline(history, field):
+    '''
+    for a single field, a long table of what happened to it at each version:
+    version, change, column, old, new
+    change is one of added, removed, changed.
+    versions of the gene and variant tables are not compared to each other.
+    '''
+    rows = history.xs(field, level=KEY_FIELD).astype(str)
+    columns = [column for column in rows.columns if column not in ["no", "table"]]
+    table_of_version = history["table"].groupby(level="version", observed=True).first()
+    events = []
+    for table in sorted(rows["table"].unique()):
+        table_versions = [version for version in versions(history)
+                          if table_of_version[version] == table]
+        previous = None
+        for version in table_versions:
+            current = rows.loc[version, columns] if version in rows.index else None
+            if previous is None and current is not None:
+                events.append({"version": version, "change": "added"})
+            elif previous is not None and current is None:
+                events.append({"version": version, "change": "removed"})
+            elif previous is not None:
+                differs = previous.to_numpy() != current.to_numpy()
+                for column in current.index[differs]:
+                    events.append({"version": version, "change": "changed", "column": column,
+                                   "old": previous[column], "new": current[column]})
+            previous = current
+
+    return pd.DataFrame(events, columns=["version", "change", "column", "old", "new"])
+
+
+def version_diff(history, version_old, version_new):
+    '''
+    diff of any two versions in history, see compare.diff_df.
+    '''
+    table_old = table_version(history, version_old).drop(columns=["no"])
+    table_new = table_version(history, version_new).drop(columns=["no"])
+    return compare.diff_df(table_old, table_new)
+
+
+if __name__ == '__main__':
+    HISTORY = load_history()
+    print(versions(HISTORY))
+    print(field_timeline(HISTORY, "comhet_transcript"))
+    compare.write_diff_tsv(version_diff(HISTORY, "annV0.4.7", "annV0.4.8"),
+                           path.join(DATA_DIR, "mapping_table_diff_annV0.4.7_annV0.4.8.tsv"))
@@ -0,0 +1,89 @@
+'''
+dictionary encoded (categorical) columns.
+
+a column of values is stored as integer codes plus a dictionary, so that
+values == dictionary[codes]
+Most fields on variants and genes have only a few distinct values,
+so counting and cross tabulating is done on the codes with np.bincount,
+instead of sorting or hashing the values again for every use.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def encode(values, dictionary=None):
+    '''
+    returns codes, dictionary for values.
+    codes are in order of first appearance, missing values (None, nan) get code -1.
+    if a dictionary is given, its codes are kept and new values are appended to it,
+    so several columns can share one dictionary.
+    '''
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    uniques = np.asarray(uniques, dtype=object)
+    if dictionary is None:
+        return codes, uniques
+
+    dictionary = np.asarray(dictionary, dtype=object)
+    remap = pd.Index(dictionary).get_indexer(uniques)
+    new = remap < 0
+    remap[new] = len(dictionary) + np.arange(np.count_nonzero(new))
+    dictionary = np.concatenate([dictionary, uniques[new]])
+    codes = np.where(codes < 0, -1, remap[codes])
+    return codes, dictionary
+
+
+def decode(codes, dictionary):
+    '''
+    values from codes, None for missing.
+    '''
+    values = np.asarray(dictionary, dtype=object)[codes]
+    values[codes < 0] = None
+    return values
+
+
+def value_counts(codes, dictionary):
+    '''
+    count of each dictionary entry, in dictionary order (missing values are not counted).
+    '''
+    codes = np.asarray(codes)
+    return np.bincount(codes[codes >= 0], minlength=len(dictionary))
+
+
+def n_unique(codes, dictionary):
+    '''
+    number of dictionary entries that actually appear in codes.
+    '''
+    return int(np.count_nonzero(value_counts(codes, dictionary)))
+
+
+def sort_dictionary(codes, dictionary):
+    '''
+    re-code so that the dictionary is sorted, e.g. for display.
+    only the dictionary is sorted, the codes are just remapped.
+    '''
+    order = np.argsort(np.asarray(dictionary, dtype=str), kind="stable")
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order))
+    codes = np.asarray(codes)
+    return np.where(codes < 0, -1, rank[codes]), np.asarray(dictionary, dtype=object)[order]
+
+
+def crosstab(codes_row, dictionary_row, codes_col, dictionary_col, name_row=None, name_col=None):
+    '''
+    equivalent of pd.crosstab(values_row, values_col), computed on the codes.
+    rows and columns are sorted by value, and only values that appear are kept.
+    '''
+    codes_row, dictionary_row = sort_dictionary(codes_row, dictionary_row)
+    codes_col, dictionary_col = sort_dictionary(codes_col, dictionary_col)
+    valid = (codes_row >= 0) & (codes_col >= 0)
+    n_col = len(dictionary_col)
+    counts = np.bincount(codes_row[valid]*n_col + codes_col[valid],
+                         minlength=len(dictionary_row)*n_col)
+    counts = counts.reshape(len(dictionary_row), n_col)
+    keep_row = counts.sum(axis=1) > 0
+    keep_col = counts.sum(axis=0) > 0
+    table = pd.DataFrame(counts[keep_row][:, keep_col],
+                         index=pd.Index(dictionary_row[keep_row], name=name_row),
+                         columns=pd.Index(dictionary_col[keep_col], name=name_col))
+    return table
@@ -0,0 +1,235 @@
+'''
+tables collected column by column, written as tsv, parquet or feather.
+
+rows are appended as tuples in column order, straight into one typed buffer per column,
+so no dict is built per row:
+    "i" (int64):   array('q')
+    "f" (float64): array('d'), nan for missing values
+    "b" (bool):    array('b')
+    "O" (strings): list
+Column kinds are declared up front (the same kinds as my_utils.external_sort.column_kind),
+and write_tsv gives the same file as pd.DataFrame(rows).to_csv(sep="\t") for these kinds.
+list valued columns (e.g. inheritance_modes) are stored flat, with an offset array:
+the values of row i are values[offsets[i]:offsets[i+1]].
+
+parquet and feather need pyarrow, which is optional; list columns become arrow list arrays
+built from the offsets. TableWriters writes them one batch of rows at a time, so a table
+does not have to fit in memory. feather files are written uncompressed, so that they can be
+memory mapped with read_table.
+'''
+
+from array import array
+import csv
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from my_utils import external_sort
+
+
+FORMATS = {"tsv": ".tsv", "parquet": ".parquet", "feather": ".feather"}
+TYPECODES = {"i": "q", "f": "d", "b": "b"}
+BATCH_SIZE = 100000
+
+
+def available_formats():
+    '''
+    formats that can be written here: tsv, and parquet / feather if pyarrow is installed.
+    '''
+    if pyarrow is None:
+        return ["tsv"]
+    return list(FORMATS)
+
+
+def _require_pyarrow(fname):
+    if pyarrow is None:
+        raise ImportError("%s needs pyarrow" % fname)
+
+
+class ColumnBuffers:
+    '''
+    table = ColumnBuffers(["a", "b", "modes"], kinds={"a": "i"}, list_columns=["modes"])
+    table.append((1, "x", ["m1", "m2"]))
+    table.write("out/table", ["tsv", "parquet"])
+    columns not in kinds are "O".
+    '''
+
+    def __init__(self, columns, kinds=None, list_columns=()):
+        self.columns = list(columns)
+        self.list_columns = set(list_columns)
+        self.kinds = {column: (kinds or {}).get(column, "O") for column in self.columns}
+        self.values = {}
+        self.offsets = {}
+        self.n_rows = 0
+        self.clear()
+
+    def clear(self):
+        '''
+        drop all rows, e.g. once a batch is written.
+        '''
+        for column in self.columns:
+            if column in self.list_columns or self.kinds[column] == "O":
+                self.values[column] = []
+            else:
+                self.values[column] = array(TYPECODES[self.kinds[column]])
+        self.offsets = {column: array("q", [0]) for column in self.list_columns}
+        self.n_rows = 0
+
+    def append(self, row):
+        '''
+        row is a tuple of values in column order, a list (or None) for list columns.
+        '''
+        for column, value in zip(self.columns, row):
+            if column in self.list_columns:
+                self.values[column].extend(value or [])
+                self.offsets[column].append(len(self.values[column]))
+            elif self.kinds[column] == "f" and value is None:
+                self.values[column].append(np.nan)
+            else:
+                self.values[column].append(value)
+        self.n_rows += 1
+
+    def row_lists(self, column):
+        '''
+        values of a list column as one list per row.
+        '''
+        values = self.values[column]
+        offsets = self.offsets[column]
+        return [values[offsets[irow]:offsets[irow + 1]] for irow in range(self.n_rows)]
+
+    def array(self, column):
+        '''
+        numpy array of a scalar column: int64, float64 (nan for missing), bool or object.
+        numeric columns are views on their buffers.
+        '''
+        kind = self.kinds[column]
+        if kind == "O":
+            return np.array(self.values[column], dtype=object)
+        if kind == "b":
+            return np.frombuffer(self.values[column], dtype=np.int8).astype(bool)
+        return np.frombuffer(self.values[column], dtype=np.int64 if kind == "i" else np.float64)
+
+    def write_tsv(self, fname, index=False, transforms=None):
+        '''
+        same file as DataFrame.to_csv(fname, sep="\t", index=index) of the rows.
+        transforms is {column: function(value)}, applied to non missing scalar values.
+        '''
+        transforms = transforms or {}
+        columns = [self.row_lists(column) if column in self.list_columns else self.values[column]
+                   for column in self.columns]
+        with open(fname, "w", newline="") as outf:
+            writer = csv.writer(outf, delimiter="\t", lineterminator="\n")
+            writer.writerow(([""] if index else []) + self.columns)
+            for irow, row in enumerate(zip(*columns)):
+                line = [str(irow)] if index else []
+                for column, value in zip(self.columns, row):
+                    if column in self.list_columns:
+                        line.append(str(value))
+                        continue
+                    if column in transforms and not external_sort.is_missing(value):
+                        value = transforms[column](value)
+                    line.append(external_sort.format_value(value, self.kinds[column]))
+                writer.writerow(line)
+
+    def schema(self):
+        '''
+        arrow schema: int64, float64, bool, string, and list of strings for list columns.
+        '''
+        types = {"i": pyarrow.int64(), "f": pyarrow.float64(), "b": pyarrow.bool_(),
+                 "O": pyarrow.string()}
+        return pyarrow.schema([(column, pyarrow.list_(pyarrow.string())
+                                if column in self.list_columns else types[self.kinds[column]])
+                               for column in self.columns])
+
+    def to_arrow(self):
+        '''
+        pyarrow.Table of the rows, list columns as list arrays over the flat values.
+        '''
+        schema = self.schema()
+        arrays = []
+        for column, field in zip(self.columns, schema):
+            if column in self.list_columns:
+                arrays.append(pyarrow.ListArray.from_arrays(
+                    pyarrow.array(np.frombuffer(self.offsets[column], dtype=np.int64)
+                                  .astype(np.int32)),
+                    pyarrow.array(self.values[column], type=pyarrow.string())))
+            elif self.kinds[column] == "O":
+                arrays.append(pyarrow.array(self.values[column], type=field.type))
+            else:
+                arrays.append(pyarrow.array(self.array(column), type=field.type,
+                                            from_pandas=True))
+        return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+    def write(self, fname_base, formats=("tsv",), index=False, tsv_transforms=None):
+        '''
+        write "<fname_base>.tsv", ".parquet", ".feather" for each of formats.
+        index and tsv_transforms only apply to the tsv.
+        returns the list of files written.
+        '''
+        fnames = []
+        if "tsv" in formats:
+            fname = fname_base + FORMATS["tsv"]
+            print("writing %s" % fname)
+            self.write_tsv(fname, index, tsv_transforms)
+            fnames.append(fname)
+        other_formats = [file_format for file_format in formats if file_format != "tsv"]
+        if other_formats:
+            writers = TableWriters(fname_base, other_formats, self.schema())
+            writers.write_batch(self)
+            fnames += writers.close()
+        return fnames
+
+
+class TableWriters:
+    '''
+    parquet and / or feather files written one ColumnBuffers batch at a time.
+    writers = TableWriters("out/table", ["parquet", "feather"], buffers.schema())
+    writers.write_batch(buffers); buffers.clear(); ...
+    writers.close()
+    '''
+
+    def __init__(self, fname_base, formats, schema):
+        self.writers = []
+        self.fnames = []
+        for file_format in formats:
+            fname = fname_base + FORMATS[file_format]
+            _require_pyarrow(fname)
+            print("writing %s" % fname)
+            if file_format == "parquet":
+                self.writers.append(pyarrow.parquet.ParquetWriter(fname, schema))
+            else:
+                # feather v2 is the arrow ipc file format
+                self.writers.append(pyarrow.ipc.new_file(fname, schema))
+            self.fnames.append(fname)
+
+    def write_batch(self, buffers):
+        if buffers.n_rows == 0:
+            return
+        table = buffers.to_arrow()
+        for writer in self.writers:
+            writer.write_table(table)
+
+    def close(self):
+        '''
+        returns the list of files written.
+        '''
+        for writer in self.writers:
+            writer.close()
+        return self.fnames
+
+
+def read_table(fname):
+    '''
+    pyarrow.Table from a parquet or feather file, feather files are memory mapped.
+    '''
+    _require_pyarrow(fname)
+    if fname.endswith(FORMATS["feather"]):
+        return pyarrow.feather.read_table(fname, memory_map=True)
+    return pyarrow.parquet.read_table(fname)
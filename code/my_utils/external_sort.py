@@ -0,0 +1,198 @@
+'''
+sort more rows than fit in memory, and write them as a tsv the way pandas would.
+
+rows (dicts) are collected in runs of run_size, each run is sorted and pickled to a temporary file,
+then the runs are merged with heapq.merge, reading one row at a time from each run.
+
+Sorting is stable, and keys follow DataFrame.sort_values with na_position="last":
+missing values (None, nan) go last, whether the column is ascending or not.
+
+Column types are inferred over all rows while spilling, like pd.DataFrame(rows) would
+(e.g. ints with a missing value become floats, written as 3.0),
+so that write_tsv gives the same file as DataFrame.sort_values(...).to_csv(sep="\t").
+'''
+
+import csv
+import heapq
+import math
+import pickle
+import tempfile
+
+import numpy as np
+
+
+RUN_SIZE = 100000
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class _Descending:
+    '''
+    reverses the order of a non missing value.
+    '''
+    __slots__ = ["value"]
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def sort_key(by, ascending):
+    '''
+    key function on rows for DataFrame.sort_values(by, ascending, na_position="last")
+    '''
+    if isinstance(ascending, bool):
+        ascending = [ascending] * len(by)
+
+    def key(row):
+        parts = []
+        for column, column_ascending in zip(by, ascending):
+            value = row.get(column)
+            if is_missing(value):
+                parts.append((1, None))
+            elif column_ascending:
+                parts.append((0, value))
+            else:
+                parts.append((0, _Descending(value)))
+        return tuple(parts)
+    return key
+
+
+def column_kind(kinds, has_missing):
+    '''
+    pandas dtype kind for a column with python value types kinds: "i", "f", "b" or "O"
+    '''
+    if len(kinds) == 0:
+        return "O"
+    if kinds <= {int, float}:
+        return "f" if float in kinds or has_missing else "i"
+    if kinds == {bool} and not has_missing:
+        return "b"
+    return "O"
+
+
+def format_value(value, kind):
+    '''
+    a value as DataFrame.to_csv writes it for a column of kind.
+    '''
+    if is_missing(value):
+        return ""
+    if kind == "f":
+        return str(np.float64(value))
+    return str(value)
+
+
+def format_row(row, columns, kinds, transforms):
+    '''
+    values of row (a dict) in columns, as DataFrame.to_csv writes them,
+    transforms ({column: function(value)}) applied to non missing values first.
+    '''
+    line = []
+    for column in columns:
+        value = row.get(column)
+        if column in transforms and not is_missing(value):
+            value = transforms[column](value)
+        line.append(format_value(value, kinds[column]))
+    return line
+
+
+class ExternalSorter:
+    '''
+    sorter = ExternalSorter(columns, by, ascending)
+    for row in rows:
+        sorter.add(row)
+    sorter.write_tsv(fname)
+    '''
+
+    def __init__(self, columns, by, ascending=True, run_size=RUN_SIZE, tmpdir=None):
+        self.columns = columns
+        self.key = sort_key(by, ascending)
+        self.run_size = run_size
+        self.tmpdir = tmpdir
+        self.runs = []
+        self.buffer = []
+        self.n_rows = 0
+        self.kinds = {column: set() for column in columns}
+        self.has_missing = dict.fromkeys(columns, False)
+
+    def add(self, row):
+        for column in self.columns:
+            value = row.get(column)
+            if is_missing(value):
+                self.has_missing[column] = True
+            else:
+                self.kinds[column].add(bool if isinstance(value, (bool, np.bool_)) else
+                                       int if isinstance(value, (int, np.integer)) else
+                                       float if isinstance(value, (float, np.floating)) else
+                                       object)
+        # the row number keeps the sort stable across runs
+        self.buffer.append((self.key(row), self.n_rows, row))
+        self.n_rows += 1
+        if len(self.buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort(key=lambda item: (item[0], item[1]))
+        run = tempfile.TemporaryFile(dir=self.tmpdir)
+        for item in self.buffer:
+            pickle.dump(item, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs.append(run)
+        self.buffer = []
+
+    @staticmethod
+    def _read_run(run):
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
+
+    def sorted_rows(self):
+        '''
+        yields the rows added so far, sorted; the temporary files are closed at the end.
+        '''
+        self.buffer.sort(key=lambda item: (item[0], item[1]))
+        streams = [self._read_run(run) for run in self.runs] + [iter(self.buffer)]
+        try:
+            for _, _, row in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+                yield row
+        finally:
+            for run in self.runs:
+                run.close()
+            self.runs = []
+            self.buffer = []
+
+    def column_kinds(self):
+        '''
+        {column: "i", "f", "b" or "O"}, inferred over all rows added so far.
+        '''
+        return {column: column_kind(self.kinds[column], self.has_missing[column])
+                for column in self.columns}
+
+    def write_tsv(self, fname, transforms=None, on_row=None):
+        '''
+        write the sorted rows to fname like DataFrame.to_csv(fname, sep="\t"),
+        with a 0..n-1 index as first column.
+        transforms is {column: function(value)}, applied to non missing values
+        after sorting and type inference.
+        on_row(row), if given, is called with every sorted row as it is written,
+        e.g. to write the same rows in another format without sorting them again.
+        '''
+        transforms = transforms or {}
+        kinds = self.column_kinds()
+        with open(fname, "w", newline="") as outf:
+            writer = csv.writer(outf, delimiter="\t", lineterminator="\n")
+            writer.writerow([""] + list(self.columns))
+            for irow, row in enumerate(self.sorted_rows()):
+                if on_row is not None:
+                    on_row(row)
+                writer.writerow([str(irow)] + format_row(row, self.columns, kinds, transforms))
+        return self.n_rows
@@ -0,0 +1,139 @@
+'''
+json list caches (e.g. "<DATA_DIR>/variants_NA12879.json") stored as shards of
+newline delimited json.
+
+for a cache "<name>.json", the shards live in "<name>.shards/":
+    manifest.json       {"n_records": ..., "shards": [{"file": "shard_000.ndjson", "n_records": ...}]}
+    shard_000.ndjson    one record per line, records in their original order
+    ...
+Each shard is plain ndjson, e.g. `head -1 shard_000.ndjson | jq .` works.
+
+read() decodes the shards in this process, with orjson if it is installed, json otherwise,
+and falls back to the single "<name>.json" file if there are no shards yet;
+migrate() turns such a file into shards, it is never done implicitly.
+
+The shards are not decoded in a process pool: the records would have to be pickled back
+to the parent, which costs about as much as decoding them with orjson
+(see benchmark/bench_shards.py).
+'''
+
+from os import path, makedirs, remove
+import glob
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+N_SHARDS = 16
+MANIFEST = "manifest.json"
+
+
+def shard_dir(fname):
+    '''
+    "data/variants_NA12879.json" -> "data/variants_NA12879.shards"
+    '''
+    return re.sub(r"\.json$", "", fname) + ".shards"
+
+
+def shard_files(fname):
+    '''
+    paths of the shards of fname, in record order.
+    '''
+    dirname = shard_dir(fname)
+    with open(path.join(dirname, MANIFEST)) as infile:
+        manifest = json.load(infile)
+    return [path.join(dirname, shard["file"]) for shard in manifest["shards"]]
+
+
+def is_sharded(fname):
+    return path.exists(path.join(shard_dir(fname), MANIFEST))
+
+
+def exists(fname):
+    '''
+    the cache is there, sharded or as a single json file.
+    '''
+    return is_sharded(fname) or path.exists(fname)
+
+
+def source_stat(fname):
+    '''
+    (size, mtime) of what read(fname) would read, to detect stale derived files.
+    the manifest is written last, so it changes whenever the shards do.
+    '''
+    source = path.join(shard_dir(fname), MANIFEST) if is_sharded(fname) else fname
+    return path.getsize(source), path.getmtime(source)
+
+
+def _dumps(record):
+    if orjson is not None:
+        return orjson.dumps(record).decode()
+    return json.dumps(record)
+
+
+def write(records, fname, n_shards=N_SHARDS):
+    '''
+    write records as n_shards contiguous shards of fname.
+    '''
+    dirname = shard_dir(fname)
+    makedirs(dirname, exist_ok=True)
+    manifest_fname = path.join(dirname, MANIFEST)
+    if path.exists(manifest_fname):
+        remove(manifest_fname)
+    for old_shard in glob.glob(path.join(dirname, "shard_*.ndjson")):
+        remove(old_shard)
+
+    print("writing %d records to %s" % (len(records), dirname))
+    n_shards = max(1, min(n_shards, len(records)))
+    bounds = [len(records) * ishard // n_shards for ishard in range(n_shards + 1)]
+    shards = []
+    for ishard in range(n_shards):
+        shard_fname = "shard_%03d.ndjson" % ishard
+        with open(path.join(dirname, shard_fname), "w") as outf:
+            for record in records[bounds[ishard]:bounds[ishard + 1]]:
+                outf.write(_dumps(record))
+                outf.write("\n")
+        shards.append({"file": shard_fname, "n_records": bounds[ishard + 1] - bounds[ishard]})
+
+    with open(manifest_fname, "w") as outf:
+        json.dump({"n_records": len(records), "shards": shards}, outf, indent=4)
+
+
+def read_shard(shard_fname):
+    '''
+    list of records in one ndjson shard.
+    '''
+    with open(shard_fname, "rb") as infile:
+        if orjson is not None:
+            return [orjson.loads(line) for line in infile if line.strip()]
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+def read(fname):
+    '''
+    records of the cache fname, from its shards if any, else from fname itself.
+    '''
+    if not is_sharded(fname):
+        with open(fname, "rb") as infile:
+            if orjson is not None:
+                return orjson.loads(infile.read())
+            return json.load(infile)
+
+    records = []
+    for shard_fname in shard_files(fname):
+        records.extend(read_shard(shard_fname))
+    return records
+
+
+def migrate(fname, n_shards=N_SHARDS):
+    '''
+    shard the single json file fname, which is left in place (read() uses the shards from then on).
+    '''
+    with open(fname, "rb") as infile:
+        records = orjson.loads(infile.read()) if orjson is not None else json.load(infile)
+    write(records, fname, n_shards)
+    return len(records)
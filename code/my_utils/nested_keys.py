@@ -21,6 +21,8 @@ let's study the keys and values for this
 
 '''
 
+from functools import lru_cache
+
 
 def nested_keys(parent0, depth_max=-1):
     '''
@@ -57,31 +59,42 @@ def get_field_by_nested_key(parent0, keystr):
     and keystr = b2.d2
     returns [4,5]
     '''
-    keys = keystr.split(".")
-    values = []
-    get_field_by_nested_key_routine(parent0, keys, values)
-    return values
+    return compile_nested_key(keystr)(parent0)
 
 
-def get_field_by_nested_key_routine(parent, keys, values):
-    '''function to be called recursively for get_field_by_nested_key '''
-    
-    if len(keys) == 0:
-        return
-    if isinstance(parent, list):
-        for val in parent:
-            get_field_by_nested_key_routine(val, keys, values)
-    else:
-        remainingkeys = keys.copy()
-        curkey = remainingkeys.pop(0)
-        val = parent.get(curkey, None)
-        if isinstance(val, dict):
-            get_field_by_nested_key_routine(val, remainingkeys, values)
-        elif isinstance(val, list):
-            if (not isinstance(val[0], (list, dict))) and len(remainingkeys)==0:
-                values.extend(val)
-            else:
-                get_field_by_nested_key_routine(val, remainingkeys, values)
+@lru_cache(maxsize=None)
+def compile_nested_key(keystr):
+    '''
+    keystr is split once, and a function equivalent to
+    get_field_by_nested_key(parent, keystr) is returned.
+    compiled functions are cached per keystr.
+    '''
+    keys = tuple(keystr.split("."))
+    nkeys = len(keys)
+
+    def routine(parent, ikey, values):
+        '''function to be called recursively, ikey is the position in keys'''
+        if ikey == nkeys:
+            return
+        if isinstance(parent, list):
+            for val in parent:
+                routine(val, ikey, values)
         else:
-            if val is not None:
-                values.append(val)
+            val = parent.get(keys[ikey], None)
+            if isinstance(val, dict):
+                routine(val, ikey+1, values)
+            elif isinstance(val, list):
+                if len(val) > 0 and (not isinstance(val[0], (list, dict))) and ikey+1 == nkeys:
+                    values.extend(val)
+                else:
+                    routine(val, ikey+1, values)
+            else:
+                if val is not None:
+                    values.append(val)
+
+    def get_field(parent0):
+        values = []
+        routine(parent0, 0, values)
+        return values
+
+    return get_field
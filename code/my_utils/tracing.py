@@ -0,0 +1,204 @@
+'''
+spans around pipeline stages, exported as a chrome trace (chrome://tracing, perfetto).
+
+    with tracing.span("json_load", fname=fname) as sp:
+        variants = json.load(infile)
+        sp.set(n_items=len(variants))
+
+    @tracing.traced(count=len)
+    def load_variants(...):
+
+Each span records its duration, the change of the process RSS, and any args set on it.
+Tracing is off by default: span() then returns a shared no-op object and traced functions
+are called directly, so instrumented code pays one dict lookup per call.
+Turn it on with enable(), or by setting QC_TRACE=<trace.json> in the environment,
+which also writes the trace at exit.
+'''
+
+from contextlib import contextmanager
+import atexit
+import functools
+import json
+import os
+import resource
+import threading
+import time
+
+import pandas as pd
+
+
+MAX_EVENTS = 1000000
+
+_TRACE = {"enabled": False, "events": [], "totals": {}, "t0": time.perf_counter()}
+_LOCAL = threading.local()
+
+
+def rss_mb():
+    '''
+    current resident set size in MB (peak RSS where /proc is not available).
+    '''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def enable():
+    _TRACE["enabled"] = True
+
+
+def disable():
+    _TRACE["enabled"] = False
+
+
+def is_enabled():
+    return _TRACE["enabled"]
+
+
+def reset():
+    '''
+    drop all recorded spans.
+    '''
+    _TRACE["events"] = []
+    _TRACE["totals"] = {}
+    _TRACE["t0"] = time.perf_counter()
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    '''
+    an active span; set(**args) attaches item counts or anything else to its event.
+    '''
+
+    def __init__(self, name, category, args, memory):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.memory = memory
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.depth = getattr(_LOCAL, "depth", 0)
+        _LOCAL.depth = self.depth + 1
+        self.rss_start = rss_mb() if self.memory else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _LOCAL.depth = self.depth
+        duration = end - self.start
+        if self.memory:
+            self.args["rss_delta_mb"] = round(rss_mb() - self.rss_start, 3)
+        if exc_info[0] is not None:
+            self.args["error"] = exc_info[0].__name__
+        _record(self.name, self.category, self.start, duration, self.depth, self.args)
+        return False
+
+
+def _record(name, category, start, duration, depth, args):
+    totals = _TRACE["totals"].setdefault(name, {"calls": 0, "total_s": 0., "depth": depth})
+    totals["calls"] += 1
+    totals["total_s"] += duration
+    totals["depth"] = min(totals["depth"], depth)
+    if len(_TRACE["events"]) >= MAX_EVENTS:
+        return
+    _TRACE["events"].append({
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": (start - _TRACE["t0"]) * 1e6,
+        "dur": duration * 1e6,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args
+    })
+
+
+def span(name, category="qc", memory=True, **args):
+    '''
+    context manager timing the enclosed block as one span named name.
+    '''
+    if not _TRACE["enabled"]:
+        return _NO_SPAN
+    return _Span(name, category, args, memory)
+
+
+def traced(name=None, category="qc", count=None, memory=True):
+    '''
+    decorator: every call of the function is a span.
+    count(result) -> number of items, recorded as n_items.
+    memory=False skips the RSS reads, for functions called once per item.
+    '''
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _TRACE["enabled"]:
+                return function(*args, **kwargs)
+            with _Span(span_name, category, {}, memory) as active:
+                result = function(*args, **kwargs)
+                if count is not None:
+                    active.set(n_items=count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def tracing_enabled():
+    '''
+    enable tracing for the enclosed block only.
+    '''
+    was_enabled = _TRACE["enabled"]
+    enable()
+    try:
+        yield
+    finally:
+        _TRACE["enabled"] = was_enabled
+
+
+def events():
+    return list(_TRACE["events"])
+
+
+def summary():
+    '''
+    data frame with calls and total seconds per span name, including spans past MAX_EVENTS.
+    '''
+    table = pd.DataFrame.from_dict(_TRACE["totals"], orient="index",
+                                   columns=["calls", "total_s", "depth"])
+    table.index.name = "span"
+    table["mean_s"] = table["total_s"] / table["calls"]
+    return table.sort_values("total_s", ascending=False)
+
+
+def export_chrome_trace(fname):
+    '''
+    write the recorded spans as a chrome trace event json file.
+    '''
+    print("writing %s" % fname)
+    with open(fname, "w") as outf:
+        json.dump({"traceEvents": _TRACE["events"], "displayTimeUnit": "ms"}, outf, default=str)
+
+
+if os.environ.get("QC_TRACE"):
+    enable()
+    atexit.register(export_chrome_trace, os.environ["QC_TRACE"])